@@ -0,0 +1,247 @@
+"""Execute the analysis and data notebooks headless and time every cell.
+
+Each notebook runs in a fresh Jupyter kernel on a scratch copy of `source/`,
+so the outputs and translated models it writes never touch the repo. For
+every cell the runner records its wall time and the kernel's peak resident
+memory during the cell (Linux: the peak is reset before each cell through
+/proc/self/clear_refs).
+
+* `--scale` shrinks the notebooks' big loops (ensemble sizes, MCMC
+  iterations, sample counts; see SCALE_RULES) so a full pass stays short.
+* Cells that call dead network APIs (tweepy, the Census API) get the local
+  fixtures of `notebook_fixtures.py`; shell escapes (`!pip ...`) are skipped.
+* Every run is appended to a history file, and the table compares each
+  notebook's time with its previous run at the same scale.
+
+Usage:
+    python benchmarks/notebook_benchmark.py [--notebooks analyses/fitting/MCMC_for_fitting_models.ipynb ...]
+        [--scale 0.1] [--timeout 600] [--history .cache/notebook_benchmark.jsonl] [--json]
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_root = Path(__file__).parent.parent.resolve()
+_source = _root / "source"
+_benchmarks = Path(__file__).parent.resolve()
+
+DEFAULT_HISTORY = _root / ".cache" / "notebook_benchmark.jsonl"
+
+
+def _scale_numbers(pattern: str):
+    """A rule scaling every integer captured by `pattern`'s groups."""
+    def apply(source: str, scale: float) -> str:
+        def replace(match):
+            text, last = [], match.start()
+            for group in range(1, (match.re.groups or 0) + 1):
+                text += [source[last:match.start(group)], str(max(1, round(int(match.group(group)) * scale)))]
+                last = match.end(group)
+            return "".join(text) + source[last:match.end()]
+        return re.sub(pattern, replace, source)
+    return apply
+
+
+def _scale_rows(frame: str):
+    """A rule running `<frame>.apply(` on only the first `scale` fraction of the frame's rows."""
+    def apply(source: str, scale: float) -> str:
+        if scale >= 1:
+            return source
+        return source.replace(f"{frame}.apply(", f"{frame}.head(max(1, round(len({frame}) * {scale!r}))).apply(")
+    return apply
+
+
+# The loops that make a notebook slow, by notebook (relative to source/).
+SCALE_RULES = {
+    "analyses/fitting/MCMC_for_fitting_models.ipynb": [_scale_numbers(r"mcmc\.sample\((\d+),\s*(\d+)\)")],
+    "analyses/fitting/Penny_Jar.ipynb": [_scale_numbers(r"mcmc\.sample\((\d+)")],
+    "analyses/fitting/Massively_Parallel_Fitting.ipynb": [_scale_rows("data")],
+    "analyses/sensitivity/Latin_Hypercube_Sampling.ipynb": [_scale_numbers(r"samples=(\d+)")],
+    "analyses/testing/testing_behavior.ipynb": [_scale_numbers(r"samples=(\d+)")],
+    "analyses/visualization/plotting_suite_of_simulations.ipynb": [_scale_numbers(r"n_runs = (\d+)")],
+    "analyses/visualization/marginal_density_plot.ipynb": [_scale_numbers(r"n_runs = (\d+)")],
+    "analyses/visualization/marginal_density_plot_interactive.ipynb": [_scale_numbers(r"n_runs = (\d+)")],
+    "analyses/wrapper_EMAWorkbench/Minimal_Example_PySD_with_EMA.ipynb": [_scale_numbers(r"nr_experiments = (\d+)")],
+    "analyses/design_policy/PySD_EMA_Connector_Demo.ipynb": [_scale_numbers(r"cases=(\d+)")],
+    "analyses/data_handling/Writing_to_Database.ipynb": [_scale_numbers(r"np\.random\.normal\(\d+, \d+, (\d+)\)")],
+    "analyses/realtime/Twitter_Stream.ipynb": [_scale_numbers(r"seconds=60\*(\d+)")],
+    "data/Defects_Synthetic/Manufacturing_Defects_Synthetic.ipynb": [_scale_numbers(r"numpoints = (\d+)")],
+}
+
+# Runs before the first cell: no GUI backend, and the network fixtures.
+_SETUP = """
+import os, sys
+os.environ["MPLBACKEND"] = "Agg"
+sys.path.insert(0, {fixtures!r})
+import notebook_fixtures
+notebook_fixtures.install()
+"""
+
+# Wrap each cell: reset the peak RSS and start the clock, then report both.
+_BEFORE = """
+import time as __bench_time
+try:
+    with open("/proc/self/clear_refs", "w") as __bench_f:
+        __bench_f.write("5")
+except OSError:
+    pass
+__bench_start = __bench_time.perf_counter()
+"""
+_AFTER = """
+__bench_seconds = __bench_time.perf_counter() - __bench_start
+__bench_peak = 0
+try:
+    with open("/proc/self/status") as __bench_f:
+        __bench_peak = next(int(l.split()[1]) for l in __bench_f if l.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    import resource
+    __bench_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print({marker!r} + repr((__bench_seconds, __bench_peak)))
+"""
+_MARKER = "__notebook_benchmark__"
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def find_notebooks():
+    notebooks = glob.glob('analyses/*/*.ipynb', root_dir=_source)
+    notebooks += glob.glob('data/*/*.ipynb', root_dir=_source)
+    # Workbooks have blanks to fill in, so they cannot run.
+    return sorted(nbf for nbf in notebooks if '_Workbook' not in nbf)
+
+
+def prepare_source(source: str, rules, scale: float) -> str:
+    for rule in rules:
+        source = rule(source, scale)
+    # Shell escapes would install packages or call git.
+    return "\n".join("# (skipped) " + line if line.lstrip().startswith(("!", "%pip", "%conda")) else line
+                     for line in source.splitlines())
+
+
+def _run_hidden(client, code: str, index: int):
+    """Run code that is not part of the notebook, returning its cell with the outputs."""
+    import nbformat
+
+    cell = nbformat.v4.new_code_cell(code)
+    client.execute_cell(cell, index, store_history=False)
+    return cell
+
+
+def run_notebook(notebook: str, workdir: Path, scale: float, timeout: int) -> dict:
+    """Execute one notebook (relative to source/) in `workdir`, a copy of source/."""
+    import nbformat
+    from nbclient import NotebookClient
+    from nbclient.exceptions import CellExecutionError, CellTimeoutError, DeadKernelError
+
+    path = workdir / notebook
+    nb = nbformat.read(str(path), as_version=4)
+    rules = SCALE_RULES.get(notebook, [])
+    client = NotebookClient(nb, timeout=timeout, kernel_name="python3",
+                            resources={"metadata": {"path": str(path.parent)}})
+    cells, status, error = [], "ok", None
+    start = time.perf_counter()
+    try:
+        with client.setup_kernel():
+            _run_hidden(client, _SETUP.format(fixtures=str(_benchmarks)), -1)
+            for index, cell in enumerate(nb.cells):
+                if cell.cell_type != "code" or not cell.source.strip():
+                    continue
+                cell.source = prepare_source(cell.source, rules, scale)
+                _run_hidden(client, _BEFORE, index)
+                cell_error = None
+                try:
+                    client.execute_cell(cell, index)
+                except CellExecutionError as e:
+                    # Keep going: some notebooks raise on purpose, and later cells are still worth timing.
+                    cell_error = _ANSI_RE.sub("", str(e)).strip().splitlines()[-1]
+                    if error is None:
+                        status, error = "error", f"cell {index}: {cell_error}"
+                probe = _run_hidden(client, _AFTER.format(marker=_MARKER), index)
+                seconds, peak_kb = next(ast.literal_eval(line[len(_MARKER):])
+                                        for output in probe.outputs if output.get("name") == "stdout"
+                                        for line in output.text.splitlines() if line.startswith(_MARKER))
+                cells.append({"index": index, "seconds": seconds, "peak_rss_mb": peak_kb / 1024,
+                              "source": cell.source.strip().splitlines()[0][:60], "error": cell_error})
+    except (CellTimeoutError, DeadKernelError, RuntimeError) as e:
+        status, error = "failed", f"{type(e).__name__}: {e}".splitlines()[0]
+    return {
+        "notebook": notebook,
+        "status": status,
+        "error": error,
+        "seconds": time.perf_counter() - start,
+        "cell_seconds": sum(c["seconds"] for c in cells),
+        "peak_rss_mb": max((c["peak_rss_mb"] for c in cells), default=0.0),
+        "cells": cells,
+    }
+
+
+def load_history(path: Path) -> list:
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def git_commit() -> str:
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_root, capture_output=True, text=True)
+    return proc.stdout.strip() or "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notebooks", nargs="*", help="Notebooks relative to source/ (default: all).")
+    parser.add_argument("--scale", type=float, default=1.0, help="Factor for the notebooks' big loops.")
+    parser.add_argument("--timeout", type=int, default=600, help="Seconds one cell may take.")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY, help="Timing history (JSON lines).")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table.")
+    args = parser.parse_args()
+    # Kernels inherit it, so `%pylab` and plots never look for a display.
+    os.environ["MPLBACKEND"] = "Agg"
+
+    notebooks = args.notebooks or find_notebooks()
+    missing = [nb for nb in notebooks if not (_source / nb).is_file()]
+    if missing:
+        parser.error(f"no such notebooks under source/: {missing}")
+    previous = {}
+    for run in load_history(args.history):
+        if run["scale"] == args.scale:
+            previous.update({r["notebook"]: r for r in run["results"] if r["status"] == "ok"})
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp) / "source"
+        shutil.copytree(_source, workdir)
+        for notebook in notebooks:
+            results.append(run_notebook(notebook, workdir, args.scale, args.timeout))
+            print(f"{notebook}: {results[-1]['status']} in {results[-1]['seconds']:.1f}s", file=sys.stderr)
+
+    args.history.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.history, "a") as f:
+        f.write(json.dumps({"time": time.time(), "commit": git_commit(), "scale": args.scale,
+                            "results": results}) + "\n")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'notebook':<62} {'status':<7} {'seconds':>8} {'change':>8} {'peak MB':>8}  slowest cell")
+    for r in sorted(results, key=lambda r: -r["cell_seconds"]):
+        before = previous.get(r["notebook"])
+        change = f"{r['cell_seconds'] / before['cell_seconds'] - 1:+.0%}" if before and before["cell_seconds"] else ""
+        slowest = max(r["cells"], key=lambda c: c["seconds"], default=None)
+        slowest = f"[{slowest['index']}] {slowest['seconds']:.2f}s {slowest['source']}" if slowest else ""
+        print(f"{r['notebook']:<62} {r['status']:<7} {r['cell_seconds']:>8.2f} {change:>8} "
+              f"{r['peak_rss_mb']:>8.0f}  {slowest}")
+        if r["error"]:
+            print(f"{'':<62} {r['error'][:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Local stand-ins for the network services some notebooks use, for `notebook_benchmark.py`.
+
+`install()` runs in the notebook's kernel before its first cell:
+
+* `pd.read_json` on an api.census.gov URL returns synthetic data in the
+  Census API's format (a header row, then one row of string counts per
+  county), deterministic for each field;
+* `tweepy` and `_twitter_credentials` are replaced by fakes whose stream
+  replays a fixed number of generated tweets to the listener.
+"""
+import json
+import sys
+import types
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+N_COUNTIES = 60
+N_TWEETS = 200
+
+
+def census_response(url: str, typ: str = "frame"):
+    import numpy as np
+    import pandas as pd
+
+    parsed = urlparse(url)
+    if "/variables/" in parsed.path:
+        name = parsed.path.rsplit("/", 1)[-1].split(".")[0]
+        return pd.Series({"name": name, "label": f"Fixture variable {name}", "concept": "Fixture",
+                          "predicateType": "int"})
+    fields = parse_qs(parsed.query)["get"][0].split(",")
+    counties = [(f"{1 + i // 20:02d}", f"{1 + 2 * (i % 20):03d}") for i in range(N_COUNTIES)]
+    columns = []
+    for field in fields:
+        rng = np.random.default_rng(zlib.crc32(f"{parsed.path}:{field}".encode()))
+        columns.append(rng.integers(0, 50000, N_COUNTIES))
+    rows = [[str(column[i]) for column in columns] + list(county) for i, county in enumerate(counties)]
+    return pd.DataFrame([fields + ["state", "county"]] + rows)
+
+
+def _fake_tweepy() -> types.ModuleType:
+    tweepy = types.ModuleType("tweepy")
+
+    class StreamListener:
+        def __init__(self, api=None):
+            self.api = api
+
+        def on_data(self, data):
+            return True
+
+        def on_error(self, status):
+            return False
+
+    class OAuthHandler:
+        def __init__(self, consumer_key, consumer_secret):
+            self.consumer_key, self.consumer_secret = consumer_key, consumer_secret
+
+        def set_access_token(self, key, secret):
+            self.access_token, self.access_token_secret = key, secret
+
+    class Stream:
+        def __init__(self, auth, listener, **kwargs):
+            self.auth, self.listener = auth, listener
+
+        def filter(self, track=None, **kwargs):
+            words = track or ["fixture"]
+            for i in range(N_TWEETS):
+                tweet = {"user": {"screen_name": f"user{i % 17}"}, "text": f"#{words[i % len(words)]} tweet {i}"}
+                if self.listener.on_data(json.dumps(tweet)) is False:
+                    return
+
+    tweepy.StreamListener, tweepy.OAuthHandler, tweepy.Stream = StreamListener, OAuthHandler, Stream
+    return tweepy
+
+
+def install() -> None:
+    import pandas as pd
+
+    read_json = pd.read_json
+
+    def read_json_with_fixtures(path_or_buf, *args, **kwargs):
+        if isinstance(path_or_buf, str) and "api.census.gov" in path_or_buf:
+            return census_response(path_or_buf, kwargs.get("typ", "frame"))
+        return read_json(path_or_buf, *args, **kwargs)
+
+    pd.read_json = read_json_with_fixtures
+    sys.modules["tweepy"] = _fake_tweepy()
+    credentials = types.ModuleType("_twitter_credentials")
+    credentials.consumer_key = credentials.consumer_secret = "fixture"
+    credentials.access_token = credentials.access_token_secret = "fixture"
+    sys.modules["_twitter_credentials"] = credentials
@@ -0,0 +1,128 @@
+"""Compare integration solvers on the bundled models: error vs. wall time.
+
+For every model, a reference solution is computed with DOP853 at very tight
+tolerances. Each solver is then run and scored by its largest error on any
+stock at the return timestamps, relative to that stock's range in the
+reference, together with its wall time and number of derivative evaluations.
+
+Models are copied to a temporary directory first, since translating a model
+writes a `.py` file next to it.
+
+Usage:
+    python benchmarks/solver_benchmark.py [--models Teacup/Teacup.mdl ...] [--points 200]
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import shutil
+import sys
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+_root = Path(__file__).parent.parent.resolve()
+_package = _root / "scientist-agent"
+_models = _root / "source" / "models"
+
+DEFAULT_MODELS = [
+    "Teacup/Teacup.mdl",
+    "Epidemic/SIR.mdl",
+    "Predator_Prey/Predator_Prey.mdl",
+    "Pendulum/Single_Pendulum.mdl",
+    "Roessler_Chaos/roessler_chaos.mdl",
+    "Aging_Chain/Aging_Chain.mdl",
+]
+
+# (label, solver, options); "dt/4" runs use a quarter of the model's TIME STEP.
+RUNS = [
+    ("euler", "euler", {}),
+    ("euler dt/4", "euler", {"time_step_factor": 0.25}),
+    ("rk4", "rk4", {}),
+    ("RK45", "RK45", {}),
+    ("DOP853", "DOP853", {}),
+    ("LSODA", "LSODA", {}),
+    ("Radau", "Radau", {}),
+]
+
+
+def load_integrators():
+    spec = importlib.util.spec_from_file_location(
+        "scientist_agent", _package / "__init__.py", submodule_search_locations=[str(_package)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["scientist_agent"] = package
+    return importlib.import_module("scientist_agent.integrators"), importlib.import_module("scientist_agent.simulation")
+
+
+def benchmark_model(path: str, points: int, integrators, simulation) -> list:
+    model = simulation.load_model(path)
+    simulation.initialize(model)
+    t0, t_end, dt = model.time(), model.time.final_time(), model.time.time_step()
+    stocks = [name for name in simulation.state_labels(model) if "[" not in name and not name.startswith("_")]
+    # Timestamps on the TIME STEP grid, so Euler runs return them without interpolation.
+    n_steps = int(round((t_end - t0) / dt))
+    timestamps = t0 + dt * np.unique(np.linspace(0, n_steps, points).round())
+
+    reference = integrators.integrate(model, "DOP853", return_columns=stocks, return_timestamps=timestamps,
+                                      rtol=1e-11, atol=1e-12)
+    scale = np.ptp(reference.values, axis=0)
+    scale[scale == 0] = 1.0
+
+    results = []
+    for label, solver, options in RUNS:
+        # Always passed: the model keeps the TIME STEP of the previous run otherwise.
+        time_step = dt * options.get("time_step_factor", 1.0)
+        try:
+            run = integrators.integrate(model, solver, return_columns=stocks, return_timestamps=timestamps,
+                                        time_step=time_step)
+        except Exception as e:
+            results.append({"model": Path(path).name, "solver": label, "error": str(e)})
+            continue
+        values = np.asarray(run[stocks].values, dtype=float)
+        relative_error = float(np.max(np.abs(values - reference.values) / scale))
+        results.append({
+            "model": Path(path).name,
+            "solver": label,
+            "max_relative_error": relative_error,
+            "seconds": run.attrs["seconds"],
+            # Euler evaluates the derivatives once per step.
+            "evaluations": run.attrs["evaluations"] or int(round((t_end - t0) / time_step)),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="*", default=DEFAULT_MODELS,
+                        help="Model files relative to source/models.")
+    parser.add_argument("--points", type=int, default=200, help="Number of return timestamps.")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table.")
+    args = parser.parse_args()
+
+    integrators, simulation = load_integrators()
+    warnings.filterwarnings("ignore")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for relative in args.models:
+            source = _models / relative
+            target = Path(workdir) / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(source, target)
+            results += benchmark_model(str(target), args.points, integrators, simulation)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'model':<24} {'solver':<12} {'max rel. error':>15} {'seconds':>9} {'evaluations':>12}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['model']:<24} {r['solver']:<12} failed: {r['error']}")
+        else:
+            print(f"{r['model']:<24} {r['solver']:<12} {r['max_relative_error']:>15.3e} "
+                  f"{r['seconds']:>9.3f} {r['evaluations']:>12}")
+
+
+if __name__ == "__main__":
+    main()
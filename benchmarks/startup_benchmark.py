@@ -0,0 +1,75 @@
+"""Measure cold-start cost of the scientist-agent package.
+
+Each repetition imports the package in a fresh interpreter (as `adk web` does)
+and records the import wall time, how many modules got loaded and which of the
+heavy dependencies were pulled in eagerly.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--repeat 5] [--module agent|tools]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+_root = Path(__file__).parent.parent.resolve()
+_package = _root / "scientist-agent"
+
+HEAVY_MODULES = ["pysd", "pandas", "numpy", "matplotlib", "scipy", "xarray",
+                 "browser_use", "langchain_google_genai", "google.genai"]
+
+_PROBE = """
+import importlib, importlib.util, json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location(
+    "scientist_agent", {init!r}, submodule_search_locations=[{package!r}])
+package = importlib.util.module_from_spec(spec)
+sys.modules["scientist_agent"] = package
+spec.loader.exec_module(package)
+importlib.import_module("scientist_agent.{module}")
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "modules": len(set(sys.modules) - before),
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(module: str) -> dict:
+    code = _PROBE.format(init=str(_package / "__init__.py"), package=str(_package),
+                         module=module, heavy=HEAVY_MODULES)
+    # Background preloading would otherwise race the measurement.
+    env = {**os.environ, "SCIENTIST_AGENT_PRELOAD_DELAY": "-1"}
+    proc = subprocess.run([sys.executable, "-c", code], cwd=_root, capture_output=True,
+                          text=True, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--module", default="agent", choices=["agent", "tools"])
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    seconds = [r["seconds"] for r in runs]
+    print(json.dumps({
+        "module": args.module,
+        "repeat": args.repeat,
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "max_seconds": max(seconds),
+        "modules_imported": runs[-1]["modules"],
+        "heavy_modules_loaded": runs[-1]["heavy"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,159 @@
+"""Convert the analysis and data notebooks to .rst pages under docs/.
+
+The build is incremental: each notebook's content hash is recorded in
+`.cache/build_rst.json`, and only notebooks that changed (or whose pages are
+missing) are converted again. Changed notebooks are converted in parallel
+with nbconvert's Python API, and every page, extracted figure and extra
+figure is written only if its content differs from what is already there.
+
+Usage:
+    python build_rst.py [--jobs 4] [--force]
+"""
+import argparse
 import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import subprocess
-import shutil
 
 _root = Path(__file__).parent.resolve()
 _docs = _root / "docs"
+_cache = _root / ".cache" / "build_rst.json"
+
+
+def find_notebooks():
+    notebooks = glob.glob('source/analyses/*/*.ipynb', root_dir=_root)
+    notebooks += glob.glob('source/data/*/*.ipynb', root_dir=_root)
+    # Remove 'workbook' files
+    return sorted(Path(nbf) for nbf in notebooks if '_Workbook' not in nbf)
+
+
+def find_figures():
+    figures = glob.glob('source/analyses/*/*.png', root_dir=_root)
+    figures += glob.glob('source/data/*/*.png', root_dir=_root)
+    return sorted(Path(file) for file in figures)
+
+
+def destination(infile):
+    # pretty dependent on directory structure: source/<section>/<topic>/ -> docs/<section>/<topic>/
+    return _docs / Path(*infile.parent.parts[1:])
+
+
+def write_if_changed(path, data):
+    """Write `data` (bytes) to `path` unless it already holds exactly that. Returns whether it wrote."""
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
+
+
+_exporter = None
+
+
+def convert(infile):
+    """Convert one notebook to its .rst page and `<name>_files` figures, like `jupyter nbconvert --to rst`.
+
+    Returns:
+        The paths written for the notebook (relative to docs/), and how many of them changed.
+    """
+    global _exporter
+    import nbformat
+    from nbconvert import RSTExporter
+
+    if _exporter is None:
+        _exporter = RSTExporter()
+    path = _root / infile
+    name = infile.stem
+    files = name + '_files'
+    resources = {
+        "metadata": {"name": name, "path": str(path.parent)},
+        "unique_key": name,
+        "output_files_dir": files,
+    }
+    notebook = nbformat.read(str(path), as_version=4)
+    body, resources = _exporter.from_notebook_node(notebook, resources=resources)
+
+    dest = destination(infile)
+    outputs = {dest / (name + resources.get("output_extension", ".rst")): body.encode("utf-8")}
+    # Extracted figures, keyed by their path relative to the page: "<name>_files/<name>_3_0.png".
+    outputs.update({dest / filename: data for filename, data in resources.get("outputs", {}).items()})
+    changed = sum(write_if_changed(target, data) for target, data in outputs.items())
+
+    # Figures of outputs that no longer exist.
+    stale_dir = dest / files
+    if stale_dir.exists():
+        for stale in set(stale_dir.iterdir()) - set(outputs):
+            if stale.is_file():
+                stale.unlink()
+    return [str(target.relative_to(_docs)) for target in outputs], changed
+
+
+def notebook_hash(infile):
+    return hashlib.sha256((_root / infile).read_bytes()).hexdigest()
+
+
+def load_cache():
+    try:
+        with open(_cache) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    _cache.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _cache.with_name(_cache.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, _cache)
+
+
+def build(jobs=None, force=False):
+    cache = {} if force else load_cache()
+    notebooks = find_notebooks()
+    hashes = {str(infile): notebook_hash(infile) for infile in notebooks}
+    todo = [infile for infile in notebooks
+            if cache.get(str(infile), {}).get("hash") != hashes[str(infile)]
+            or not all((_docs / written).exists() for written in cache[str(infile)]["written"])]
+    print(f"{len(todo)} of {len(notebooks)} notebooks changed")
+
+    failed = []
+    if todo:
+        jobs = min(jobs or os.cpu_count() or 1, len(todo))
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = {infile: pool.submit(convert, infile) for infile in todo}
+            for infile, future in futures.items():
+                try:
+                    written, changed = future.result()
+                except Exception as e:
+                    print(f"failed to convert {infile}: {type(e).__name__}: {e}")
+                    failed.append(infile)
+                    cache.pop(str(infile), None)
+                    continue
+                print(f"converted {infile} ({changed} of {len(written)} files changed)")
+                cache[str(infile)] = {"hash": hashes[str(infile)], "written": written}
+    # Forget notebooks that were removed.
+    cache = {key: value for key, value in cache.items() if key in hashes}
+    save_cache(cache)
+
+    copied = 0
+    for infile in find_figures():
+        # Copy extra figures
+        copied += write_if_changed(_docs / Path(*infile.parts[1:]), (_root / infile).read_bytes())
+    print(f"copied {copied} changed figures")
+    return failed
+
 
-notebooks = glob.glob('source/analyses/*/*.ipynb')
-notebooks += glob.glob('source/data/*/*.ipynb')
-# Remove 'workbook' files
-notebooks = [Path(nbf) for nbf in notebooks if '_Workbook' not in nbf]
-figures = glob.glob('source/analyses/*/*.png')
-figures += glob.glob('source/data/*/*.png')
-figures = [Path(file) for file in figures]
-
-for infile in notebooks:
-    # convert notebook in its local directory
-    path = _root / infile.parent
-    nbfile = infile.name
-    rstfile = infile.with_suffix(".rst").name
-    files = infile.with_suffix("").name + '_files'
-    call_str = "jupyter nbconvert --to rst %(nbfile)s" % {'nbfile': nbfile}
-    subprocess.call(call_str, cwd=path, shell=True)
-
-    # move the .rst file
-    movefiles = path / rstfile
-    # pretty dependent on directory structure
-    dest = _docs / Path(*infile.parent.parts[1:])
-    # ! mv $movefiles $dest
-
-    if not dest.exists():
-        dest.mkdir()
-
-    shutil.move(movefiles, dest / rstfile)
-
-    # move supporting files, if there are any
-    movedir = path / files
-    if movedir.exists():
-        destdir = dest / files
-        if destdir.exists():
-            # !rm - r $destdir
-            shutil.rmtree(destdir)
-        # !mv $movedir $dest
-        shutil.move(str(movedir), str(dest))
-
-for infile in figures:
-    # Copy extra figures
-    dest = _docs / Path(*infile.parts[1:])
-    shutil.copy(infile, dest)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the notebooks to .rst pages under docs/.")
+    parser.add_argument("--jobs", type=int, default=None, help="Notebooks converted in parallel (default: one per CPU).")
+    parser.add_argument("--force", action="store_true", help="Convert every notebook, ignoring the cache.")
+    args = parser.parse_args()
+    raise SystemExit(1 if build(args.jobs, args.force) else 0)
@@ -4,8 +4,9 @@ from google.adk.models.lite_llm import LiteLlm
 from google.adk.agents.llm_agent import Agent
 from google.adk.tools import load_artifacts
 
-from .tools import list_models, read_text_file, write_text_file, execute_python_code_snippet, read_png_file, execute_shell_command, browse
+from .tools import list_models, describe_model, find_model_variables, search_model_equations, get_variable_dependencies, what_if, design_discriminating_experiment, find_robust_policy, sensitivity_analysis, find_steady_state, fork_simulation, submit_simulation_job, get_job_status, get_job_result, cancel_job, read_text_file, preview_csv_file, write_text_file, execute_python_code_snippet, read_png_file, execute_shell_command, browse, preload_in_background
 from .pysd_prompt import pysd_expert_instruction
+from .profiling import instrument_tools
 
 
 # from .base_prompt import base_instruction
@@ -23,12 +24,30 @@ root_agent = Agent(
     model=LiteLlm(model="ollama_chat/phi4:latest"),
     name="pysd_expert_agent",
     instruction=pysd_expert_instruction(),
-    tools=[
+    tools=instrument_tools([
         list_models,
+        describe_model,
+        find_model_variables,
+        search_model_equations,
+        get_variable_dependencies,
+        what_if,
+        design_discriminating_experiment,
+        find_robust_policy,
+        sensitivity_analysis,
+        find_steady_state,
+        fork_simulation,
+        submit_simulation_job,
+        get_job_status,
+        get_job_result,
+        cancel_job,
         execute_python_code_snippet,
         read_png_file,
         read_text_file,
+        preview_csv_file,
         write_text_file,
         load_artifacts,
-    ]
-)
\ No newline at end of file
+    ])
+)
+
+# Heavy libraries are imported lazily; warm them up once the server is up.
+preload_in_background()
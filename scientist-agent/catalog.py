@@ -0,0 +1,192 @@
+"""An index of the models under `source/models`.
+
+Every .mdl/.xmile file is parsed once with `model_parser` and its stocks, flows,
+constants, units, time bounds and comments are kept in memory and persisted to
+`<cache>/model_catalog.json`, so later sessions start from the saved index.
+
+`refresh_catalog` keeps the index current incrementally: it only re-lists
+directories whose mtime changed and only re-parses model files whose mtime or
+size changed, so a refresh costs a few dozen `stat` calls instead of a full
+tree walk and parse.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from .model_parser import MODEL_SUFFIXES, normalize_name, parse_model_file
+from .settings import CACHE_DIRECTORY, MODELS_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = os.path.join(CACHE_DIRECTORY, "model_catalog.json")
+_CATALOG_VERSION = 1
+
+_lock = threading.RLock()
+_models: Dict[str, Dict[str, Any]] = {}
+_directories: Dict[str, int] = {}
+_loaded = False
+
+
+def _is_model_file(name: str) -> bool:
+    return name.lower().endswith(MODEL_SUFFIXES)
+
+
+def _load() -> None:
+    global _loaded
+    _loaded = True
+    try:
+        with open(CATALOG_PATH) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    if saved.get("version") == _CATALOG_VERSION:
+        _models.update(saved["models"])
+        _directories.update(saved["directories"])
+
+
+def _save() -> None:
+    try:
+        os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+        tmp_path = CATALOG_PATH + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": _CATALOG_VERSION, "models": _models, "directories": _directories}, f)
+        os.replace(tmp_path, CATALOG_PATH)
+    except OSError as e:
+        logger.warning(f"Could not persist the model catalog: {e}")
+
+
+def _index_file(path: str, stat: os.stat_result) -> None:
+    try:
+        parsed = parse_model_file(path)
+    except Exception as e:
+        logger.warning(f"Could not index {path}: {e}")
+        parsed = {"format": None, "variables": [], "subscripts": {}, "time": {}, "error": str(e)}
+    _models[path] = {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, **parsed}
+
+
+def _scan_directory(directory: str) -> bool:
+    """(Re)list one directory, indexing new model files and recursing into new subdirectories."""
+    changed = False
+    try:
+        _directories[directory] = os.stat(directory).st_mtime_ns
+        entries = list(os.scandir(directory))
+    except OSError:
+        _directories.pop(directory, None)
+        return True
+    for entry in entries:
+        if entry.is_dir():
+            if entry.path not in _directories:
+                _scan_directory(entry.path)
+                changed = True
+        elif _is_model_file(entry.name) and entry.path not in _models:
+            _index_file(entry.path, entry.stat())
+            changed = True
+    return changed
+
+
+def refresh_catalog(root: str = MODELS_DIRECTORY) -> Dict[str, Dict[str, Any]]:
+    """Bring the catalog up to date with the file system and return it.
+
+    Returns:
+        A dict mapping model paths (e.g. "source/models/Epidemic/SIR.mdl") to their entries.
+    """
+    with _lock:
+        if not _loaded:
+            _load()
+        changed = False
+
+        known_directories = [d for d in _directories if d == root or d.startswith(root + os.sep)]
+        if not known_directories:
+            changed |= _scan_directory(root)
+        for directory in known_directories:
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns != _directories.get(directory):
+                changed |= _scan_directory(directory)
+
+        for path in list(_models):
+            if not path.startswith(root + os.sep):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del _models[path]
+                changed = True
+                continue
+            if (stat.st_mtime_ns, stat.st_size) != (_models[path]["mtime_ns"], _models[path]["size"]):
+                _index_file(path, stat)
+                changed = True
+
+        if changed:
+            _save()
+        return {p: e for p, e in _models.items() if p.startswith(root + os.sep)}
+
+
+def invalidate_model(path: str) -> None:
+    """Re-index `path` right away, e.g. after a tool wrote to it."""
+    path = os.path.normpath(path)
+    if not _is_model_file(path):
+        return
+    with _lock:
+        if not _loaded:
+            _load()
+        try:
+            _index_file(path, os.stat(path))
+        except OSError:
+            _models.pop(path, None)
+        _save()
+
+
+def get_model_entry(path: str) -> Optional[Dict[str, Any]]:
+    """The catalog entry for a single model file, or None if it is not indexed."""
+    return refresh_catalog().get(os.path.normpath(path))
+
+
+def summarize_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """A compact view of a catalog entry: variables grouped by kind, without equations."""
+    summary: Dict[str, Any] = {
+        "path": entry["path"],
+        "format": entry["format"],
+        "time": entry["time"],
+        "subscripts": {name: len(values) for name, values in entry["subscripts"].items()},
+    }
+    for kind in ("stock", "flow", "constant", "auxiliary", "lookup", "data", "undefined"):
+        variables = [v for v in entry["variables"] if v["kind"] == kind]
+        if not variables:
+            continue
+        summary[kind + "s"] = [
+            {key: v[key] for key in ("name", "units", "doc", "value", "initial_value", "inflows", "outflows")
+             if v.get(key) not in (None, "", [])}
+            for v in variables
+        ]
+    return summary
+
+
+def find_variables(name: str, kind: Optional[str] = None, topic: str = "") -> List[Dict[str, Any]]:
+    """Variables whose (normalized) name contains `name`, across all indexed models.
+
+    Args:
+        name: Part of a variable name, matched case-insensitively.
+        kind: Optionally restrict to one kind: stock, flow, constant, auxiliary, lookup, data, undefined.
+        topic: Optionally restrict to models under `source/models/<topic>`.
+    """
+    query = normalize_name(name)
+    root = os.path.normpath(os.path.join(MODELS_DIRECTORY, topic)) if topic else MODELS_DIRECTORY
+    matches = []
+    for path, entry in sorted(refresh_catalog().items()):
+        if not path.startswith(root + os.sep):
+            continue
+        for var in entry["variables"]:
+            if query in normalize_name(var["name"]) and (not kind or var["kind"] == kind):
+                matches.append({
+                    "model": path,
+                    "name": var["name"],
+                    "kind": var["kind"],
+                    "units": var["units"],
+                    "equation": var["equation"],
+                })
+    return matches
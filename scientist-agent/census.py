@@ -0,0 +1,261 @@
+"""Cached, concurrent downloads from the US Census API.
+
+`US_Census_Data_Collection.ipynb` fetches its fields in 40-field chunks with
+one `pd.read_json(url)` after the other, converts whole frames cell by cell
+with `applymap(float)`, and downloads everything again on every run.
+`CensusClient.fetch_fields` instead:
+
+* requests the chunks concurrently, over a small pool of keep-alive
+  connections to the API host;
+* stores every raw response in a content-addressed store
+  (`<cache>/census/raw/<sha256>.json`, with an index from request URL to
+  hash), so a request is only ever sent once;
+* converts the responses column by column to the smallest integer (or float)
+  dtype that holds them, and keeps the joined table as Parquet under
+  `<cache>/census/tables/`, keyed by the hashes of the responses it came from.
+
+Once a table was fetched, reruns need no network and read the Parquet file
+directly; `offline=True` makes a missing response an error instead of a
+download. The API's address comes from `SCIENTIST_AGENT_CENSUS_URL`, so tests
+can point it at a local server; a `CENSUS_API_KEY` is sent when set, but is
+not part of the cache keys.
+"""
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import quote, urlsplit
+
+from .settings import CACHE_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+CENSUS_API = "https://api.census.gov/data"
+CENSUS_DIRECTORY = os.path.join(CACHE_DIRECTORY, "census")
+# The API serves at most 50 variables per request.
+DEFAULT_CHUNK_SIZE = 40
+DEFAULT_WORKERS = 8
+GEOGRAPHY_COLUMNS = ("state", "county", "tract", "place", "us")
+
+
+def default_base_url() -> str:
+    return os.environ.get("SCIENTIST_AGENT_CENSUS_URL", CENSUS_API).rstrip("/")
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, shared by the download threads."""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == "https"
+                                  else http.client.HTTPConnection)
+        self._host = parts.netloc
+        self._timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+
+    def _new_connection(self):
+        return self._connection_class(self._host, timeout=self._timeout)
+
+    def get(self, path: str) -> bytes:
+        try:
+            conn, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._new_connection(), False
+        while True:
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if not reused:
+                    raise
+                # The server closed this kept-alive connection in the meantime; retry on a new one.
+                conn, reused = self._new_connection(), False
+        if response.will_close:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        if response.status != 200:
+            raise OSError(f"The Census API answered {response.status} for {path}: {body[:200]!r}")
+        return body
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class CensusClient:
+    """Fetches Census API tables through a local content-addressed cache."""
+
+    def __init__(self, base_url: Optional[str] = None, directory: str = CENSUS_DIRECTORY,
+                 workers: int = DEFAULT_WORKERS, offline: bool = False, timeout: float = 60.0):
+        self.base_url = (base_url or default_base_url()).rstrip("/")
+        self.directory = directory
+        self.workers = workers
+        self.offline = offline
+        self._path_prefix = urlsplit(self.base_url).path
+        self._pool = _ConnectionPool(self.base_url, timeout)
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        # Requests sent over the network, as opposed to answered from the cache.
+        self.downloads = 0
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "urls.json")
+
+    def _load_index(self) -> Dict[str, str]:
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self) -> None:
+        path = self._index_path()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "raw", f"{digest}.json")
+
+    def _query(self, dataset: str, params: str) -> str:
+        return f"{self._path_prefix}/{dataset.strip('/')}{params}"
+
+    def raw(self, query: str) -> str:
+        """The hash of the stored response to `query` (a path below the API's address), downloading it if needed."""
+        key = f"{self.base_url}{query[len(self._path_prefix):]}"
+        with self._lock:
+            digest = self._index.get(key)
+        if digest is not None and os.path.exists(self._blob_path(digest)):
+            return digest
+        if self.offline:
+            raise LookupError(f"{key} is not in the local Census cache and the client is offline.")
+        api_key = os.environ.get("CENSUS_API_KEY")
+        body = self._pool.get(query + (f"&key={quote(api_key)}" if api_key else ""))
+        json.loads(body)
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            with open(f"{path}.{threading.get_ident()}.tmp", "wb") as f:
+                f.write(body)
+            os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+        with self._lock:
+            self._index[key] = digest
+            self.downloads += 1
+            self._save_index()
+        return digest
+
+    def get_json(self, query: str) -> Any:
+        with open(self._blob_path(self.raw(query)), "rb") as f:
+            return json.loads(f.read())
+
+    def variable(self, dataset: str, name: str) -> Dict[str, Any]:
+        """The API's description of variable `name` of `dataset` (e.g. "2010/sf1")."""
+        return self.get_json(self._query(dataset, f"/variables/{quote(name)}.json"))
+
+    def fetch_fields(self, dataset: str, fields: Sequence[str], geography: str = "county:*",
+                     chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """A table of `fields` for every area of `geography`, indexed by the geography columns.
+
+        Args:
+            dataset: The API's dataset path. For eg: "2000/sf1"
+            fields: Variable names. For eg: ["PCT012003", "PCT012004"]
+            geography: The `for` clause of the request.
+            chunk_size: Fields per request.
+
+        Returns:
+            A DataFrame with one column per field, in the order given.
+        """
+        import pandas as pd
+
+        fields = list(fields)
+        chunks = [fields[i:i + chunk_size] for i in range(0, len(fields), chunk_size)]
+        queries = [self._query(dataset, f"?get={','.join(chunk)}&for={quote(geography, safe=':*,')}")
+                   for chunk in chunks]
+        with ThreadPoolExecutor(max(1, min(self.workers, len(queries)))) as pool:
+            digests = list(pool.map(self.raw, queries))
+
+        table_key = hashlib.sha256(json.dumps([fields, digests]).encode()).hexdigest()
+        table_path = os.path.join(self.directory, "tables", f"{table_key}.parquet")
+        if os.path.exists(table_path):
+            try:
+                return pd.read_parquet(table_path)
+            except (ImportError, OSError, ValueError) as e:
+                logger.info(f"Could not read cached table {table_path}: {e}")
+
+        frames = [response_frame(self.get_json(query)) for query in queries]
+        table = pd.concat(frames, axis=1, join="outer")[fields]
+        try:
+            os.makedirs(os.path.dirname(table_path), exist_ok=True)
+            table.to_parquet(table_path + ".tmp", index=True)
+            os.replace(table_path + ".tmp", table_path)
+        except ImportError as e:
+            # No Parquet engine: the raw responses are still cached, only the conversion reruns.
+            logger.warning(f"Not caching the converted table ({e}); install pyarrow, see requirements.txt.")
+        return table
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+def compact_numeric(values):
+    """`values` (strings from the API) as the smallest integer dtype holding them, or float64 if some are not integers."""
+    import numpy as np
+    import pandas as pd
+
+    try:
+        numbers = np.asarray(values, dtype=object).astype(np.int64)
+    except (TypeError, ValueError, OverflowError):
+        return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+    for dtype in (np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if not numbers.size or (numbers.min() >= info.min and numbers.max() <= info.max):
+            return numbers.astype(dtype)
+    return numbers
+
+
+def response_frame(rows: List[List[Any]]):
+    """A Census API response (a header row, then one row per area) as a DataFrame indexed by geography."""
+    import numpy as np
+    import pandas as pd
+
+    header, body = rows[0], np.asarray(rows[1:], dtype=object).reshape(len(rows) - 1, len(rows[0]))
+    geography = [i for i, name in enumerate(header) if name in GEOGRAPHY_COLUMNS]
+    data = {header[i]: compact_numeric(body[:, i]) for i in range(len(header)) if i not in geography}
+    index = pd.MultiIndex.from_arrays([body[:, i].astype(str) for i in geography],
+                                      names=[header[i] for i in geography])
+    return pd.DataFrame(data, index=index)
+
+
+def sum_ranges(table, columns_by_group: Dict[str, Sequence[str]]):
+    """A table with, for each group, the sum of its columns; e.g. single years of age summed into decades."""
+    import pandas as pd
+
+    return pd.DataFrame({group: table[list(columns)].sum(axis=1) for group, columns in columns_by_group.items()},
+                        index=table.index)
+
+
+_client: Optional[CensusClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> CensusClient:
+    """A client shared by all callers, so the cache index and connections are reused."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CensusClient()
+        return _client
@@ -0,0 +1,479 @@
+"""Compile a pysd-translated model into a single flat step function.
+
+A translated module evaluates every variable through a decorated function
+that calls its dependencies, caches its result for the step and, for
+`if_then_else`, allocates two lambdas per call. For small scalar models most
+of the run time is this call overhead, not arithmetic.
+
+`compile_model` reads the translated module's source and generates one
+function that advances the model by an Euler step:
+
+* the components are topologically sorted using the names they reference and
+  each one becomes a local variable, computed exactly once per step;
+* components that do not depend on time or on stocks (constants, initial
+  values, external constants and anything computed only from them) are
+  evaluated once per run, through the model's own functions, so parameter
+  overrides and initial conditions behave as in `model.run`;
+* `if_then_else(c, lambda: a, lambda: b)` becomes `(a if c else b)`;
+* scalar lookup tables are interpolated in plain Python instead of through xarray;
+* subexpressions repeated across components are computed once per step.
+
+Models with subscripts or with stateful elements other than INTEG (delays,
+smooths, trends) cannot be compiled and raise `NotCompilable`; use
+`model.run` for them. Compiled runs follow pysd's own Euler scheme and time
+bookkeeping, so they return the same values as `model.run`.
+"""
+import ast
+import bisect
+import keyword
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from .simulation import initialize, load_model, resolve_py_name
+
+# Statefuls whose value is fixed once the model is initialized.
+CONSTANT_STATEFULS = ("Initial", "ExtConstant")
+CONTROL_COMPONENTS = ("time", "initial_time", "final_time", "time_step", "saveper")
+
+
+class NotCompilable(Exception):
+    """The model uses a construct the compiler does not support."""
+
+
+class _Component:
+    def __init__(self, py_name: str, name: str, expr: ast.expr, takes_arguments: bool,
+                 subscripts: Sequence[str] = ()):
+        self.py_name = py_name
+        self.name = name
+        self.expr = expr
+        self.takes_arguments = takes_arguments
+        self.subscripts = list(subscripts)
+
+
+def _called_names(expr: ast.AST) -> Set[str]:
+    """Names called without arguments in `expr`, i.e. the components and statefuls it reads."""
+    return {node.func.id for node in ast.walk(expr)
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)}
+
+
+def _uses_time(expr: ast.AST) -> bool:
+    """Whether `expr` reads the clock, directly or through `__data["time"]` (step, pulse, ramp...)."""
+    return any(isinstance(node, ast.Name) and node.id in ("time", "__data") for node in ast.walk(expr))
+
+
+def parse_components(path: str, subscripted: bool = False
+                     ) -> Tuple[Dict[str, _Component], Dict[str, Tuple[str, List[Optional[ast.expr]]]]]:
+    """The components of a translated module and its module-level stateful objects.
+
+    Args:
+        path: The translated `.py` file.
+        subscripted: Whether to accept subscripted components; otherwise they raise `NotCompilable`.
+
+    Returns:
+        (components by py_name, {object name: (class name, its arguments' lambda bodies, None for other arguments)}).
+    """
+    source = Path(path).read_text(encoding="utf-8")
+    tree = ast.parse(source)
+    components, objects = {}, {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) \
+                and isinstance(node.value.func, ast.Name):
+            target = node.targets[0]
+            if isinstance(target, ast.Name) and target.id.startswith("_"):
+                objects[target.id] = (node.value.func.id, [a.body if isinstance(a, ast.Lambda) else None
+                                                           for a in node.value.args])
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        decorator = next((d for d in node.decorator_list if isinstance(d, ast.Call)
+                          and ast.get_source_segment(source, d.func) == "component.add"), None)
+        if decorator is None:
+            continue
+        meta = {k.arg: k.value for k in decorator.keywords}
+        name = ast.literal_eval(meta["name"]) if "name" in meta else node.name
+        body = [s for s in node.body if not (isinstance(s, ast.Expr) and isinstance(s.value, ast.Constant))]
+        if "subscripts" in meta and not subscripted:
+            raise NotCompilable(f"{name!r} is subscripted.")
+        if node.name in CONTROL_COMPONENTS:
+            continue
+        if len(body) != 1 or not isinstance(body[0], ast.Return):
+            raise NotCompilable(f"{name!r} is not a single expression.")
+        subscripts = ast.literal_eval(meta["subscripts"]) if "subscripts" in meta else ()
+        components[node.name] = _Component(node.name, name, body[0].value, bool(node.args.args), subscripts)
+    return components, objects
+
+
+class _Flatten(ast.NodeTransformer):
+    """Rewrites a component expression in terms of the step function's variables."""
+
+    def __init__(self, variables: Dict[str, str], lookups: Dict[str, str]):
+        self.variables = variables
+        self.lookups = lookups
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        if isinstance(node.func, ast.Name):
+            if not node.args and not node.keywords:
+                if node.func.id == "time":
+                    return ast.Name("t", ast.Load())
+                if node.func.id in self.variables:
+                    return ast.Name(self.variables[node.func.id], ast.Load())
+            if node.func.id in self.lookups and len(node.args) == 1 and not node.keywords:
+                return ast.Call(ast.Name(self.lookups[node.func.id], ast.Load()), [self.visit(node.args[0])], [])
+            if node.func.id == "if_then_else" and len(node.args) == 3 \
+                    and all(isinstance(a, ast.Lambda) for a in node.args[1:]):
+                return ast.IfExp(test=self.visit(node.args[0]), body=self.visit(node.args[1].body),
+                                 orelse=self.visit(node.args[2].body))
+        return self.generic_visit(node)
+
+
+def _size(node: ast.AST) -> int:
+    return sum(1 for _ in ast.walk(node))
+
+
+class _CommonSubexpressions:
+    """Replaces subexpressions that occur in several statements by temporaries.
+
+    Only subexpressions evaluated unconditionally (outside the branches of
+    conditional expressions) are shared, so no branch guarded by a condition
+    is evaluated when it would not have been.
+    """
+
+    CANDIDATES = (ast.BinOp, ast.Call, ast.Compare, ast.UnaryOp, ast.BoolOp)
+
+    def __init__(self, statements: List[ast.Assign]):
+        counts: Dict[str, int] = {}
+        for statement in statements:
+            for node in self._unconditional(statement.value):
+                if isinstance(node, self.CANDIDATES) and _size(node) > 3:
+                    key = ast.dump(node)
+                    counts[key] = counts.get(key, 0) + 1
+        self.shared = {key for key, count in counts.items() if count > 1}
+        self.names: Dict[str, str] = {}
+        self.pending: List[ast.Assign] = []
+
+    @classmethod
+    def _unconditional(cls, node: ast.AST):
+        yield node
+        if isinstance(node, ast.IfExp):
+            yield from cls._unconditional(node.test)
+            return
+        if isinstance(node, ast.BoolOp):
+            yield from cls._unconditional(node.values[0])
+            return
+        for child in ast.iter_child_nodes(node):
+            yield from cls._unconditional(child)
+
+    def rewrite(self, statements: List[ast.Assign]) -> List[ast.Assign]:
+        result = []
+        for statement in statements:
+            statement.value = self._replace(statement.value)
+            result += self.pending + [statement]
+            self.pending = []
+        return result
+
+    def _replace(self, node: ast.AST) -> ast.AST:
+        key = ast.dump(node) if isinstance(node, self.CANDIDATES) else None
+        if key in self.names:
+            return ast.Name(self.names[key], ast.Load())
+        if isinstance(node, ast.IfExp):
+            node.test = self._replace(node.test)
+            return node
+        if isinstance(node, ast.BoolOp):
+            node.values[0] = self._replace(node.values[0])
+            return node
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.AST):
+                setattr(node, field, self._replace(value))
+            elif isinstance(value, list):
+                setattr(node, field, [self._replace(v) if isinstance(v, ast.AST) else v for v in value])
+        if key in self.shared:
+            name = self.names[key] = f"_cse{len(self.names)}"
+            self.pending.append(ast.Assign([ast.Name(name, ast.Store())], node, lineno=0))
+            return ast.Name(name, ast.Load())
+        return node
+
+
+def lookup_function(lookup) -> Any:
+    """A plain-Python 1-D interpolator equivalent to calling a scalar pysd lookup object."""
+    xs = [float(v) for v in lookup.data["lookup_dim"].values]
+    ys = [float(v) for v in lookup.data.values]
+    mode = lookup.interp
+
+    def interpolate(x):
+        if x <= xs[0] or x >= xs[-1]:
+            end = 0 if x <= xs[0] else -1
+            if x == xs[end] or mode != "extrapolate":
+                return ys[end]
+            near = 1 if end == 0 else -2
+            return ys[end] + (ys[end] - ys[near]) / (xs[end] - xs[near]) * (x - xs[end])
+        i = bisect.bisect_right(xs, x) - 1
+        if x == xs[i] or mode == "hold_backward":
+            return ys[i]
+        return ys[i] + (ys[i + 1] - ys[i]) * (x - xs[i]) / (xs[i + 1] - xs[i])
+    return interpolate
+
+
+def _identifier(prefix: str, py_name: str) -> str:
+    name = f"{prefix}_{py_name}"
+    return name + "_" if keyword.iskeyword(name) else name
+
+
+class CompiledModel:
+    """A pysd model whose runs go through a generated flat step function."""
+
+    # Stateful classes the step function can integrate, and whether subscripted components are supported.
+    STOCK_KINDS: Tuple[str, ...] = ("Integ",)
+    SUBSCRIPTED = False
+
+    def __init__(self, model):
+        self.model = model
+        self.module = model.components._components
+        self.components, self.objects = parse_components(model.py_model_file, subscripted=self.SUBSCRIPTED)
+        self.stocks: List[str] = []
+        for element in model._dynamicstateful_elements:
+            kind = self.objects.get(element.py_name, (None,))[0]
+            if kind not in self.STOCK_KINDS:
+                raise NotCompilable(f"{element.py_name} is a {kind or type(element).__name__}, "
+                                    f"not one of {', '.join(self.STOCK_KINDS)}.")
+            self.stocks.append(element.py_name)
+        # Lookup components backed by a scalar hardcoded lookup table, by the table's name.
+        self.lookups: Dict[str, str] = {}
+        for name, component in self.components.items():
+            call = component.expr
+            if component.takes_arguments and isinstance(call, ast.Call) and isinstance(call.func, ast.Name) \
+                    and self.objects.get(call.func.id, ("",))[0] == "HardcodedLookups" \
+                    and getattr(getattr(self.module, call.func.id), "is_float", False):
+                self.lookups[name] = call.func.id
+        self._generated: Dict[Tuple, Tuple[str, Any]] = {}
+
+    def _plan(self, outputs: Sequence[str], overridden: Dict[str, bool]) -> Dict[str, Any]:
+        """Decide which components are per-run constants, per-step variables or opaque calls.
+
+        `overridden` maps overridden components to whether their new value is constant.
+        """
+        referenced = {name: _called_names(c.expr) for name, c in self.components.items()}
+        for name, constant in overridden.items():
+            referenced[name] = set()
+        stocks = set(self.stocks)
+
+        def constant_reference(ref: str) -> bool:
+            if ref in self.components:
+                return ref in hoisted or self.components[ref].takes_arguments
+            if ref in self.objects:
+                return self.objects[ref][0] in CONSTANT_STATEFULS
+            return ref in CONTROL_COMPONENTS and ref != "time" or ref not in stocks and ref != "time"
+
+        hoisted: Set[str] = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, component in self.components.items():
+                if name in hoisted or component.takes_arguments:
+                    continue
+                if overridden.get(name, not _uses_time(component.expr)
+                                  and all(constant_reference(ref) for ref in referenced[name])):
+                    hoisted.add(name)
+                    changed = True
+
+        # Per-step components needed by the stocks' derivatives and the outputs, in dependency order.
+        needed: List[str] = []
+        visiting: Set[str] = set()
+
+        def settled(name: str) -> bool:
+            return name in needed or name in hoisted or name not in self.components \
+                or self.components[name].takes_arguments
+
+        def visit(root: str):
+            # Depth-first without recursion, so long dependency chains cannot overflow the stack.
+            if settled(root):
+                return
+            stack = [(root, iter(sorted(referenced[root])))]
+            visiting.add(root)
+            while stack:
+                name, refs = stack[-1]
+                for ref in refs:
+                    if settled(ref):
+                        continue
+                    if ref in visiting:
+                        raise NotCompilable(f"Circular dependency through {self.components[ref].name!r}.")
+                    visiting.add(ref)
+                    stack.append((ref, iter(sorted(referenced[ref]))))
+                    break
+                else:
+                    stack.pop()
+                    visiting.discard(name)
+                    needed.append(name)
+
+        roots = [ref for stock in self.stocks for body in self._derivative_inputs(stock) for ref in _called_names(body)]
+        for name in sorted(roots) + list(outputs):
+            visit(name)
+        opaque = [name for name in needed if name in overridden]
+        return {"hoisted": hoisted, "needed": needed, "opaque": opaque, "stocks": stocks}
+
+    def _derivative_inputs(self, stock: str) -> List[ast.expr]:
+        """The expressions a stock's derivative is computed from."""
+        return [self.objects[stock][1][0]]
+
+    def _flattener(self, variables: Dict[str, str], lookups: Dict[str, str]) -> _Flatten:
+        return _Flatten(variables, lookups)
+
+    def _stock_variables(self) -> Dict[str, str]:
+        """Step-function variables holding the value of each stateful object."""
+        return {stock: f"x{i}" for i, stock in enumerate(self.stocks)}
+
+    def _component_expression(self, name: str, flatten: _Flatten) -> ast.expr:
+        return flatten.visit(ast.parse(ast.unparse(self.components[name].expr), mode="eval").body)
+
+    def _stock_statements(self, flatten: _Flatten) -> Tuple[List[ast.Assign], List[ast.Assign], List[str]]:
+        """(statements computing the stock variables, statements computing the derivatives, new states)."""
+        derivatives, new_states = [], []
+        for i, stock in enumerate(self.stocks):
+            ddt = flatten.visit(ast.parse(ast.unparse(self.objects[stock][1][0]), mode="eval").body)
+            derivatives.append(ast.Assign([ast.Name(f"d{i}", ast.Store())], ddt, lineno=0))
+            new_states.append(f"x{i} + d{i} * dt")
+        return [], derivatives, new_states
+
+    def _extra_constants(self) -> Dict[str, str]:
+        """Step-function variables read from `_constants` besides the hoisted components, by key."""
+        return {}
+
+    def generate(self, outputs: Sequence[str], overridden: Optional[Dict[str, bool]] = None) -> str:
+        """Source of a factory `_make_step(_constants, _opaque, dt)` returning the step function.
+
+        The step function takes the stock values and the time and returns the
+        stock values after one Euler step and the values of `outputs` before it.
+        """
+        overridden = overridden or {}
+        plan = self._plan(outputs, overridden)
+        variables = self._stock_variables()
+        variables.update({name: _identifier("c", name) for name in plan["hoisted"]})
+        variables.update({name: _identifier("v", name) for name in plan["needed"]})
+        variables.update({name: _identifier("c", name) for name, (kind, _) in self.objects.items()
+                          if kind in CONSTANT_STATEFULS})
+        lookups = {name: _identifier("l", name) for name in self.lookups if name not in overridden}
+        flatten = self._flattener(variables, lookups)
+
+        prelude, derivatives, new_states = self._stock_statements(flatten)
+        statements = list(prelude)
+        for name in plan["needed"]:
+            if name in plan["opaque"]:
+                value = ast.Call(ast.Subscript(ast.Name("_opaque", ast.Load()), ast.Constant(name), ast.Load()), [], [])
+            else:
+                value = self._component_expression(name, flatten)
+            statements.append(ast.Assign([ast.Name(variables[name], ast.Store())], value, lineno=0))
+        statements += derivatives
+        statements = _CommonSubexpressions(statements).rewrite(statements)
+
+        constants = sorted(n for n in variables if n in plan["hoisted"]
+                           or self.objects.get(n, ("",))[0] in CONSTANT_STATEFULS)
+        lines = ["def _make_step(_constants, _opaque, dt):"]
+        lines += [f"    {variables[n]} = _constants[{n!r}]" for n in constants]
+        lines += [f"    {lookups[n]} = _constants[{n!r}]" for n in sorted(lookups)]
+        lines += [f"    {variable} = _constants[{key!r}]" for key, variable in sorted(self._extra_constants().items())]
+        lines.append(f"    def _step({', '.join(f'x{i}' for i in range(len(self.stocks)))}{', ' if self.stocks else ''}t):")
+        lines += [f"        {ast.unparse(s)}" for s in statements]
+        output_values = ", ".join(variables.get(n, n) for n in outputs)
+        new_state = ", ".join(new_states)
+        lines.append(f"        return ({new_state}{',' if len(new_states) == 1 else ''}), ({output_values}{',' if len(outputs) == 1 else ''})")
+        lines.append("    return _step")
+        return "\n".join(lines) + "\n"
+
+    def _namespace(self) -> Dict[str, Any]:
+        """Globals of the generated code."""
+        return dict(vars(self.module))
+
+    def _step_factory(self, outputs: Tuple[str, ...], overridden: Dict[str, bool]):
+        key = (outputs, tuple(sorted(overridden.items())))
+        if key not in self._generated:
+            source = self.generate(outputs, overridden)
+            namespace = self._namespace()
+            exec(compile(source, f"<compiled {Path(self.model.py_model_file).name}>", "exec"), namespace)
+            self._generated[key] = (source, namespace["_make_step"])
+        return self._generated[key][1], self._generated[key][0]
+
+    def run(self, params: Optional[Dict[str, Any]] = None, return_columns: Optional[Sequence[str]] = None,
+            final_time: Optional[float] = None, time_step: Optional[float] = None):
+        """Run the model like `model.run`, returning a DataFrame of `return_columns` (default: every variable)."""
+        try:
+            return self._run(params, return_columns, final_time, time_step)
+        except RecursionError as e:
+            # The model's own functions call each other in a loop, e.g. through `incomplete()` equations.
+            raise NotCompilable("The model's equations depend on each other in a loop.") from e
+
+    def _run(self, params: Optional[Dict[str, Any]], return_columns: Optional[Sequence[str]],
+             final_time: Optional[float], time_step: Optional[float]):
+        import numpy as np
+
+        model = self.model
+        if return_columns is None:
+            return_columns = [c.name for c in self.components.values() if not c.takes_arguments]
+        outputs = tuple(resolve_py_name(model, c) for c in return_columns)
+        for py_name in outputs:
+            if py_name in CONTROL_COMPONENTS or py_name not in self.components:
+                raise NotCompilable(f"{py_name!r} cannot be returned from a compiled run.")
+        overridden = {resolve_py_name(model, name): isinstance(value, (int, float, np.number))
+                      for name, value in (params or {}).items()}
+
+        make_step, _ = self._step_factory(outputs, overridden)
+        initialize(model, params, final_time=final_time, time_step=time_step, return_columns=list(return_columns))
+        plan = self._plan(outputs, overridden)
+        constants = self._run_constants(plan, overridden)
+        opaque = self._opaque_functions(plan)
+        clock = model.time
+        dt = clock.time_step()
+        step = make_step(constants, opaque, dt)
+
+        state = self._initial_state()
+        times, rows = [], []
+        while clock.in_bounds():
+            t = clock()
+            new_state, values = step(*state, t)
+            if clock.in_return():
+                times.append(t)
+                rows.append(values)
+            state = new_state
+            clock.update(t + dt)
+            if opaque:
+                model.clean_caches()
+        if clock.in_return():
+            times.append(clock())
+            rows.append(step(*state, clock())[1])
+        self._store_state(state)
+        model.clean_caches()
+        return self._frame(times, rows, list(return_columns), outputs)
+
+    def _run_constants(self, plan: Dict[str, Any], overridden: Dict[str, bool]) -> Dict[str, Any]:
+        """Values of the step function's constants for the run, once the model is initialized."""
+        constants = {name: getattr(self.module, name)() for name in plan["hoisted"]}
+        constants.update({name: getattr(self.module, name)() for name, (kind, _) in self.objects.items()
+                          if kind in CONSTANT_STATEFULS})
+        constants.update({name: lookup_function(getattr(self.module, table)) for name, table in self.lookups.items()
+                          if name not in overridden})
+        return constants
+
+    def _opaque_functions(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """The model's own functions for the components the step function calls."""
+        return {name: getattr(self.module, name) for name in plan["opaque"]}
+
+    def _initial_state(self) -> Tuple[Any, ...]:
+        return tuple(float(getattr(self.module, stock).state) for stock in self.stocks)
+
+    def _store_state(self, state: Tuple[Any, ...]):
+        """Write the final state back to the model's stateful objects."""
+        for stock, value in zip(self.stocks, state):
+            getattr(self.module, stock).update(value)
+
+    def _frame(self, times: List[float], rows: List[Tuple[Any, ...]], return_columns: List[str],
+               outputs: Sequence[str]):
+        import pandas as pd
+
+        return pd.DataFrame(rows, index=pd.Index(times, name="time"), columns=return_columns)
+
+    def source(self, return_columns: Sequence[str]) -> str:
+        """The generated code for a run returning `return_columns`, for inspection."""
+        return self.generate(tuple(resolve_py_name(self.model, c) for c in return_columns))
+
+
+def compile_model(model_or_path: Any) -> CompiledModel:
+    """Compile a loaded model (or a model file) into a `CompiledModel`; raises `NotCompilable`."""
+    model = load_model(model_or_path) if isinstance(model_or_path, str) else model_or_path
+    return CompiledModel(model)
@@ -0,0 +1,357 @@
+"""Run subscripted pysd models on plain NumPy arrays.
+
+pysd evaluates subscripted variables as `xarray.DataArray`s, so every
+operation aligns coordinates and looks dimensions up by name, at every time
+step. `dense_model` resolves the subscript ranges a model uses to fixed
+integer axes when it is loaded and compiles the model (see `compiler`) into
+one step function over contiguous arrays:
+
+* every value is an ndarray with one axis per subscript range, always in the
+  same order, of length 1 for the ranges the variable does not have. NumPy
+  broadcasting then lines values up exactly as xarray does by dimension name,
+  so `Birthrate[Towns] * Population[Towns] / Lifespan` is plain array arithmetic;
+* SUM, PROD, VMIN and VMAX reduce along their axes and keep them with length 1;
+* renaming a range to its `!` copy (a SUM over one axis of a matrix) swaps two
+  axes, and `transpose` is a no-op;
+* IF THEN ELSE on subscripted values becomes `np.where`;
+* DELAY N, DELAY and SMOOTH N become array stocks with one row per stage, as
+  in pysd; delay times must be constant during a run.
+
+Labels are attached again only when the output DataFrame is built, with
+pysd's flat column names (`Population[Abington]`). Subranges selected with
+`.loc`, subscript mappings and other xarray operations raise `NotCompilable`;
+use `model.run` for those models.
+"""
+import ast
+import itertools
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .compiler import (CONSTANT_STATEFULS, CompiledModel, NotCompilable, _called_names, _Flatten, _uses_time,
+                       lookup_function)
+from .simulation import load_model
+
+DELAYS = ("Delay", "DelayN")
+SMOOTHS = ("Smooth",)
+# pysd array functions and the NumPy reductions they become.
+REDUCTIONS = {"sum": "sum", "prod": "prod", "vmin": "min", "vmax": "max"}
+
+
+def _delay_ddt(x, inflow, delay_time, order):
+    """Net flow into each stage of a DELAY N whose `x` holds the stages' contents, as pysd's `Delay.ddt`."""
+    import numpy as np
+
+    outflows = x / delay_time
+    inflows = np.empty(outflows.shape)
+    inflows[1:] = outflows[:-1]
+    inflows[0] = inflow
+    return (inflows - outflows) * order
+
+
+def _smooth_ddt(x, inflow, smooth_time, order):
+    """Change of each stage of a SMOOTH N, as pysd's `Smooth.ddt`."""
+    import numpy as np
+
+    targets = np.empty(x.shape)
+    targets[1:] = x[:-1]
+    targets[0] = inflow
+    return (targets - x) * order / smooth_time
+
+
+def _expand(x, shape):
+    """`x` broadcast over the axes of `shape` it lacks, like `DataArray.expand_dims`."""
+    import numpy as np
+
+    return np.broadcast_to(x, np.broadcast_shapes(np.shape(x), shape))
+
+
+def _reduce(function, x, axes):
+    """A reduction keeping the reduced axes; like pysd, a float when nothing else is left."""
+    result = function(x, axis=axes, keepdims=True)
+    return result.item() if result.size == 1 else result
+
+
+class _DenseFlatten(_Flatten):
+    """Rewrites xarray operations of a translated expression as operations on dense arrays."""
+
+    def __init__(self, variables: Dict[str, str], lookups: Dict[str, str], dense: "DenseModel"):
+        super().__init__(variables, lookups)
+        self.dense = dense
+        self.subscripted = False
+
+    def _np(self, function: str, args: List[ast.expr]) -> ast.Call:
+        return ast.Call(ast.Attribute(ast.Name("np", ast.Load()), function, ast.Load()), args, [])
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        func = node.func
+        if isinstance(func, ast.Name):
+            if func.id == "if_then_else" and self.subscripted and len(node.args) == 3 \
+                    and all(isinstance(a, ast.Lambda) for a in node.args[1:]):
+                return self._np("where", [self.visit(node.args[0]), self.visit(node.args[1].body),
+                                          self.visit(node.args[2].body)])
+            if func.id in REDUCTIONS:
+                dims = next((k.value for k in node.keywords if k.arg == "dim"), None)
+                if dims is None and len(node.args) > 1:
+                    dims = node.args[1]
+                axes = ast.Constant(None) if dims is None or isinstance(dims, ast.Constant) and dims.value is None \
+                    else ast.Tuple([ast.Constant(self.dense.axis(d)) for d in ast.literal_eval(dims)], ast.Load())
+                function = ast.Attribute(ast.Name("np", ast.Load()), REDUCTIONS[func.id], ast.Load())
+                return ast.Call(ast.Name("_reduce", ast.Load()), [function, self.visit(node.args[0]), axes], [])
+            if func.id in self.lookups and node.args:
+                # The final subscripts argument is only used by pysd to label the result.
+                return ast.Call(ast.Name(self.lookups[func.id], ast.Load()), [self.visit(node.args[0])], [])
+        if isinstance(func, ast.Attribute):
+            if isinstance(func.value, ast.Name) and func.value.id == "xr" and func.attr == "DataArray":
+                return self._data_array(node)
+            if func.attr == "rename" and len(node.args) == 1 and isinstance(node.args[0], ast.Dict):
+                value = self.visit(func.value)
+                for source, target in ast.literal_eval(node.args[0]).items():
+                    if target != source + "!":
+                        raise NotCompilable(f"Renaming {source!r} to {target!r} (subscript mapping) is not supported.")
+                    value = self._np("swapaxes", [value, ast.Constant(self.dense.axis(source)),
+                                                  ast.Constant(self.dense.axis(target))])
+                return value
+            if func.attr == "transpose":
+                # Dense values always have their axes in the same order.
+                return self.visit(func.value)
+            if func.attr == "expand_dims" and node.args and isinstance(node.args[0], ast.Dict):
+                dims = [ast.literal_eval(k) for k in node.args[0].keys]
+                shape = ast.Tuple([ast.Constant(n) for n in self.dense.shape(dims)], ast.Load())
+                return ast.Call(ast.Name("_expand", ast.Load()), [self.visit(func.value), shape], [])
+        return super().visit_Call(node)
+
+    def _data_array(self, node: ast.Call) -> ast.expr:
+        arguments = list(node.args) + [k.value for k in node.keywords]
+        if len(arguments) != 3 or isinstance(arguments[0], (ast.List, ast.Tuple)):
+            # Literal data: converted on every call, but pysd only writes it in constants, which are hoisted.
+            return ast.Call(ast.Name("_dense", ast.Load()), [node], [])
+        dims = ast.literal_eval(node.args[2] if len(node.args) > 2 else node.keywords[-1].value)
+        shape = ast.Tuple([ast.Constant(n) for n in self.dense.shape(dims)], ast.Load())
+        return self._np("broadcast_to", [self.visit(arguments[0]), shape])
+
+
+class DenseModel(CompiledModel):
+    """A pysd model, subscripted or not, run through a step function over dense NumPy arrays."""
+
+    STOCK_KINDS = ("Integ",) + DELAYS + SMOOTHS
+    SUBSCRIPTED = True
+
+    def __init__(self, model):
+        super().__init__(model)
+        subscripts = model.subscripts
+        # Dimensions in axis order: the ranges of the components, then the `!` copies used in sums.
+        self.dims: List[str] = []
+        for component in self.components.values():
+            for dim in component.subscripts:
+                if dim not in self.dims:
+                    self.dims.append(dim)
+        expressions = [c.expr for c in self.components.values()]
+        expressions += [body for _, bodies in self.objects.values() for body in bodies if body is not None]
+        for expr in expressions:
+            for node in ast.walk(expr):
+                if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.endswith("!") \
+                        and node.value[:-1] in subscripts and node.value not in self.dims:
+                    self.dims.append(node.value)
+        self.labels = {dim: list(subscripts[dim.rstrip("!")]) for dim in self.dims}
+
+    def axis(self, dim: str) -> int:
+        if dim not in self.dims:
+            raise NotCompilable(f"Unknown subscript range {dim!r}.")
+        return self.dims.index(dim)
+
+    def shape(self, dims: Sequence[str]) -> Tuple[int, ...]:
+        """The dense shape of a value over `dims`: their lengths on their axes, 1 elsewhere."""
+        for dim in dims:
+            self.axis(dim)
+        return tuple(len(self.labels[d]) if d in dims else 1 for d in self.dims)
+
+    def to_dense(self, value: Any) -> Any:
+        """A pysd value as a float or a dense array."""
+        import numpy as np
+        import xarray as xr
+
+        if isinstance(value, xr.DataArray):
+            if not value.dims:
+                return float(value)
+            shape = self.shape(value.dims)
+            for dim in value.dims:
+                if [str(v) for v in value.coords[dim].values] != self.labels[dim]:
+                    raise NotCompilable(f"A value over a subrange or reordered {dim!r} is not supported.")
+            ordered = [d for d in self.dims if d in value.dims]
+            return np.ascontiguousarray(value.transpose(*ordered).values, dtype=float).reshape(shape)
+        if isinstance(value, np.ndarray) and value.ndim:
+            raise NotCompilable("Unlabelled array values are not supported.")
+        return float(value)
+
+    def labelled(self, value: Any, dims: Sequence[str]) -> Any:
+        """A dense value as an array over `dims`, in that order."""
+        import numpy as np
+
+        if not dims:
+            return float(np.asarray(value).reshape(-1)[0]) if np.ndim(value) else float(value)
+        dense = np.broadcast_to(value, self.shape(dims))
+        order = [self.axis(d) for d in dims]
+        order += [i for i in range(len(self.dims)) if i not in order]
+        return np.transpose(dense, order).reshape([len(self.labels[d]) for d in dims])
+
+    def _plan(self, outputs: Sequence[str], overridden: Dict[str, bool]) -> Dict[str, Any]:
+        plan = super()._plan(outputs, overridden)
+        for stock in self.stocks:
+            kind, bodies = self.objects[stock]
+            if kind in DELAYS:
+                delay_time = bodies[1]
+                if _uses_time(delay_time) or any(
+                        ref in plan["needed"] or ref in self.stocks or ref in self.objects
+                        and self.objects[ref][0] not in CONSTANT_STATEFULS
+                        or ref in self.components and ref not in plan["hoisted"]
+                        and not self.components[ref].takes_arguments
+                        for ref in _called_names(delay_time)):
+                    raise NotCompilable(f"{stock} has a delay time that changes during the run.")
+        return plan
+
+    def _derivative_inputs(self, stock: str) -> List[ast.expr]:
+        kind, bodies = self.objects[stock]
+        # A DELAY's time is constant (checked in `_plan`); a SMOOTH's time is read every step.
+        return [bodies[0], bodies[1]] if kind in SMOOTHS else [bodies[0]]
+
+    def _flattener(self, variables: Dict[str, str], lookups: Dict[str, str]) -> _Flatten:
+        return _DenseFlatten(variables, lookups, self)
+
+    def _stock_variables(self) -> Dict[str, str]:
+        return {stock: f"x{i}" if self.objects[stock][0] == "Integ" else f"y{i}"
+                for i, stock in enumerate(self.stocks)}
+
+    def _extra_constants(self) -> Dict[str, str]:
+        constants = {}
+        for i, stock in enumerate(self.stocks):
+            if self.objects[stock][0] != "Integ":
+                constants[f"{stock}.order"] = f"k{i}_order"
+            if self.objects[stock][0] in DELAYS:
+                constants[f"{stock}.delay_time"] = f"k{i}_delay_time"
+        return constants
+
+    def _component_expression(self, name: str, flatten: _Flatten) -> ast.expr:
+        flatten.subscripted = bool(self.components[name].subscripts)
+        expr = super()._component_expression(name, flatten)
+        self._check(expr, self.components[name].name)
+        return expr
+
+    def _check(self, expr: ast.expr, name: str):
+        for node in ast.walk(expr):
+            if isinstance(node, ast.Attribute) and not (isinstance(node.value, ast.Name) and node.value.id == "np"):
+                raise NotCompilable(f"{name!r} uses `.{node.attr}`, an xarray operation.")
+            if isinstance(node, ast.Subscript) and not (isinstance(node.value, ast.Name)
+                                                        and node.value.id == "__data"):
+                raise NotCompilable(f"{name!r} selects subscripts.")
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                    and (node.func.id in self.components or node.func.id in self.objects):
+                raise NotCompilable(f"{name!r} calls {node.func.id}, which returns labelled values.")
+
+    def _stock_statements(self, flatten: _Flatten) -> Tuple[List[ast.Assign], List[ast.Assign], List[str]]:
+        prelude, derivatives, new_states = [], [], []
+        for i, stock in enumerate(self.stocks):
+            kind, bodies = self.objects[stock]
+            flatten.subscripted = True
+            inflow = flatten.visit(ast.parse(ast.unparse(bodies[0]), mode="eval").body)
+            self._check(inflow, stock)
+            if kind == "Integ":
+                ddt = inflow
+            elif kind in DELAYS:
+                # The delay's output: the content of the last stage over the stage time.
+                prelude.append(ast.parse(f"y{i} = x{i}[-1] / k{i}_delay_time").body[0])
+                ddt = ast.parse(f"_delay_ddt(x{i}, _inflow, k{i}_delay_time, k{i}_order)", mode="eval").body
+                ddt.args[1] = inflow
+            else:
+                smooth_time = flatten.visit(ast.parse(ast.unparse(bodies[1]), mode="eval").body)
+                self._check(smooth_time, stock)
+                prelude.append(ast.parse(f"y{i} = x{i}[-1]").body[0])
+                ddt = ast.parse(f"_smooth_ddt(x{i}, _inflow, _time, k{i}_order)", mode="eval").body
+                ddt.args[1], ddt.args[2] = inflow, smooth_time
+            derivatives.append(ast.Assign([ast.Name(f"d{i}", ast.Store())], ddt, lineno=0))
+            new_states.append(f"x{i} + d{i} * dt")
+        return prelude, derivatives, new_states
+
+    def _namespace(self) -> Dict[str, Any]:
+        import numpy as np
+
+        namespace = super()._namespace()
+        namespace.update(np=np, _delay_ddt=_delay_ddt, _smooth_ddt=_smooth_ddt, _expand=_expand, _reduce=_reduce,
+                         _dense=self.to_dense)
+        return namespace
+
+    def _run_constants(self, plan: Dict[str, Any], overridden: Dict[str, bool]) -> Dict[str, Any]:
+        import numpy as np
+
+        constants = {name: self.to_dense(getattr(self.module, name)()) for name in plan["hoisted"]}
+        constants.update({name: self.to_dense(getattr(self.module, name)()) for name, (kind, _) in self.objects.items()
+                          if kind in CONSTANT_STATEFULS})
+        for name, table in self.lookups.items():
+            if name in overridden:
+                continue
+            lookup = getattr(self.module, table)
+            if lookup.interp == "interpolate":
+                xs = np.asarray(lookup.data["lookup_dim"].values, dtype=float)
+                ys = np.asarray(lookup.data.values, dtype=float)
+                constants[name] = lambda x, xs=xs, ys=ys: np.interp(x, xs, ys)
+            else:
+                constants[name] = np.vectorize(lookup_function(lookup), otypes=[float])
+        for stock in self.stocks:
+            element = getattr(self.module, stock)
+            if self.objects[stock][0] != "Integ":
+                constants[f"{stock}.order"] = element.order
+            if self.objects[stock][0] in DELAYS:
+                constants[f"{stock}.delay_time"] = self.to_dense(element.delay_time_func())
+        return constants
+
+    def _opaque_functions(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: (lambda function=function: self.to_dense(function()))
+                for name, function in super()._opaque_functions(plan).items()}
+
+    def _initial_state(self) -> Tuple[Any, ...]:
+        import numpy as np
+
+        state = []
+        for stock in self.stocks:
+            value = getattr(self.module, stock).state
+            if self.objects[stock][0] == "Integ":
+                state.append(self.to_dense(value))
+            else:
+                state.append(np.stack([np.asarray(self.to_dense(stage), dtype=float) for stage in value]))
+        return tuple(state)
+
+    def _store_state(self, state: Tuple[Any, ...]):
+        import numpy as np
+        import xarray as xr
+
+        for stock, value in zip(self.stocks, state):
+            element = getattr(self.module, stock)
+            if not element.shape_info:
+                element.update(value if self.objects[stock][0] == "Integ" else np.asarray(value, dtype=float))
+                continue
+            dims, coords = list(element.shape_info["dims"]), element.shape_info["coords"]
+            if self.objects[stock][0] == "Integ":
+                element.update(xr.DataArray(self.labelled(value, dims), coords, dims))
+            else:
+                stages = np.stack([self.labelled(stage, dims[1:]) for stage in value])
+                element.update(xr.DataArray(stages, coords, dims))
+
+    def _frame(self, times: List[float], rows: List[Tuple[Any, ...]], return_columns: List[str],
+               outputs: Sequence[str]):
+        import numpy as np
+        import pandas as pd
+
+        columns = {}
+        for j, (column, py_name) in enumerate(zip(return_columns, outputs)):
+            dims = self.components[py_name].subscripts
+            values = np.array([np.reshape(self.labelled(row[j], dims), -1) for row in rows])
+            if not dims:
+                columns[column] = values[:, 0]
+                continue
+            for k, labels in enumerate(itertools.product(*(self.labels[d] for d in dims))):
+                columns[f"{column}[{','.join(labels)}]"] = values[:, k]
+        return pd.DataFrame(columns, index=pd.Index(times, name="time"))
+
+
+def dense_model(model_or_path: Any) -> DenseModel:
+    """Compile a loaded model (or a model file) into a `DenseModel`; raises `NotCompilable`."""
+    model = load_model(model_or_path) if isinstance(model_or_path, str) else model_or_path
+    return DenseModel(model)
@@ -0,0 +1,349 @@
+"""Ensembles spread over several machines: a small TCP broker and worker daemons.
+
+`ensembles.evaluate` runs on a process pool of one machine. For ensembles
+that outgrow it, a `Broker` in the agent's process hands out batches of runs
+to worker daemons on any number of nodes:
+
+* workers connect to the broker (`multiprocessing.connection` over TCP,
+  authenticated with a shared key) and pull one batch at a time, so fast
+  nodes simply take more batches;
+* each worker process keeps its loaded models between batches (through
+  `ensembles.simulate`), so a model is translated and loaded once per worker;
+* a batch whose worker disconnects or does not answer within `task_timeout`
+  is handed to another worker, up to `max_retries` times. A batch that
+  raises is not retried, since it would raise again;
+* `Broker.run` returns the outputs in the order of the runs given, and fails
+  if no worker is connected for longer than `task_timeout`.
+
+Workers need the model files at the same (relative) paths as the agent, e.g.
+a shared checkout, and are started from its root:
+
+    SCIENTIST_AGENT_BROKER_KEY=<key> python scientist-agent/distributed.py worker <broker host>:<port> --processes 8
+
+With `SCIENTIST_AGENT_BROKER=<host>:<port>` set, the agent starts a broker on
+that address and `ensembles.evaluate` sends its runs there whenever workers
+are connected. `Broker.start_local_workers` starts workers on this machine,
+standing in for nodes when testing.
+"""
+import logging
+import multiprocessing
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TASK_TIMEOUT = 600.0
+DEFAULT_MAX_RETRIES = 3
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """("host", port) from "host:port"."""
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected an address like 'localhost:5557', got {address!r}.")
+    return host, int(port)
+
+
+def default_authkey() -> Optional[bytes]:
+    key = os.environ.get("SCIENTIST_AGENT_BROKER_KEY")
+    return key.encode() if key else None
+
+
+class _Task:
+    """One batch of runs and what became of it."""
+
+    def __init__(self, task_id: int, runs: List[Tuple[str, Dict[str, Any]]], specs: Sequence[str]):
+        self.id = task_id
+        self.runs = runs
+        self.specs = list(specs)
+        self.attempts = 0
+        self.outputs: Optional[List[Dict[str, float]]] = None
+        self.error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.outputs is not None or self.error is not None
+
+
+class Broker:
+    """Hands batches of runs to the workers connected to it, and collects their outputs."""
+
+    def __init__(self, address: Tuple[str, int] = ("localhost", 0), authkey: Optional[bytes] = None,
+                 task_timeout: float = DEFAULT_TASK_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            address: (host, port) to listen on; port 0 picks a free one (see `self.address`).
+            authkey: Key the workers must present. Defaults to `SCIENTIST_AGENT_BROKER_KEY`, or a
+                random key that only workers from `start_local_workers` know.
+            task_timeout: Seconds a worker may take for one batch before it is given to another.
+            max_retries: How often a lost batch is handed out again before `run` fails.
+        """
+        self.authkey = authkey or default_authkey() or secrets.token_hex(16).encode()
+        self.task_timeout = task_timeout
+        self.max_retries = max_retries
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address: Tuple[str, int] = self._listener.address
+        self._pending: deque = deque()
+        self._condition = threading.Condition()
+        self._next_id = 0
+        self._closed = False
+        self.workers: Dict[int, str] = {}
+        self._local: List[multiprocessing.Process] = []
+        threading.Thread(target=self._accept, name="broker-accept", daemon=True).start()
+
+    def _accept(self) -> None:
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                # Failed authentication or a closed listener.
+                if not self._closed:
+                    logger.warning(f"Broker rejected a connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="broker-worker", daemon=True).start()
+
+    def _next_task(self) -> Optional[_Task]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            task = self._pending.popleft()
+            task.attempts += 1
+            return task
+
+    def _lost(self, task: _Task, reason: str) -> None:
+        with self._condition:
+            if task.finished:
+                return
+            if task.attempts > self.max_retries:
+                task.error = f"Batch {task.id} was lost {task.attempts} times, last: {reason}"
+            else:
+                logger.info(f"Retrying batch {task.id}: {reason}")
+                self._pending.appendleft(task)
+            self._condition.notify_all()
+
+    def _serve(self, conn) -> None:
+        """Talk to one worker: send it a batch whenever it is ready, until it goes away."""
+        try:
+            _, name = conn.recv()
+        except (EOFError, OSError, ValueError):
+            conn.close()
+            return
+        with self._condition:
+            self.workers[id(conn)] = name
+        task = None
+        try:
+            while True:
+                task = self._next_task()
+                if task is None:
+                    conn.send(("stop",))
+                    return
+                conn.send(("task", task.id, task.runs, task.specs))
+                if not conn.poll(self.task_timeout):
+                    raise TimeoutError(f"worker {name} took over {self.task_timeout}s")
+                kind, task_id, payload = conn.recv()
+                with self._condition:
+                    if not task.finished:
+                        if kind == "result":
+                            task.outputs = payload
+                        else:
+                            task.error = f"Worker {name}: {payload}"
+                    self._condition.notify_all()
+                task = None
+        except (EOFError, OSError, TimeoutError) as e:
+            if task is not None:
+                self._lost(task, f"{type(e).__name__}: {e}" if str(e) else f"worker {name} disconnected")
+        finally:
+            with self._condition:
+                self.workers.pop(id(conn), None)
+            conn.close()
+
+    def run(self, runs: Sequence[Tuple[str, Dict[str, Any]]], specs: Sequence[str],
+            batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        """Simulate (model_path, params) runs on the workers and reduce each one to `specs`.
+
+        Args:
+            runs: The runs, like `ensembles.evaluate_many`'s runs to do.
+            specs: Output specs such as "max:Infected".
+            batch_size: Runs per batch; by default about four batches per connected worker.
+
+        Returns:
+            One {spec: value} per run, in order.
+
+        Raises:
+            RuntimeError: If a batch failed on a worker or was lost too often, or if no worker
+                was connected for longer than `task_timeout`.
+        """
+        runs = list(runs)
+        if not runs:
+            return []
+        batch_size = batch_size or max(1, -(-len(runs) // (4 * max(1, len(self.workers)))))
+        tasks: List[_Task] = []
+        with self._condition:
+            # Batches hold consecutive runs of a single model, like `ensembles.evaluate_many`'s.
+            for path, params in runs:
+                if not tasks or tasks[-1].runs[0][0] != path or len(tasks[-1].runs) == batch_size:
+                    tasks.append(_Task(self._next_id, [], specs))
+                    self._next_id += 1
+                tasks[-1].runs.append((path, params))
+            self._pending.extend(tasks)
+            self._condition.notify_all()
+            # Since when no worker is connected: lost batches would otherwise wait for one forever.
+            orphaned_since = None
+            while not all(task.finished for task in tasks):
+                if self._closed:
+                    raise RuntimeError("The broker was closed.")
+                if self.workers:
+                    orphaned_since = None
+                elif orphaned_since is None:
+                    orphaned_since = time.monotonic()
+                elif time.monotonic() - orphaned_since > self.task_timeout:
+                    for task in tasks:
+                        if not task.finished:
+                            task.error = f"No worker was connected for {self.task_timeout}s"
+                    self._pending = deque(task for task in self._pending if not task.finished)
+                    break
+                self._condition.wait(timeout=min(1.0, self.task_timeout))
+        failed = [task.error for task in tasks if task.error is not None]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(tasks)} batches failed. {failed[0]}")
+        return [outputs for task in tasks for outputs in task.outputs]
+
+    def start_local_workers(self, count: int) -> List[multiprocessing.Process]:
+        """Start `count` worker processes on this machine, connected to this broker."""
+        host, port = self.address
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=run_worker, args=((host, port), self.authkey, f"local-{i}"),
+                                     daemon=True) for i in range(count)]
+        for process in processes:
+            process.start()
+        self._local += processes
+        return processes
+
+    def wait_for_workers(self, count: int, timeout: float = 60.0) -> int:
+        """Wait until at least `count` workers are connected, or `timeout` passed. Returns how many are."""
+        deadline = time.monotonic() + timeout
+        while len(self.workers) < count and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return len(self.workers)
+
+    def close(self) -> None:
+        """Stop handing out batches, tell idle workers to stop and stop the local workers."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._listener.close()
+        for process in self._local:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._local = []
+
+
+def run_worker(address: Tuple[str, int], authkey: bytes, name: Optional[str] = None,
+               retry_seconds: float = 0.0) -> None:
+    """A worker daemon: pull batches from the broker at `address` and run them, until told to stop.
+
+    Args:
+        address: The broker's (host, port).
+        authkey: The broker's key.
+        name: Shown in the broker's logs; defaults to host:pid.
+        retry_seconds: Keep reconnecting for this long while the broker is unreachable.
+    """
+    from .ensembles import simulate
+
+    name = name or f"{os.uname().nodename}:{os.getpid()}"
+    deadline = time.monotonic() + retry_seconds
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(1.0)
+    with conn:
+        conn.send(("ready", name))
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "stop":
+                return
+            _, task_id, runs, specs = message
+            try:
+                reply = ("result", task_id, [simulate(path, params, specs) for path, params in runs])
+            except Exception as e:
+                reply = ("error", task_id, f"{type(e).__name__}: {e}")
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+
+
+_broker: Optional[Broker] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> Optional[Broker]:
+    """The broker on `SCIENTIST_AGENT_BROKER` (started on first use), or None when it is not set."""
+    global _broker
+    address = os.environ.get("SCIENTIST_AGENT_BROKER")
+    if not address:
+        return None
+    with _broker_lock:
+        if _broker is None:
+            if default_authkey() is None:
+                raise ValueError("Set SCIENTIST_AGENT_BROKER_KEY to the key the workers use.")
+            _broker = Broker(parse_address(address))
+        return _broker
+
+
+def main(argv: Sequence[str]) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="distributed.py", description="Run ensemble worker daemons.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="Pull run batches from a broker.")
+    worker.add_argument("broker", help="The broker's host:port.")
+    worker.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes on this node (default: one per CPU).")
+    worker.add_argument("--retry-seconds", type=float, default=60.0,
+                        help="Keep trying to reach the broker for this long.")
+    args = parser.parse_args(argv)
+
+    authkey = default_authkey()
+    if authkey is None:
+        parser.error("Set SCIENTIST_AGENT_BROKER_KEY to the broker's key.")
+    address = parse_address(args.broker)
+    logging.basicConfig(level=logging.INFO)
+    if args.processes == 1:
+        run_worker(address, authkey, retry_seconds=args.retry_seconds)
+        return
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=run_worker, args=(address, authkey, None, args.retry_seconds))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    # Run as a script: import the package under a valid name so its relative imports work, as the benchmarks do.
+    import importlib
+    import importlib.util
+
+    _package = os.path.dirname(os.path.abspath(__file__))
+    _spec = importlib.util.spec_from_file_location("scientist_agent", os.path.join(_package, "__init__.py"),
+                                                   submodule_search_locations=[_package])
+    sys.modules["scientist_agent"] = importlib.util.module_from_spec(_spec)
+    importlib.import_module("scientist_agent.distributed").main(sys.argv[1:])
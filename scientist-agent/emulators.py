@@ -0,0 +1,173 @@
+"""Whole-model emulators for instant what-if answers.
+
+An emulator is a Gaussian-process regression from a few model parameters to a
+few summary outputs (e.g. "final:Tenure" or "max:Infected"), trained on a
+Latin hypercube ensemble of real simulations. Queries return the predicted
+mean with an uncertainty band and cost a GP prediction instead of a run.
+
+When the predicted uncertainty of any output is above a threshold (relative
+to that output's spread in the training data), or the query lies outside the
+trained parameter ranges, `Emulator.query` runs the real model instead and
+adds that run to the training set, so the emulator improves where it is used.
+
+Emulators are kept per (model, parameters, outputs) in `get_emulator`, so an
+interactive session trains each one only once.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .sampling import Bounds, latin_hypercube, rows
+from .simulation import load_model, parse_output_spec, run_lean
+
+logger = logging.getLogger(__name__)
+
+# z-score of the two-sided 95% band returned with every prediction.
+BAND_Z = 1.96
+
+
+class Emulator:
+    """A Gaussian-process surrogate of selected outputs of one model."""
+
+    def __init__(self, model_path: str, bounds: Bounds, outputs: Sequence[str],
+                 uncertainty_threshold: float = 0.05):
+        for spec in outputs:
+            parse_output_spec(spec)
+        self.model_path = model_path
+        self.bounds = dict(bounds)
+        self.parameters = list(self.bounds)
+        self.outputs = list(outputs)
+        self.uncertainty_threshold = uncertainty_threshold
+        self.X = np.empty((0, len(self.parameters)))
+        self.Y = np.empty((0, len(self.outputs)))
+        self._model = None
+        self._gps: List[Any] = []
+        self._lock = threading.Lock()
+
+    def simulate(self, params: Dict[str, float]) -> Dict[str, float]:
+        """Run the real model once and reduce it to the emulated outputs."""
+        if self._model is None:
+            self._model = load_model(self.model_path)
+        return run_lean(self._model, specs=self.outputs, params=params)
+
+    def add_runs(self, param_rows: List[Dict[str, float]], outputs: List[Dict[str, float]]) -> None:
+        self.X = np.vstack([self.X, [[p[name] for name in self.parameters] for p in param_rows]])
+        self.Y = np.vstack([self.Y, [[o[spec] for spec in self.outputs] for o in outputs]])
+
+    def fit(self, n_samples: int = 50, seed: Optional[int] = 0) -> "Emulator":
+        """Simulate a Latin hypercube design (if there is no data yet) and fit one GP per output."""
+        if len(self.X) == 0:
+            param_rows = rows(latin_hypercube(self.bounds, n_samples, seed))
+            self.add_runs(param_rows, [self.simulate(p) for p in param_rows])
+        self._fit_gps()
+        return self
+
+    def _fit_gps(self) -> None:
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+
+        span = np.array([high - low for low, high in self.bounds.values()], dtype=float)
+        span[span == 0] = 1.0
+        self._scale = span
+        self._offset = np.array([low for low, _ in self.bounds.values()], dtype=float)
+        Xs = (self.X - self._offset) / self._scale
+        gps = []
+        for j in range(len(self.outputs)):
+            # Inputs are scaled to the unit cube; length scales far below the sample
+            # spacing would let the GP explain everything as noise.
+            kernel = ConstantKernel() * Matern(length_scale=np.full(len(self.parameters), 0.5),
+                                               length_scale_bounds=(0.05, 20.0), nu=2.5) \
+                + WhiteKernel(noise_level=1e-6, noise_level_bounds=(1e-10, 1e-1))
+            gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, n_restarts_optimizer=2,
+                                          random_state=0)
+            gps.append(gp.fit(Xs, self.Y[:, j]))
+        self._gps = gps
+        self._spread = np.ptp(self.Y, axis=0)
+        self._spread[self._spread == 0] = 1.0
+
+    def predict(self, params: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+        """Emulated mean, standard deviation and 95% band of every output."""
+        x = (np.array([[params[name] for name in self.parameters]], dtype=float) - self._offset) / self._scale
+        predictions = {}
+        for spec, gp in zip(self.outputs, self._gps):
+            mean, std = gp.predict(x, return_std=True)
+            mean, std = float(mean[0]), float(std[0])
+            predictions[spec] = {"mean": mean, "std": std,
+                                 "lower": mean - BAND_Z * std, "upper": mean + BAND_Z * std}
+        return predictions
+
+    def in_bounds(self, params: Dict[str, float]) -> bool:
+        return all(low <= params[name] <= high for name, (low, high) in self.bounds.items())
+
+    def query(self, params: Dict[str, float]) -> Dict[str, Any]:
+        """Answer a what-if question, falling back to a real simulation when unsure.
+
+        Returns:
+            dict with `source` ("emulator" or "simulation"), `outputs` (mean/std/lower/upper
+            per output; std is 0 for simulated answers) and `seconds`.
+        """
+        missing = set(self.parameters) - set(params)
+        if missing:
+            raise ValueError(f"Missing values for emulated parameters: {sorted(missing)}")
+        start = time.perf_counter()
+        with self._lock:
+            if self.in_bounds(params):
+                predictions = self.predict(params)
+                relative_std = max(p["std"] / s for p, s in zip(predictions.values(), self._spread))
+                if relative_std <= self.uncertainty_threshold:
+                    return {"source": "emulator", "outputs": predictions, "relative_std": relative_std,
+                            "seconds": time.perf_counter() - start}
+
+            simulated = self.simulate(params)
+            self.add_runs([params], [simulated])
+            for name, value in params.items():
+                low, high = self.bounds[name]
+                self.bounds[name] = (min(low, value), max(high, value))
+            self._fit_gps()
+            return {
+                "source": "simulation",
+                "outputs": {spec: {"mean": v, "std": 0.0, "lower": v, "upper": v} for spec, v in simulated.items()},
+                "training_runs": len(self.X),
+                "seconds": time.perf_counter() - start,
+            }
+
+
+_emulators: Dict[Tuple, Emulator] = {}
+_registry_lock = threading.Lock()
+
+
+def default_bounds(model_path: str, parameters: Sequence[str], spread: float = 0.5) -> Bounds:
+    """±`spread` around each parameter's constant value in the model file."""
+    from .catalog import get_model_entry
+    from .model_parser import normalize_name
+
+    entry = get_model_entry(model_path)
+    constants = {normalize_name(v["name"]): v.get("value") for v in (entry or {}).get("variables", [])}
+    bounds = {}
+    for name in parameters:
+        value = constants.get(normalize_name(name))
+        if value is None:
+            raise ValueError(f"{name!r} is not a constant of {model_path}; give its range explicitly.")
+        low, high = sorted((value * (1 - spread), value * (1 + spread)))
+        bounds[name] = (low, high) if low != high else (low - spread, high + spread)
+    return bounds
+
+
+def get_emulator(model_path: str, parameters: Sequence[str], outputs: Sequence[str],
+                 bounds: Optional[Bounds] = None, n_samples: int = 50,
+                 uncertainty_threshold: float = 0.05) -> Emulator:
+    """The trained emulator for this model, parameter set and outputs, training it on first use."""
+    key = (model_path, tuple(sorted(parameters)), tuple(sorted(outputs)))
+    with _registry_lock:
+        emulator = _emulators.get(key)
+        if emulator is None:
+            bounds = bounds or default_bounds(model_path, parameters)
+            logger.info(f"Training emulator for {model_path} on {n_samples} runs...")
+            emulator = Emulator(model_path, {p: bounds[p] for p in sorted(parameters)}, sorted(outputs),
+                                uncertainty_threshold).fit(n_samples)
+            _emulators[key] = emulator
+        emulator.uncertainty_threshold = uncertainty_threshold
+        return emulator
@@ -0,0 +1,213 @@
+"""Parallel, cached evaluation of many model runs.
+
+`evaluate` takes a list of parameter sets for one model and returns the
+reduced outputs (see `simulation.REDUCERS`) of each run, in order. Runs are
+spread over a pool of worker processes which keep their loaded models between
+tasks, and every result is memoized in a `RunCache` so that search loops
+(experiment design, robust optimization, ...) never simulate the same
+(model, parameters) pair twice. When a broker is configured (see
+`distributed`), runs go to the worker daemons connected to it instead.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .simulation import load_model, run_lean
+
+# Parameter values are rounded for cache keys so float noise does not defeat the cache.
+KEY_DIGITS = 12
+
+
+class RunCache:
+    """Reduced outputs of completed runs, keyed by model, parameters and output spec."""
+
+    def __init__(self):
+        self._results: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_path: str, params: Dict[str, Any], spec: str) -> Tuple:
+        items = tuple(sorted((name, round(float(value), KEY_DIGITS)) for name, value in params.items()))
+        return os.path.normpath(model_path), items, spec
+
+    def get(self, model_path: str, params: Dict[str, Any], specs: Sequence[str]) -> Optional[Dict[str, float]]:
+        with self._lock:
+            keys = [self.key(model_path, params, spec) for spec in specs]
+            if all(k in self._results for k in keys):
+                self.hits += 1
+                return {spec: self._results[k] for spec, k in zip(specs, keys)}
+            self.misses += 1
+            return None
+
+    def contains(self, model_path: str, params: Dict[str, Any], specs: Sequence[str]) -> bool:
+        """Whether all `specs` of this run are cached, without counting a hit or miss."""
+        with self._lock:
+            return all(self.key(model_path, params, spec) in self._results for spec in specs)
+
+    def put(self, model_path: str, params: Dict[str, Any], outputs: Dict[str, float]) -> None:
+        with self._lock:
+            for spec, value in outputs.items():
+                self._results[self.key(model_path, params, spec)] = value
+
+    def invalidate(self, model_path: str, affected: Optional[Callable[[str], bool]] = None) -> int:
+        """Forget the runs of `model_path`, or only their outputs for which `affected(spec)` is true.
+
+        Returns:
+            The number of cached outputs dropped.
+        """
+        model_path = os.path.normpath(model_path)
+        with self._lock:
+            stale = [k for k in self._results if k[0] == model_path and (affected is None or affected(k[2]))]
+            for k in stale:
+                del self._results[k]
+            return len(stale)
+
+    def __len__(self):
+        return len(self._results)
+
+
+RUN_CACHE = RunCache()
+
+# Models loaded in this (worker) process, keyed by path, the file's mtime (so an
+# edited model is reloaded) and the set of parameters the runs override. Runs with
+# the same parameter names overwrite each other's values completely, so a model
+# can be reused between them.
+_worker_models: Dict[Tuple, Any] = {}
+
+
+def simulate(model_path: str, params: Dict[str, Any], specs: Sequence[str]) -> Dict[str, float]:
+    """Run `model_path` once with `params` and reduce it to `specs`. Runs in worker processes."""
+    key = (model_path, os.stat(model_path).st_mtime_ns, frozenset(params))
+    model = _worker_models.get(key)
+    if model is None:
+        model = _worker_models[key] = load_model(model_path)
+    return run_lean(model, specs=specs, params=params)
+
+
+def translate_models(model_paths: Iterable[str]) -> None:
+    """Translate the `.mdl`/`.xmile` files among `model_paths` whose `.py` is missing or stale.
+
+    Called before runs are handed to workers: workers that each found the model
+    untranslated would all run the translator at once, writing the same `.py`
+    file, and one of them could load it half-written.
+    """
+    for path in set(model_paths):
+        root, suffix = os.path.splitext(path)
+        translated = root + ".py"
+        if suffix in (".mdl", ".xmile") and not (
+                os.path.exists(translated) and os.path.getmtime(translated) >= os.path.getmtime(path)):
+            load_model(path)
+
+
+def _simulate_batch(model_path: str, batch: List[Dict[str, Any]], specs: Sequence[str]) -> List[Dict[str, float]]:
+    return [simulate(model_path, params, specs) for params in batch]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _forget_pool() -> None:
+    # A forked child (e.g. a background job) cannot use its parent's pool or its lock.
+    global _pool, _pool_size, _pool_lock
+    _pool, _pool_size, _pool_lock = None, 0, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def default_processes() -> int:
+    return int(os.environ.get("SCIENTIST_AGENT_PROCESSES", os.cpu_count() or 1))
+
+
+def get_pool(processes: Optional[int] = None) -> ProcessPoolExecutor:
+    """A process pool shared by all callers, so workers keep their loaded models warm."""
+    global _pool, _pool_size
+    processes = processes or default_processes()
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Workers are forked so they inherit this package under whatever name
+            # `adk web` imported it with.
+            _pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork"))
+            _pool_size = processes
+        return _pool
+
+
+def evaluate_many(requests: Sequence[Tuple[str, Iterable[Dict[str, Any]]]], specs: Sequence[str],
+                  processes: Optional[int] = None,
+                  cache: Optional[RunCache] = RUN_CACHE) -> List[List[Dict[str, float]]]:
+    """`evaluate` for several models at once, sharing one round of work on the pool.
+
+    Args:
+        requests: (model_path, param_rows) pairs.
+        specs, processes, cache: As for `evaluate`.
+
+    Returns:
+        One list of reduced outputs per request, in order.
+    """
+    requests = [(path, list(param_rows)) for path, param_rows in requests]
+    results: List[List[Optional[Dict[str, float]]]] = [
+        [cache.get(path, params, specs) if cache is not None else None for params in param_rows]
+        for path, param_rows in requests
+    ]
+    # Distinct runs still to simulate, each with the (request, row) positions waiting for it.
+    missing: Dict[Tuple, List[Tuple[int, int]]] = {}
+    todo: List[Tuple[str, Dict[str, Any]]] = []
+    for r, (path, param_rows) in enumerate(requests):
+        for i, params in enumerate(param_rows):
+            if results[r][i] is None:
+                key = RunCache.key(path, params, "")
+                if key not in missing:
+                    missing[key] = []
+                    todo.append((path, params))
+                missing[key].append((r, i))
+
+    from .distributed import get_broker
+
+    processes = processes or default_processes()
+    broker = get_broker() if len(todo) > 1 else None
+    if len(todo) > 1:
+        translate_models(path for path, _ in todo)
+    if broker is not None and broker.workers:
+        computed = broker.run(todo, specs)
+    elif processes == 1 or len(todo) <= 1:
+        computed = [simulate(path, params, specs) for path, params in todo]
+    else:
+        pool = get_pool(processes)
+        batch_size = max(1, -(-len(todo) // (4 * processes)))
+        # Batches hold consecutive runs of a single model, so outputs come back in `todo` order.
+        batches: List[Tuple[str, List[Dict[str, Any]]]] = []
+        for path, params in todo:
+            if not batches or batches[-1][0] != path or len(batches[-1][1]) == batch_size:
+                batches.append((path, []))
+            batches[-1][1].append(params)
+        futures = [pool.submit(_simulate_batch, path, batch, specs) for path, batch in batches]
+        computed = [outputs for future in futures for outputs in future.result()]
+
+    for positions, (path, params), outputs in zip(missing.values(), todo, computed):
+        if cache is not None:
+            cache.put(path, params, outputs)
+        for r, i in positions:
+            results[r][i] = outputs
+    return results
+
+
+def evaluate(model_path: str, param_rows: Iterable[Dict[str, Any]], specs: Sequence[str],
+             processes: Optional[int] = None, cache: Optional[RunCache] = RUN_CACHE) -> List[Dict[str, float]]:
+    """Reduced outputs for each parameter set, simulating only the ones not already cached.
+
+    Args:
+        model_path: The model to run.
+        param_rows: One params dict per run.
+        specs: Output specs such as "final:Tenure" or "max:Infected".
+        processes: Worker processes; 1 runs everything in this process.
+        cache: Where completed runs are looked up and stored. None disables caching.
+    """
+    return evaluate_many([(model_path, param_rows)], specs, processes, cache)[0]
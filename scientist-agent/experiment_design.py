@@ -0,0 +1,133 @@
+"""Search for the experiment that best discriminates between rival models.
+
+Given N candidate models of the same system and a bounded space of policy
+levers, `find_discriminating_experiment` looks for the intervention whose
+predicted outcome differs most between the models, which is the experiment
+worth running in the real world to tell the theories apart.
+
+The search is Bayesian-optimization style: a Latin hypercube of policies is
+simulated first, then each iteration fits a Gaussian process to the observed
+divergence and simulates the batch of policies with the highest expected
+improvement. Each batch is run for every model in parallel through
+`ensembles.evaluate_many`, whose cache makes repeated policies free.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .ensembles import RUN_CACHE, evaluate_many
+from .sampling import Bounds, latin_hypercube, rows, scale_unit_samples
+
+logger = logging.getLogger(__name__)
+
+
+def divergence(predictions: np.ndarray, metric: str = "range") -> np.ndarray:
+    """How much the models disagree, from an (n_policies, n_models) array of predictions.
+
+    Metrics: "range" (max - min across models), "std" (standard deviation across models).
+    """
+    if metric == "range":
+        return predictions.max(axis=1) - predictions.min(axis=1)
+    if metric == "std":
+        return predictions.std(axis=1)
+    raise ValueError(f"Unknown divergence metric {metric!r}. Use 'range' or 'std'.")
+
+
+def _expected_improvement(mean: np.ndarray, std: np.ndarray, best: float, xi: float = 0.01) -> np.ndarray:
+    from scipy.stats import norm
+
+    std = np.maximum(std, 1e-12)
+    z = (mean - best - xi) / std
+    return (mean - best - xi) * norm.cdf(z) + std * norm.pdf(z)
+
+
+def _select_batch(candidates: np.ndarray, scores: np.ndarray, batch_size: int, min_distance: float) -> np.ndarray:
+    """Highest-scoring candidates, skipping ones too close to an already chosen point."""
+    chosen: List[int] = []
+    for i in np.argsort(-scores):
+        if all(np.linalg.norm(candidates[i] - candidates[j]) >= min_distance for j in chosen):
+            chosen.append(i)
+        if len(chosen) == batch_size:
+            break
+    return candidates[chosen]
+
+
+def find_discriminating_experiment(model_paths: Sequence[str], policy_bounds: Bounds, output: str,
+                                   baseline: Optional[Dict[str, float]] = None, metric: str = "range",
+                                   n_initial: int = 12, iterations: int = 5, batch_size: int = 4,
+                                   n_candidates: int = 2000, processes: Optional[int] = None,
+                                   seed: Optional[int] = 0) -> Dict[str, Any]:
+    """Find the policy that maximizes the divergence between the models' predictions of `output`.
+
+    Args:
+        model_paths: Two or more candidate models sharing the policy levers and the output variable.
+        policy_bounds: (low, high) for every policy lever, e.g. {"Startup Subsidy": (0, 1)}.
+        output: Output spec, e.g. "final:Tenure".
+        baseline: If given, each model's prediction is divided by its own prediction under
+            this policy, so models are compared on relative improvement (as in
+            `Designing_Experiments.ipynb`).
+        metric: Divergence metric, see `divergence`.
+        n_initial: Size of the initial Latin hypercube.
+        iterations, batch_size: Number of optimization rounds and policies simulated per round.
+        n_candidates: Random policies scored by the acquisition function each round.
+        processes: Worker processes for the simulations.
+
+    Returns:
+        dict with the `best` policy, its `divergence` and per-model `predictions`,
+        plus the full `history` of evaluated policies and the number of runs simulated.
+    """
+    if len(model_paths) < 2:
+        raise ValueError("At least two candidate models are needed to discriminate between them.")
+    from sklearn.gaussian_process import GaussianProcessRegressor
+    from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+
+    rng = np.random.default_rng(seed)
+    names = list(policy_bounds)
+    cached_before = len(RUN_CACHE)
+    baseline_values = None
+    if baseline is not None:
+        baseline_values = np.array([runs[0][output] for runs in evaluate_many(
+            [(path, [baseline]) for path in model_paths], [output], processes=processes)])
+
+    def observe(policies: List[Dict[str, float]]) -> np.ndarray:
+        runs = evaluate_many([(path, policies) for path in model_paths], [output], processes=processes)
+        predictions = np.array([[r[output] for r in model_runs] for model_runs in runs]).T
+        return predictions / baseline_values if baseline_values is not None else predictions
+
+    policies = rows(latin_hypercube(policy_bounds, n_initial, seed))
+    predictions = observe(policies)
+
+    low = np.array([policy_bounds[n][0] for n in names], dtype=float)
+    span = np.array([policy_bounds[n][1] - policy_bounds[n][0] for n in names], dtype=float)
+    span[span == 0] = 1.0
+    for iteration in range(iterations):
+        X = (np.array([[p[n] for n in names] for p in policies]) - low) / span
+        y = divergence(predictions, metric)
+        kernel = ConstantKernel() * Matern(length_scale=np.full(len(names), 0.3), length_scale_bounds=(0.02, 10.0),
+                                           nu=2.5) + WhiteKernel(1e-6, (1e-10, 1e-1))
+        gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, random_state=0).fit(X, y)
+
+        candidates = rng.random((n_candidates, len(names)))
+        mean, std = gp.predict(candidates, return_std=True)
+        batch = _select_batch(candidates, _expected_improvement(mean, std, y.max()), batch_size,
+                              min_distance=0.05 * np.sqrt(len(names)))
+        new_policies = [dict(zip(names, map(float, row))) for row in scale_unit_samples(batch, policy_bounds)]
+        logger.info(f"Experiment design iteration {iteration + 1}/{iterations}: best divergence {y.max():.4g}")
+        policies += new_policies
+        predictions = np.vstack([predictions, observe(new_policies)])
+
+    scores = divergence(predictions, metric)
+    best = int(np.argmax(scores))
+    return {
+        "output": output,
+        "metric": metric,
+        "best": policies[best],
+        "divergence": float(scores[best]),
+        "predictions": dict(zip(model_paths, map(float, predictions[best]))),
+        "history": [
+            {"policy": p, "divergence": float(d), "predictions": list(map(float, pred))}
+            for p, d, pred in zip(policies, scores, predictions)
+        ],
+        "runs_simulated": len(RUN_CACHE) - cached_before,
+    }
@@ -0,0 +1,297 @@
+"""Background jobs: long sweeps and fits that run while the agent keeps talking.
+
+A tool call blocks its agent turn, so a 100k-run ensemble or a long fit run
+through `execute_python_code_snippet` holds the conversation (and the HTTP
+request) until it finishes. `JobQueue.submit` returns a job id at once and
+runs the job later:
+
+* jobs wait in a priority queue (higher priority first, then in submission
+  order) and run on a fixed number of worker slots;
+* each session may have only a few jobs queued or running at a time;
+* every job runs in its own forked process group, so cancelling a running
+  job kills it together with any worker pool it started;
+* the job's record and result are written to `<cache>/jobs/<id>.json`, so
+  results outlive the server. Jobs that were still pending when the server
+  stopped are reported as interrupted.
+
+The job's function gets a `progress(done, total)` callback, reported by
+`status`.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .settings import CACHE_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIRECTORY = os.path.join(CACHE_DIRECTORY, "jobs")
+PENDING = ("queued", "running")
+
+
+def default_workers() -> int:
+    return int(os.environ.get("SCIENTIST_AGENT_JOB_WORKERS", 1))
+
+
+def default_session_quota() -> int:
+    return int(os.environ.get("SCIENTIST_AGENT_JOB_QUOTA", 4))
+
+
+class Job:
+    """One submitted job and its state. The result itself is only kept on disk."""
+
+    def __init__(self, job_id: str, session: str, kind: str, description: str, priority: int):
+        self.id = job_id
+        self.session = session
+        self.kind = kind
+        self.description = description
+        self.priority = priority
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.progress: Optional[List[int]] = None
+        self.error: Optional[str] = None
+        self.process: Optional[multiprocessing.Process] = None
+
+    def record(self) -> Dict[str, Any]:
+        """The job's state, as persisted and reported by `get_job_status`."""
+        record = {key: getattr(self, key) for key in ("id", "session", "kind", "description", "priority", "status",
+                                                      "submitted", "started", "finished", "progress", "error")}
+        end = self.finished or time.time()
+        record["seconds"] = end - self.started if self.started else 0.0
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Job":
+        job = cls(record["id"], record["session"], record["kind"], record["description"], record["priority"])
+        for key in ("status", "submitted", "started", "finished", "progress", "error"):
+            setattr(job, key, record.get(key))
+        return job
+
+
+def _run_in_child(conn, target: Callable, args: Sequence[Any]) -> None:
+    # Own process group, so cancelling kills any worker processes the job starts too.
+    os.setsid()
+
+    def progress(done: int, total: int) -> None:
+        conn.send(("progress", [int(done), int(total)]))
+
+    try:
+        conn.send(("done", target(*args, progress=progress)))
+    except BaseException as e:
+        conn.send(("failed", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """A priority queue of jobs run in child processes by a fixed number of worker threads."""
+
+    def __init__(self, workers: Optional[int] = None, session_quota: Optional[int] = None,
+                 directory: str = JOBS_DIRECTORY):
+        self.workers = workers or default_workers()
+        self.session_quota = session_quota or default_session_quota()
+        self.directory = directory
+        self.jobs: Dict[str, Job] = {}
+        self._queue: List[Job] = []
+        self._tasks: Dict[str, tuple] = {}
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._load()
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _load(self) -> None:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    job = Job.from_record(json.load(f)["job"])
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.status in PENDING:
+                job.status, job.error = "failed", "Interrupted: the server stopped before the job finished."
+                self._save(job)
+            self.jobs[job.id] = job
+
+    def _save(self, job: Job, result: Any = None) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(job.id)
+            saved = {"job": job.record()}
+            if result is not None:
+                saved["result"] = result
+            with open(path + ".tmp", "w") as f:
+                json.dump(saved, f)
+            os.replace(path + ".tmp", path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not persist job {job.id}: {e}")
+
+    def submit(self, session: str, kind: str, description: str, target: Callable, args: Sequence[Any] = (),
+               priority: int = 0, on_done: Optional[Callable[[Any], None]] = None) -> Job:
+        """Queue `target(*args, progress=...)` to run in a child process.
+
+        Args:
+            session: Who the job belongs to, for quotas.
+            kind, description: Shown in the job's status.
+            target: Runs in a forked process. Its return value must be picklable and JSON-serializable.
+            priority: Higher runs first.
+            on_done: Called in this process with the result once the job succeeded.
+
+        Raises:
+            ValueError: If the session already has `session_quota` jobs queued or running.
+        """
+        with self._condition:
+            active = sum(job.session == session and job.status in PENDING for job in self.jobs.values())
+            if active >= self.session_quota:
+                raise ValueError(f"This session already has {active} jobs queued or running (the limit is "
+                                 f"{self.session_quota}). Wait for one to finish or cancel one.")
+            job = Job(uuid.uuid4().hex[:12], session, kind, description, priority)
+            self.jobs[job.id] = job
+            self._tasks[job.id] = (target, tuple(args), on_done)
+            self._queue.append(job)
+            self._save(job)
+            self._start_workers()
+            self._condition.notify()
+        return job
+
+    def _start_workers(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next(self) -> Job:
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            job = max(self._queue, key=lambda j: (j.priority, -j.submitted))
+            self._queue.remove(job)
+            job.status, job.started = "running", time.time()
+            self._save(job)
+            return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._next()
+            target, args, on_done = self._tasks.pop(job.id)
+            result = self._run(job, target, args)
+            with self._condition:
+                if job.status == "running":
+                    job.status = "done" if job.error is None else "failed"
+                job.finished = time.time()
+                self._save(job, result if job.status == "done" else None)
+            if job.status == "done" and on_done is not None:
+                try:
+                    on_done(result)
+                except Exception as e:
+                    logger.warning(f"Post-processing job {job.id} failed: {e}")
+
+    def _run(self, job: Job, target: Callable, args: Sequence[Any]) -> Any:
+        parent, child = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.get_context("fork").Process(target=_run_in_child, args=(child, target, args),
+                                                               daemon=False)
+        with self._condition:
+            if job.status == "cancelled":
+                return None
+            process.start()
+            job.process = process
+        child.close()
+        result = None
+        outcome = None
+        while outcome is None:
+            try:
+                if not parent.poll(0.5):
+                    if not process.is_alive() and not parent.poll(0):
+                        break
+                    continue
+                message = parent.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "progress":
+                job.progress = message[1]
+            else:
+                outcome = message
+        process.join()
+        parent.close()
+        job.process = None
+        if outcome is not None and outcome[0] == "done":
+            result = outcome[1]
+        elif outcome is not None:
+            job.error = outcome[1]
+        elif job.status != "cancelled":
+            job.error = f"The job's process exited with code {process.exitcode}."
+        return result
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        job = self._get(job_id)
+        record = job.record()
+        if job.status == "queued":
+            with self._condition:
+                ahead = [j for j in self._queue if (j.priority, -j.submitted) > (job.priority, -job.submitted)]
+            record["queue_position"] = len(ahead) + 1
+        return record
+
+    def result(self, job_id: str) -> Any:
+        """The result of a finished job, read back from disk."""
+        job = self._get(job_id)
+        if job.status != "done":
+            raise ValueError(f"Job {job_id} is {job.status}" + (f": {job.error}" if job.error else "."))
+        with open(self._path(job_id)) as f:
+            return json.load(f).get("result")
+
+    def cancel(self, job_id: str) -> Job:
+        """Remove a queued job, or kill a running one with its whole process group."""
+        job = self._get(job_id)
+        with self._condition:
+            if job.status not in PENDING:
+                return job
+            if job.status == "queued":
+                self._queue.remove(job)
+                self._tasks.pop(job.id, None)
+            job.status, job.finished = "cancelled", time.time()
+            self._save(job)
+            process = job.process
+        if process is not None and process.pid:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                process.terminate()
+        return job
+
+    def list(self, session: Optional[str] = None) -> List[Dict[str, Any]]:
+        jobs = [job for job in self.jobs.values() if session is None or job.session == session]
+        return [job.record() for job in sorted(jobs, key=lambda j: j.submitted)]
+
+    def _get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"There is no job {job_id!r}.")
+        return job
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """The job queue shared by all tool calls."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,359 @@
+"""Lightweight, dependency-free parsing of Vensim (.mdl) and XMILE model files.
+
+This does not translate models; it only extracts what the agent needs to know
+about a model without loading it in pysd: variable names and kinds (stock,
+flow, constant, ...), equations, units, comments, references between
+variables, subscript ranges and the simulation time bounds.
+"""
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MODEL_SUFFIXES = (".mdl", ".xmile")
+
+CONTROL_VARIABLES = {
+    "initial time": "initial_time",
+    "final time": "final_time",
+    "time step": "time_step",
+    "saveper": "saveper",
+}
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_NUMBER_LIST_RE = re.compile(rf"^\s*{_NUMBER}(?:\s*[,;]\s*{_NUMBER})*\s*[,;]?\s*$")
+_TOKEN_SPLIT_RE = re.compile(r"[+\-*/^(),\[\]<>=!;:{}]")
+_SUBSCRIPT_RE = re.compile(r"\[[^\]]*\]")
+
+
+def normalize_name(name: str) -> str:
+    """Vensim names are case-insensitive and treat spaces and underscores alike."""
+    return re.sub(r"[\s_]+", " ", name.strip().strip('"')).strip().lower()
+
+
+def _split_top_level(expression: str, separators: str = ",") -> List[str]:
+    """Split `expression` on separators that are not nested in brackets."""
+    parts, depth, current = [], 0, []
+    for char in expression:
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        if char in separators and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _function_arguments(expression: str, function: str) -> Optional[List[str]]:
+    """Return the top-level arguments of the first call to `function` in `expression`."""
+    match = re.search(rf"\b{function}\s*\(", expression, flags=re.IGNORECASE)
+    if not match:
+        return None
+    depth, start = 0, match.end() - 1
+    for i in range(start, len(expression)):
+        if expression[i] == "(":
+            depth += 1
+        elif expression[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return [a.strip() for a in _split_top_level(expression[start + 1:i])]
+    return None
+
+
+def _signed_terms(expression: str) -> List[tuple]:
+    """Split a rate expression into (sign, term) pairs at top-level + and -."""
+    terms, depth, sign, current = [], 0, 1, []
+    for i, char in enumerate(expression):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        exponent = i > 0 and expression[i - 1] in "eE" and i > 1 and expression[i - 2].isdigit()
+        if char in "+-" and depth == 0 and not exponent:
+            if "".join(current).strip():
+                terms.append((sign, "".join(current)))
+                sign = 1
+            current = []
+            sign = -sign if char == "-" else sign
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        terms.append((sign, "".join(current)))
+    return terms
+
+
+def _references(expression: str, known: Dict[str, str]) -> List[str]:
+    """Names of known variables that appear in `expression`, in order of appearance."""
+    found = []
+    for token in _TOKEN_SPLIT_RE.split(expression):
+        name = known.get(normalize_name(token))
+        if name and name not in found:
+            found.append(name)
+    return found
+
+
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _number(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _split_units(units: str) -> Dict[str, Optional[str]]:
+    match = re.match(r"^(.*?)\s*(\[[^\]]*\])?\s*$", units)
+    return {"units": match.group(1) or None, "limits": match.group(2)}
+
+
+def parse_vensim(text: str) -> Dict[str, Any]:
+    """Parse the equation section of a Vensim .mdl file."""
+    text = text.split("\\\\\\---///", 1)[0]
+    text = re.sub(r"^\s*\{UTF-8\}", "", text)
+    text = re.sub(r"\\\s*\n\s*", "", text)
+
+    variables, subscripts, group = [], {}, None
+    for block in text.split("|"):
+        if not block.strip():
+            continue
+        fields = block.split("~")
+        definition = fields[0].strip()
+        units = _clean(fields[1]) if len(fields) > 1 else ""
+        comment = _clean(fields[2]) if len(fields) > 2 else ""
+
+        if definition.startswith("*"):
+            group = comment or _clean(definition.strip("*"))
+            group_name = re.search(r"\.(\w[\w ]*)", definition)
+            group = group_name.group(1).strip() if group_name else group
+            continue
+        if definition.startswith(":MACRO:") or definition.startswith(":END OF MACRO:"):
+            continue
+
+        range_match = re.match(r"^([^=(\[]+?)\s*:(?!=)\s*(.*)$", definition, flags=re.S)
+        if range_match and "=" not in definition:
+            subscripts[_clean(range_match.group(1))] = [
+                _clean(v) for v in range_match.group(2).split(",") if v.strip()
+            ]
+            continue
+
+        assignment = re.match(r"^(.*?)\s*(:=|==|=)\s*(.*)$", definition, flags=re.S)
+        if assignment:
+            lhs, operator, rhs = assignment.group(1), assignment.group(2), _clean(assignment.group(3))
+        else:
+            # Standalone lookup definitions: `name( [(x0,y0)-(x1,y1)], (x,y), ... )`
+            lookup = re.match(r"^([^(]+)\((.*)\)\s*$", definition, flags=re.S)
+            if not lookup:
+                continue
+            lhs, operator, rhs = lookup.group(1), "(", _clean(lookup.group(2))
+
+        subscript_match = re.search(r"\[([^\]]*)\]", lhs)
+        variables.append({
+            "name": _clean(_SUBSCRIPT_RE.sub("", lhs)),
+            "subscripts": [_clean(s) for s in subscript_match.group(1).split(",")] if subscript_match else [],
+            "equation": rhs,
+            "operator": operator,
+            "doc": comment,
+            "group": group,
+            **_split_units(units),
+        })
+
+    return _classify(variables, subscripts, "vensim")
+
+
+def parse_xmile(text: str) -> Dict[str, Any]:
+    """Parse an XMILE file's sim specs and variable definitions."""
+    root = ET.fromstring(text)
+
+    def local(tag):
+        return tag.rsplit("}", 1)[-1]
+
+    def child_text(element, name):
+        for child in element:
+            if local(child.tag) == name:
+                return _clean(child.text or "")
+        return ""
+
+    variables, subscripts, time = [], {}, {}
+    for element in root.iter():
+        tag = local(element.tag)
+        if tag == "sim_specs":
+            time["units"] = element.get("time_units")
+            for child in element:
+                key = {"start": "initial_time", "stop": "final_time", "dt": "time_step",
+                       "savestep": "saveper"}.get(local(child.tag))
+                if key:
+                    value = _number(child.text)
+                    if key == "time_step" and child.get("reciprocal") == "true" and value:
+                        value = 1 / value
+                    time[key] = value
+        elif tag == "dim":
+            subscripts[element.get("name")] = [e.get("name") for e in element if local(e.tag) == "elem"]
+        elif tag in ("stock", "flow", "aux", "gf") and element.get("name"):
+            equation = child_text(element, "eqn")
+            variables.append({
+                "name": _clean(element.get("name").replace("\\n", " ")),
+                "subscripts": [d.get("name") for e in element if local(e.tag) == "dimensions" for d in e],
+                "equation": equation,
+                "operator": "=",
+                "doc": child_text(element, "doc"),
+                "group": None,
+                "units": child_text(element, "units") or None,
+                "limits": None,
+                "xmile_type": tag,
+                "inflows": [_clean(e.text or "") for e in element if local(e.tag) == "inflow"],
+                "outflows": [_clean(e.text or "") for e in element if local(e.tag) == "outflow"],
+            })
+
+    parsed = _classify(variables, subscripts, "xmile")
+    parsed["time"].update({k: v for k, v in time.items() if v is not None})
+    return parsed
+
+
+def _classify(variables: List[Dict[str, Any]], subscripts: Dict[str, List[str]], fmt: str) -> Dict[str, Any]:
+    """Assign a kind and references to every variable and collect time bounds."""
+    known = {normalize_name(v["name"]): v["name"] for v in variables}
+    by_name = {v["name"]: v for v in variables}
+    time: Dict[str, Any] = {}
+
+    for var in variables:
+        equation, key = var["equation"], normalize_name(var["name"])
+        var["references"] = [r for r in _references(equation, known) if r != var["name"]]
+        var["function"] = None
+        call = re.match(r"^\s*([A-Z][A-Z0-9 _]*?)\s*\(", equation)
+        if call:
+            var["function"] = _clean(call.group(1))
+
+        if key in CONTROL_VARIABLES:
+            var["kind"] = "control"
+            value = _number(equation)
+            time[CONTROL_VARIABLES[key]] = value if value is not None else equation
+            if key == "final time" and var["units"]:
+                time["units"] = var["units"]
+        elif var.get("xmile_type") == "stock" or (fmt == "vensim" and var["function"] == "INTEG"):
+            var["kind"] = "stock"
+        elif var.get("xmile_type") == "gf" or var["operator"] == "(" or "WITH LOOKUP" in equation.upper():
+            var["kind"] = "lookup"
+        elif var["operator"] == ":=":
+            var["kind"] = "data"
+        elif var["function"] == "A FUNCTION OF":
+            var["kind"] = "undefined"
+        elif _NUMBER_LIST_RE.match(equation):
+            var["kind"] = "constant"
+            var["value"] = _number(equation)
+        else:
+            var["kind"] = "auxiliary"
+
+    for var in variables:
+        if var["kind"] != "stock":
+            continue
+        if fmt == "vensim":
+            arguments = _function_arguments(var["equation"], "INTEG") or [""]
+            rate, initial = arguments[0], arguments[1] if len(arguments) > 1 else ""
+            var["initial_value"] = _number(initial) if _number(initial) is not None else initial
+            inflows, outflows = [], []
+            for sign, term in _signed_terms(rate):
+                names = [n for n in _references(term, known) if by_name[n]["kind"] not in ("constant", "stock")]
+                (outflows if sign < 0 else inflows).extend(n for n in names if n not in inflows + outflows)
+            var["inflows"], var["outflows"] = inflows, outflows
+        else:
+            var["initial_value"] = _number(var["equation"]) if _number(var["equation"]) is not None else var["equation"]
+        for flow in var["inflows"] + var["outflows"]:
+            if flow in by_name and by_name[flow]["kind"] == "auxiliary":
+                by_name[flow]["kind"] = "flow"
+
+    for var in variables:
+        if var.get("xmile_type") == "flow":
+            var["kind"] = "flow"
+        var.pop("xmile_type", None)
+        if var["kind"] != "stock":
+            var.pop("inflows", None)
+            var.pop("outflows", None)
+
+    return {"format": fmt, "variables": variables, "subscripts": subscripts, "time": time}
+
+
+def parse_model_file(path: str) -> Dict[str, Any]:
+    """Parse a .mdl or .xmile file into variables, subscripts and time bounds."""
+    path = Path(path)
+    text = path.read_text(encoding="utf-8", errors="replace")
+    if path.suffix.lower() == ".mdl":
+        return parse_vensim(text)
+    if path.suffix.lower() == ".xmile":
+        return parse_xmile(text)
+    raise ValueError(f"Unsupported model file {path}. Supported suffixes: {MODEL_SUFFIXES}")
+
+
+def parse_translated_module(path: str) -> Dict[str, Any]:
+    """Read the component metadata of a pysd-translated Python module without importing it.
+
+    Translated modules declare each variable with `@component.add(name=..., units=...,
+    comp_type=..., depends_on={...}, other_deps={...})`. Stateful components depend on
+    private objects (e.g. `_integ_stock`) whose own dependencies live in `other_deps`;
+    those are folded into the public component so the result only has model variables.
+
+    Returns:
+        A dict with `variables` (py_name, name, units, kind, subtype, doc, equation,
+        depends_on) and `namespace` mapping real names to py_names.
+    """
+    import ast
+
+    source = Path(path).read_text(encoding="utf-8")
+    tree = ast.parse(source)
+    stateful_sources = {
+        target.id: ast.get_source_segment(source, node)
+        for node in tree.body if isinstance(node, ast.Assign)
+        for target in node.targets if isinstance(target, ast.Name) and target.id.startswith("_")
+    }
+
+    variables = []
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        decorator = next((d for d in node.decorator_list if isinstance(d, ast.Call)
+                          and ast.get_source_segment(source, d.func) == "component.add"), None)
+        if decorator is None:
+            continue
+        meta = {}
+        for keyword in decorator.keywords:
+            try:
+                meta[keyword.arg] = ast.literal_eval(keyword.value)
+            except ValueError:
+                meta[keyword.arg] = ast.get_source_segment(source, keyword.value)
+
+        depends_on = {}
+        for dependency in meta.get("depends_on") or {}:
+            if dependency.startswith("_") and dependency in (meta.get("other_deps") or {}):
+                for stage in meta["other_deps"][dependency].values():
+                    depends_on.update({k: v for k, v in stage.items() if not k.startswith("_")})
+            elif dependency.startswith("_"):
+                continue
+            else:
+                depends_on[dependency] = meta["depends_on"][dependency]
+
+        body = [s for s in node.body if not (isinstance(s, ast.Expr) and isinstance(s.value, ast.Constant))]
+        equation = "\n".join(ast.get_source_segment(source, s) for s in body)
+        private = re.fullmatch(r"return (_\w+)\(\)", equation.strip())
+        if private and private.group(1) in stateful_sources:
+            equation = stateful_sources[private.group(1)]
+
+        variables.append({
+            "py_name": node.name,
+            "name": meta.get("name", node.name),
+            "units": meta.get("units"),
+            "kind": meta.get("comp_type"),
+            "subtype": meta.get("comp_subtype"),
+            "subscripts": meta.get("subscripts"),
+            "doc": _clean(ast.get_docstring(node) or ""),
+            "equation": equation,
+            "depends_on": depends_on,
+        })
+
+    return {
+        "variables": variables,
+        "namespace": {v["name"]: v["py_name"] for v in variables},
+    }
@@ -0,0 +1,286 @@
+"""Opt-in per-tool-call instrumentation for the agent's tools.
+
+Instrumentation is off unless ``SCIENTIST_AGENT_PROFILE_LOG`` points at a file.
+When enabled, every tool wrapped by `instrument_tools` appends one JSON line per
+call to that file with wall time, CPU time, peak RSS, the number of `model.run`
+invocations, the number of timesteps integrated and the models involved.
+
+Optional settings:
+    SCIENTIST_AGENT_PROFILE_THRESHOLD: seconds. Calls slower than this also get
+        a profile written next to the log (cProfile `.prof`, or pyinstrument
+        `.html` when SCIENTIST_AGENT_PROFILER=pyinstrument and it is installed).
+    SCIENTIST_AGENT_PROFILE_DIR: where to write those profiles.
+
+The log can be aggregated by tool and model with:
+    python scientist-agent/profiling.py summarize path/to/profile.jsonl
+"""
+import contextvars
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_LOG_ENV = "SCIENTIST_AGENT_PROFILE_LOG"
+PROFILE_THRESHOLD_ENV = "SCIENTIST_AGENT_PROFILE_THRESHOLD"
+PROFILE_DIR_ENV = "SCIENTIST_AGENT_PROFILE_DIR"
+PROFILER_ENV = "SCIENTIST_AGENT_PROFILER"
+
+_current_call: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "scientist_agent_tool_call", default=None
+)
+_write_lock = threading.Lock()
+_pysd_hooks_installed = False
+
+
+def profiling_enabled() -> bool:
+    """Whether tool-call instrumentation has been switched on."""
+    return bool(os.environ.get(PROFILE_LOG_ENV))
+
+
+def _profile_threshold() -> Optional[float]:
+    value = os.environ.get(PROFILE_THRESHOLD_ENV)
+    return float(value) if value else None
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's high-water mark so peak RSS can be measured per call."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Linux reports ru_maxrss in kilobytes; it is the process-lifetime peak.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def install_pysd_hooks() -> None:
+    """Count `model.run` calls and integration steps made during a tool call.
+
+    pysd is only patched once it has been imported by someone else, so enabling
+    profiling never forces the import on its own. Code that imports pysd lazily
+    calls this right after the import.
+    """
+    global _pysd_hooks_installed
+    if _pysd_hooks_installed or "pysd" not in sys.modules:
+        return
+    from pysd.py_backend.model import Model
+
+    original_run = Model.run
+    original_euler_step = Model._euler_step
+
+    @functools.wraps(original_run)
+    def run(self, *args, **kwargs):
+        stats = _current_call.get()
+        if stats is not None:
+            stats["model_runs"] += 1
+            stats["models"].add(os.path.basename(str(getattr(self, "py_model_file", "?"))))
+        return original_run(self, *args, **kwargs)
+
+    @functools.wraps(original_euler_step)
+    def _euler_step(self, *args, **kwargs):
+        stats = _current_call.get()
+        if stats is not None:
+            stats["timesteps"] += 1
+        return original_euler_step(self, *args, **kwargs)
+
+    Model.run = run
+    Model._euler_step = _euler_step
+    _pysd_hooks_installed = True
+
+
+def _start_profiler():
+    if _profile_threshold() is None:
+        return None
+    if os.environ.get(PROFILER_ENV) == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            return profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed, falling back to cProfile.")
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active (e.g. a concurrent tool call).
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler, tool_name: str, wall_s: float) -> Optional[str]:
+    if profiler is None:
+        return None
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+    if wall_s < _profile_threshold():
+        return None
+
+    log_path = os.environ[PROFILE_LOG_ENV]
+    out_dir = os.environ.get(PROFILE_DIR_ENV) or os.path.dirname(os.path.abspath(log_path))
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.join(out_dir, f"{tool_name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    if isinstance(profiler, cProfile.Profile):
+        path = stem + ".prof"
+        profiler.dump_stats(path)
+    else:
+        path = stem + ".html"
+        with open(path, "w") as f:
+            f.write(profiler.output_html())
+    return path
+
+
+def _begin(tool_name: str) -> Dict[str, Any]:
+    install_pysd_hooks()
+    stats = {
+        "tool": tool_name,
+        "model_runs": 0,
+        "timesteps": 0,
+        "models": set(),
+        "rss_reset": _reset_peak_rss(),
+        "token": None,
+        "profiler": None,
+    }
+    stats["token"] = _current_call.set(stats)
+    stats["profiler"] = _start_profiler()
+    stats["wall_start"] = time.perf_counter()
+    stats["cpu_start"] = time.process_time()
+    return stats
+
+
+def _finish(stats: Dict[str, Any], error: Optional[BaseException]) -> None:
+    wall_s = time.perf_counter() - stats["wall_start"]
+    cpu_s = time.process_time() - stats["cpu_start"]
+    _current_call.reset(stats["token"])
+    profile_path = _stop_profiler(stats["profiler"], stats["tool"], wall_s)
+
+    record = {
+        "ts": time.time(),
+        "tool": stats["tool"],
+        "status": "error" if error else "success",
+        "error": repr(error) if error else None,
+        "wall_s": round(wall_s, 6),
+        "cpu_s": round(cpu_s, 6),
+        "peak_rss_kb": _peak_rss_kb(),
+        "peak_rss_is_per_call": stats["rss_reset"],
+        "model_runs": stats["model_runs"],
+        "timesteps": stats["timesteps"],
+        "models": sorted(stats["models"]),
+        "profile": profile_path,
+    }
+    try:
+        with _write_lock, open(os.environ[PROFILE_LOG_ENV], "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write tool profile record: {e}")
+
+
+def instrument_tool(func: Callable) -> Callable:
+    """Wrap a single tool function so each call is measured and logged.
+
+    The wrapper keeps the original name, docstring and signature so ADK builds
+    the same function declaration for it.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            stats = _begin(func.__name__)
+            error = None
+            try:
+                return await func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _finish(stats, error)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _begin(func.__name__)
+        error = None
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _finish(stats, error)
+    return wrapper
+
+
+def instrument_tools(tools: List[Any]) -> List[Any]:
+    """Instrument every plain-function tool in `tools` when profiling is enabled.
+
+    Tool objects (e.g. `load_artifacts`) are passed through untouched. When
+    profiling is disabled the list is returned as is, so there is no overhead.
+    """
+    if not profiling_enabled():
+        return tools
+    logger.info(f"Tool profiling enabled, writing to {os.environ[PROFILE_LOG_ENV]}")
+    return [instrument_tool(t) if inspect.isfunction(t) else t for t in tools]
+
+
+def summarize_profile_log(path: str) -> List[Dict[str, Any]]:
+    """Aggregate a profile log by (tool, model).
+
+    Calls that ran several models are counted once for each of them; calls that
+    ran none are grouped under model "-".
+    """
+    groups: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {
+        "calls": 0, "errors": 0, "wall_s": 0.0, "max_wall_s": 0.0, "cpu_s": 0.0,
+        "max_peak_rss_kb": 0, "model_runs": 0, "timesteps": 0,
+    })
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for model in record.get("models") or ["-"]:
+                g = groups[(record["tool"], model)]
+                g["calls"] += 1
+                g["errors"] += record["status"] != "success"
+                g["wall_s"] += record["wall_s"]
+                g["max_wall_s"] = max(g["max_wall_s"], record["wall_s"])
+                g["cpu_s"] += record["cpu_s"]
+                g["max_peak_rss_kb"] = max(g["max_peak_rss_kb"], record["peak_rss_kb"])
+                g["model_runs"] += record["model_runs"]
+                g["timesteps"] += record["timesteps"]
+
+    summary = []
+    for (tool, model), g in sorted(groups.items(), key=lambda kv: -kv[1]["wall_s"]):
+        summary.append({"tool": tool, "model": model, "mean_wall_s": g["wall_s"] / g["calls"], **g})
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "summarize":
+        sys.exit("usage: python profiling.py summarize <profile.jsonl>")
+    columns = ["tool", "model", "calls", "errors", "wall_s", "mean_wall_s", "max_wall_s",
+               "cpu_s", "max_peak_rss_kb", "model_runs", "timesteps"]
+    print("\t".join(columns))
+    for row in summarize_profile_log(sys.argv[2]):
+        print("\t".join(f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns))
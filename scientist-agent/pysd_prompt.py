@@ -8,11 +8,18 @@ def pysd_expert_instruction():
   
   Before running any code via the execute_python_code_snippet tool, you MUST ALWAYS display the code to the user and ask for confirmation.
   
+  To learn what a model contains (stocks, flows, constants with their values, units, time bounds), use the describe_model tool instead of reading the model file.
+  To find which models contain a variable, use the find_model_variables tool.
+  To find a variable or equation inside a model, use search_model_equations rather than reading the whole model file,
+  and use get_variable_dependencies to see what a variable depends on and what depends on it.
+  
   Pysd can read models in Vensim and XMILE formats.
   ```
   model = pysd.read_vensim("path_to_model.mdl")
   model = pysd.read_xmile("path_to_model.xmile")
   ```
+  After changing a model file with the write_text_file tool, load it with `simulation.load_model("path_to_model.mdl")`:
+  write_text_file already re-translated the changed equations, while pysd.read_vensim would translate the whole model again.
   
   The default behavior of pysd's model.run function is to return the value of all variables as a pandas dataframe
   To load a model and run it with default parameters, you can write code like this:
@@ -68,6 +75,14 @@ def pysd_expert_instruction():
   temp_timeseries = pd.Series(index=range(30), data=range(20,80,2))
   output = model.run(params={'Room Temperature':temp_timeseries}, return_columns=['Teacup Temperature', 'Room Temperature'])
   ```
+  For long input series (e.g. global_emissions.csv, Mauna Loa CO2) or many runs, resample them onto the model's time grid once
+  with `timeseries.grid_params`; the results are identical and each step reads the input by index instead of interpolating:
+  ```
+  params = timeseries.grid_params(model, {'Room Temperature': temp_timeseries})
+  output = model.run(params=params, return_columns=['Teacup Temperature', 'Room Temperature'])
+  ```
+  Pass the same final_time/time_step to grid_params as to model.run. For an ensemble with one series per member,
+  `timeseries.grid_ensemble_params(model, params_list)` stores all members' series in one 2-D array.
   Note that when you set a variable equal to a value, you overwrite the existing formula for that variable. 
   This means that if you assign a value to a variable which is computed based upon other variable values, you will break those links in the causal structure. 
   This can be helpful when you wish to isolate part of a model structure, or perform loop-knockout analysis, but can also lead to mistakes. 
@@ -92,6 +107,23 @@ def pysd_expert_instruction():
   logs += f"Up to {int(peak_value)} individuals are infected at one time."
   ```
   
+  For quick "what if X were v?" questions about summary outputs (peak, final value, time of peak...), use the what_if tool.
+  It answers from a trained emulator with an uncertainty band and only simulates when the emulator is unsure.
+  To find which intervention would best distinguish between competing models of the same system, use the design_discriminating_experiment tool.
+  To design a policy that works well whichever model is right and whatever the uncertain parameters turn out to be, use the find_robust_policy tool.
+  To find which parameters an output is most sensitive to (Sobol indices or Morris screening), use the sensitivity_analysis tool.
+  To find where a system settles (its equilibrium and whether it is stable), use the find_steady_state tool rather than running a long simulation.
+  To compare interventions that only start partway through a run, use the fork_simulation tool: it simulates the shared history once and branches from there.
+  A large DataFrame, Series or array set as `output` comes back as a summary (columns with min, max, final values and peaks, first and last rows),
+  with the full data saved as the artifact `artifact_name`. Prefer computing the numbers you need in the code (e.g. `output = df['Infected'].idxmax()`) over returning whole tables.
+  For computations that would take more than a minute (large ensembles, long sweeps or fits), use submit_simulation_job instead of execute_python_code_snippet.
+  It returns a job id at once; tell the user the job is running, check it with get_job_status, fetch the result with get_job_result, and stop it with cancel_job if asked.
+  To get US Census data, use `census.get_client().fetch_fields('2010/sf1', ['P0120003', 'P0120004'])` rather than pd.read_json on the API:
+  it returns a table indexed by state and county, downloads each request once and answers repeated requests from a local cache.
+  For a function applied to every row of a table (a fit per county, a run per Latin hypercube sample), use `sharedpool.apply_rows(df, func)`
+  instead of `df.apply(func, axis=1)` or a multiprocessing.Pool: it runs in parallel without copying the table to the workers.
+  For model runs over a table of parameter values, `sharedpool.evaluate_table(model_path, samples, ['final:Tenure'])` returns one column per output.
+  
   To identify worst-case scenarios, you need to sweep over the plausible values of a parameter.
   you will need to generate an array of these values, using numpy (imported as np)'s arange function.
   You may have to be creative to ensure that the last value in the array is actually what you want.
@@ -110,6 +142,14 @@ def pysd_expert_instruction():
 
   output = peak_value_list
   ```
+  In large sweeps, skip building a dataframe per run with `simulation.run_lean`, which reduces the outputs while integrating:
+  ```
+  peak_value_list = [simulation.run_lean(model, specs=['max:Infected'], params={'Infectivity': inf})['max:Infected']
+                     for inf in infectivity_values]
+  ```
+  Specs are "<reducer>:<variable>" with reducer final, initial, max, min, mean, argmax, argmin, integral, or crossing@<threshold>
+  (the first time the variable reaches the threshold). `simulation.run_lean(model, return_columns=['Infected'])` instead returns
+  a dict with 'time', 'columns' and a 'values' array, without a dataframe.
   This can then be plotted like:
   ```
   plt.plot(infectivity_values, peak_value_list)
@@ -155,6 +195,35 @@ def pysd_expert_instruction():
   logs += "Phase portrait saved as phase_portrait.png"
   ```
   
+  To replace a model equation with a fitted regressor (a surrogate), do not call `regression.predict` once per timestep.
+  Use the `surrogates` module instead; with `bounds` the regressor is precompiled onto an interpolated lookup grid:
+  ```
+  data = pd.read_csv('source/data/Defects_Synthetic/Manufacturing_Defects_Synthetic_Data.csv')
+  bounds = surrogates.bounds_from_data(data, ['Workday', 'Time per Task'])
+  model = pysd.read_vensim('source/models/Manufacturing_Defects/Defects.mdl')
+  surrogates.substitute_component(model, 'Defect Rate', regression, ['Length of workday', 'Time allocated per unit'], bounds=bounds)
+  output = model.run(return_columns=['Backlog', 'Defect Rate'])
+  ```
+  For an ensemble, `surrogates.run_ensemble_with_surrogate(model_path, params_list, 'Defect Rate', regression, inputs, return_columns, bounds=bounds)`
+  runs all members together and evaluates the surrogate once per timestep for all of them.
+  
+  model.run always uses fixed-step Euler integration. For oscillating, chaotic or stiff models (pendulums, Roessler, predator-prey),
+  use the `integrators` module for an accurate run with far fewer steps; it returns a dataframe like model.run:
+  ```
+  output = integrators.integrate('source/models/Roessler_Chaos/roessler_chaos.mdl', solver='RK45', return_columns=['x', 'y', 'z'])
+  ```
+  Solvers are 'euler', 'rk4', 'RK45', 'DOP853', and 'LSODA', 'Radau' or 'BDF' for stiff models.
+  
+  When running the same scalar model many times (parameter sweeps, calibration loops), compile it once; compiled runs return
+  the same values as model.run, several times faster:
+  ```
+  compiled = compiler.compile_model('source/models/Epidemic/SIR.mdl')
+  output = compiled.run(params={'Infectivity': 0.5}, return_columns=['Infected'])
+  ```
+  Models with subscripts or delays raise compiler.NotCompilable. For subscripted models (e.g. Subscripted Population Model.mdl)
+  use `dense.dense_model(model_path)` instead, which runs on plain NumPy arrays and returns the same flat columns as model.run
+  ('Population[Abington]', ...); if it raises dense.NotCompilable too, use model.run.
+  
   Remember, the execute_python_code_snippet tool does not have access to read_png_file or other tools. 
   So you first need to use execute_python_code_snippet to save the plot as an image file, and then use a separate call to invoke the read_png_file tool.
   Do not try to combine multiple tool operations in a single execute_python_code_snippet call.
@@ -0,0 +1,209 @@
+"""Compact encodings of code results for the model's context.
+
+`execute_python_code_snippet` used to return `str(output)`, so a full
+`model.run()` DataFrame went into the conversation as tens of kilobytes of
+text, re-read by the model on every later turn. `encode` keeps small results
+as they are and replaces large DataFrames, Series and arrays with a summary
+that fits a token budget:
+
+* the shape, the index range and the columns;
+* per numeric column its min, max, initial and final values, where the peak
+  and trough are and whether it only rises or only falls;
+* as many head and tail rows as the budget leaves room for.
+
+The full data is returned alongside as CSV (`.npy` for arrays of more than two
+dimensions), for the tool to save as an artifact. Other large values are cut
+to the budget.
+"""
+import io
+import os
+import uuid
+from typing import Any, List, Optional, Tuple
+
+# Rough size of a token in characters, for budgeting text.
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 1500
+MAX_HEAD_ROWS = 3
+MAX_SHOWN_COLUMNS = 8
+
+
+def default_token_budget() -> int:
+    return int(os.environ.get("SCIENTIST_AGENT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate(text: str, budget: int) -> str:
+    """`text` cut to about `budget` tokens, saying how much was left out."""
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    keep = max(0, limit - 40)
+    return text[:keep] + f"\n... ({len(text) - keep} more characters)"
+
+
+def _number(value: Any) -> str:
+    try:
+        return f"{float(value):.6g}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _column_line(name: Any, values, index) -> str:
+    import numpy as np
+    import pandas as pd
+
+    if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return f"  {name}: {values.dtype}, {values.nunique()} distinct values"
+    finite = values[np.isfinite(values.to_numpy(dtype=float))]
+    if finite.empty:
+        return f"  {name}: no finite values"
+    line = (f"  {name}: min {_number(finite.min())}, max {_number(finite.max())}, "
+            f"initial {_number(values.iloc[0])}, final {_number(values.iloc[-1])}")
+    if finite.is_monotonic_increasing and finite.iloc[-1] != finite.iloc[0]:
+        return line + ", only rises"
+    if finite.is_monotonic_decreasing and finite.iloc[-1] != finite.iloc[0]:
+        return line + ", only falls"
+    # Peaks and troughs inside the range are the events worth reporting.
+    events = []
+    for label, position in (("peak", finite.to_numpy().argmax()), ("trough", finite.to_numpy().argmin())):
+        if 0 < position < len(finite) - 1:
+            events.append(f"{label} at {index.name or 'index'} {_number(finite.index[position])}")
+    return line + (", " + ", ".join(events) if events else "")
+
+
+def _fit_lines(lines: List[str], budget: int, what: str) -> List[str]:
+    kept, used = [], 0
+    for i, line in enumerate(lines):
+        used += estimate_tokens(line + "\n")
+        if used > budget:
+            return kept + [f"  ... and {len(lines) - i} more {what}"]
+        kept.append(line)
+    return kept
+
+
+def summarize_frame(frame, budget: int, artifact: Optional[str] = None) -> str:
+    """A summary of a DataFrame in about `budget` tokens."""
+    import pandas as pd
+
+    rows, columns = frame.shape
+    index = frame.index
+    header = [f"DataFrame with {rows} rows and {columns} columns" + (
+        f", {index.name or 'index'} from {_number(index[0])} to {_number(index[-1])}." if rows else ".")]
+    if artifact:
+        header.append(f"The full data is in the artifact {artifact!r}; load it to see all values.")
+    header.append("Columns:")
+    used = estimate_tokens("\n".join(header))
+    lines, constants, varying = [], [], []
+    # By position: `frame[name]` is a DataFrame when a name repeats (e.g. after `pd.concat`).
+    for j, name in enumerate(frame.columns):
+        values = frame.iloc[:, j]
+        # `notna` first: comparisons with NA in nullable columns are NA, which `all` skips.
+        if len(values) and pd.api.types.is_numeric_dtype(values) and values.notna().all() \
+                and (values == values.iloc[0]).all():
+            constants.append(f"{name} = {_number(values.iloc[0])}")
+        else:
+            lines.append(_column_line(name, values, index))
+            varying.append(j)
+    if constants:
+        lines.append("  Constant: " + ", ".join(constants))
+    # At most half of the budget for the columns, the rest for the rows.
+    column_lines = _fit_lines(lines, (budget - used) // 2, "columns")
+    text = "\n".join(header + column_lines)
+    # The rows show the columns that change; the constant ones are listed above.
+    frame = frame.iloc[:, varying] if varying and constants else frame
+    for n in range(MAX_HEAD_ROWS, 0, -1):
+        if rows <= 2 * n:
+            sample = "Rows:\n" + frame.to_string(max_cols=MAX_SHOWN_COLUMNS)
+        else:
+            sample = (f"First {n} rows:\n{frame.head(n).to_string(max_cols=MAX_SHOWN_COLUMNS)}\n"
+                      f"Last {n} rows:\n{frame.tail(n).to_string(max_cols=MAX_SHOWN_COLUMNS)}")
+        if estimate_tokens(text + "\n" + sample) <= budget:
+            return text + "\n" + sample
+    return text
+
+
+def summarize_array(array, budget: int, artifact: Optional[str] = None) -> str:
+    """A summary of a NumPy array in about `budget` tokens."""
+    import numpy as np
+
+    lines = [f"Array of shape {array.shape} and dtype {array.dtype}."]
+    if artifact:
+        lines.append(f"The full data is in the artifact {artifact!r}; load it to see all values.")
+    if np.issubdtype(array.dtype, np.number) and array.size:
+        finite = array[np.isfinite(array)] if np.issubdtype(array.dtype, np.floating) else array
+        if finite.size:
+            lines.append(f"min {_number(finite.min())}, max {_number(finite.max())}, mean {_number(finite.mean())}")
+    text = "\n".join(lines)
+    for edge in (3, 2, 1):
+        sample = np.array2string(array, threshold=2 * edge, edgeitems=edge, precision=6)
+        if estimate_tokens(text + "\n" + sample) <= budget:
+            return text + "\n" + sample
+    return text
+
+
+def full_data(value: Any) -> Tuple[bytes, str, str]:
+    """The full content of a DataFrame, Series or array as (bytes, mime type, file extension)."""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, np.ndarray) and value.ndim > 2:
+        buffer = io.BytesIO()
+        np.save(buffer, value)
+        return buffer.getvalue(), "application/octet-stream", "npy"
+    if isinstance(value, np.ndarray):
+        value = pd.DataFrame(value if value.ndim == 2 else value.reshape(-1, 1))
+    return value.to_csv().encode(), "text/csv", "csv"
+
+
+def artifact_name(value: Any) -> str:
+    """A fresh artifact name for the full data of `value`, with the extension `full_data` gives it."""
+    import numpy as np
+
+    extension = "npy" if isinstance(value, np.ndarray) and value.ndim > 2 else "csv"
+    return f"output-{uuid.uuid4().hex[:8]}.{extension}"
+
+
+def _printed_in_full(value: Any) -> bool:
+    """Whether `str(value)` shows all of a DataFrame, Series or array, rather than eliding rows with "..."."""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        max_rows, max_columns = pd.get_option("display.max_rows"), pd.get_option("display.max_columns")
+        return ((not max_rows or len(value) <= max_rows)
+                and (isinstance(value, pd.Series) or not max_columns or value.shape[1] <= max_columns))
+    if isinstance(value, np.ndarray):
+        return value.size <= np.get_printoptions()["threshold"]
+    return True
+
+
+def encode(value: Any, budget: Optional[int] = None, artifact: Optional[str] = None) -> Tuple[str, bool]:
+    """The text to return for `value`, within about `budget` tokens.
+
+    Args:
+        value: The result to encode.
+        budget: Token budget (default: `SCIENTIST_AGENT_TOKEN_BUDGET`, 1500 if unset).
+        artifact: Name under which the full data of a DataFrame, Series or array is saved,
+            mentioned in its summary.
+
+    Returns:
+        The text, and whether it is a summary (the full data should then be saved as `artifact`).
+    """
+    import numpy as np
+    import pandas as pd
+
+    budget = budget or default_token_budget()
+    text = str(value)
+    if estimate_tokens(text) <= budget and _printed_in_full(value):
+        return text, False
+    if isinstance(value, pd.Series):
+        return summarize_frame(value.to_frame(value.name if value.name is not None else "value"),
+                               budget, artifact), True
+    if isinstance(value, pd.DataFrame):
+        return summarize_frame(value, budget, artifact), True
+    if isinstance(value, np.ndarray):
+        return summarize_array(value, budget, artifact), True
+    return truncate(text, budget), False
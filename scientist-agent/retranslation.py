@@ -0,0 +1,328 @@
+"""Incremental re-translation of a Vensim model after one of its equations changed.
+
+`pysd.read_vensim` parses every equation of a model with parsimonious and
+formats the whole generated module with black, so changing one equation
+costs as much as translating the model from scratch. Almost all of that time
+goes to those two steps, and both work equation by equation. `retranslate`
+caches them per equation:
+
+* the model text is split into its equations with a tokenizer, and each
+  equation is parsed only if its text was never parsed before;
+* the generated module is formatted one top-level statement at a time, and a
+  statement only if its code changed.
+
+Building the abstract model, generating the code and loading the module are
+cheap and run as usual, so the `.py` written is the one pysd would write (up
+to blank lines) and `simulation.load_model` picks it up. `retranslate` also
+diffs the old and new equations by component, and `invalidate_results` drops
+only the cached runs, emulators and sensitivity analyses whose outputs depend
+on a changed component; everything else stays valid.
+"""
+import ast
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Vensim's control variables: a change to one of these affects every output.
+CONTROL_COMPONENTS = ("initial_time", "final_time", "time_step", "saveper")
+
+# Caches are cleared rather than evicted one by one when they reach this size.
+MAX_CACHED = 50000
+
+# A quoted name (with escaped quotes), a run of other characters, a lone quote or an equation end.
+_TOKEN_RE = re.compile(r'"(?:\\"|[^"])*"|[^"|]+|"|\|')
+_SKETCH_SEPARATOR = "\\\\\\---///"
+
+_lock = threading.RLock()
+# Equation text -> the pysd `Element`s in it (not parsed further).
+_entries: Dict[str, List[Any]] = {}
+# An element's equation, units, limits and documentation -> the parsed pysd element.
+_parsed: Dict[Tuple[str, str, str, str], Any] = {}
+# Unformatted code of a top-level statement -> black's formatting of it.
+_formatted: Dict[str, str] = {}
+# Model path -> {component name: its equations} as of the last translation.
+_translations: Dict[str, Dict[str, Tuple]] = {}
+
+
+def _remember(cache: Dict, key: Any, value: Any) -> Any:
+    if len(cache) >= MAX_CACHED:
+        cache.clear()
+    cache[key] = value
+    return value
+
+
+def _clean(text: str) -> str:
+    """The model part of a .mdl file's text, with whitespace collapsed like `VensimFile` does."""
+    return re.sub(r"[\n\t\s]+", " ", re.sub(r"\\\n\t", " ", text.split(_SKETCH_SEPARATOR, 1)[0]))
+
+
+def split_equations(content: str) -> List[str]:
+    """Split a section's text into its equations, each ending with "|".
+
+    Pipes inside quoted names do not end an equation. Trailing text after the
+    last equation is kept with it.
+    """
+    pieces, start = [], 0
+    for token in _TOKEN_RE.finditer(content):
+        if token.group() == "|":
+            pieces.append(content[start:token.end()])
+            start = token.end()
+    rest = content[start:]
+    if rest.strip():
+        if pieces:
+            pieces[-1] += rest
+        else:
+            pieces.append(rest)
+    return pieces
+
+
+def _section_entries(content: str) -> List[Any]:
+    from pysd.translators.vensim import vensim_utils as vu
+    from pysd.translators.vensim.vensim_section import SectionElementsVisitor
+
+    entries = []
+    for piece in split_equations(content):
+        cached = _entries.get(piece)
+        if cached is None:
+            cached = _remember(_entries, piece,
+                               SectionElementsVisitor(vu.Grammar.get("section_elements").parse(piece)).entries)
+        entries += cached
+    return entries
+
+
+def _entry_key(element) -> Tuple[str, str, str, str]:
+    # repr, since limits hold NaNs, which never compare equal.
+    return element.equation, repr(element.units), repr(element.limits), element.documentation
+
+
+def _parse_entry(element) -> Tuple[Any, bool]:
+    """A fresh copy of the parsed pysd element for an `Element`, and whether it had to be parsed."""
+    from pysd.translators.vensim.vensim_element import SubscriptRange
+
+    key = _entry_key(element)
+    parsed = _parsed.get(key)
+    if parsed is not None:
+        return copy.deepcopy(parsed), False
+    parsed = copy.deepcopy(element).parse()
+    if not isinstance(parsed, SubscriptRange):
+        parsed.parse()
+    _remember(_parsed, key, copy.deepcopy(parsed))
+    return parsed, True
+
+
+def _parse_section(section) -> Tuple[Dict[str, Tuple], int]:
+    """Parse a pysd `Section` like `Section.parse`, reusing cached equations.
+
+    Returns:
+        The section's equations by component name, and the number of equations parsed.
+    """
+    from pysd.translators.vensim.vensim_element import Component, Constraint, SubscriptRange, TestInput
+
+    elements, equations, n_parsed = [], {}, 0
+    for entry in _section_entries(section.content):
+        element, parsed = _parse_entry(entry)
+        n_parsed += parsed
+        elements.append(element)
+        kind = "subscript" if isinstance(element, SubscriptRange) else "component"
+        equations.setdefault(element.name, (kind, []))[1].append(_entry_key(entry))
+    section.subscripts = [e for e in elements if isinstance(e, SubscriptRange)]
+    section.components = [e for e in elements if isinstance(e, Component)]
+    section.constraints = [e for e in elements if isinstance(e, Constraint)]
+    section.test_inputs = [e for e in elements if isinstance(e, TestInput)]
+    section.elements = section.subscripts + section.components + section.constraints + section.test_inputs
+    return {name: (kind, tuple(entries)) for name, (kind, entries) in equations.items()}, n_parsed
+
+
+def _statements(text: str) -> List[str]:
+    """The source of each top-level statement of a module, decorators and trailing comments included."""
+    lines = text.splitlines(keepends=True)
+    starts = [min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+              for node in ast.parse(text).body]
+    if not starts:
+        return [text]
+    starts[0] = 0
+    return ["".join(lines[a:b]) for a, b in zip(starts, starts[1:] + [len(lines)])]
+
+
+def format_module(text: str) -> str:
+    """Format generated code with black, one cached top-level statement at a time."""
+    import black
+
+    out = []
+    previous_is_block = False
+    for statement in _statements(text):
+        formatted = _formatted.get(statement)
+        if formatted is None:
+            formatted = _remember(_formatted, statement, black.format_str(statement, mode=black.FileMode()))
+        if not formatted.strip():
+            continue
+        is_block = formatted.lstrip().startswith(("@", "def ", "class "))
+        if out:
+            # Two blank lines around functions, as black puts them; one where the code had one.
+            out.append("\n\n" if is_block or previous_is_block else "\n" if statement.endswith("\n\n") else "")
+        out.append(formatted)
+        previous_is_block = is_block
+    return "".join(out)
+
+
+class _CachedBlack:
+    """Stands in for the `black` module in pysd's model builder."""
+
+    FileMode = None
+
+    def __init__(self, black):
+        self.FileMode = black.FileMode
+
+    @staticmethod
+    def format_file_contents(text: str, fast: bool = True, mode: Any = None) -> str:
+        return format_module(text)
+
+
+def translate(path: str) -> Tuple[str, Dict[str, Tuple], int]:
+    """Translate a .mdl file to its pysd `.py` module, reusing every cached parse and format.
+
+    Returns:
+        The path of the written module, the model's equations by component name
+        (macro components prefixed with their macro's name) and the number of
+        equations that had to be parsed.
+    """
+    import black
+    from pysd.builders.python import python_model_builder
+    from pysd.translators.vensim.vensim_file import VensimFile
+
+    with _lock:
+        vensim_file = VensimFile(path)
+        vensim_file.parse(parse_all=False)
+        equations, n_parsed = {}, 0
+        for section in vensim_file.sections:
+            section_equations, section_parsed = _parse_section(section)
+            n_parsed += section_parsed
+            prefix = "" if section.type == "main" else f"{section.name}."
+            equations.update({prefix + name: value for name, value in section_equations.items()})
+        abstract_model = vensim_file.get_abstract_model()
+        python_model_builder.black = _CachedBlack(black)
+        try:
+            py_path = python_model_builder.ModelBuilder(abstract_model).build_model()
+        finally:
+            python_model_builder.black = black
+    return str(py_path), equations, n_parsed
+
+
+def _equations_of_text(text: str) -> Dict[str, Tuple]:
+    """The equations by component name of a model's text, as `translate` reports them."""
+    from pysd.translators.vensim import vensim_utils as vu
+    from pysd.translators.vensim.vensim_file import FileSectionsVisitor
+
+    equations = {}
+    for section in FileSectionsVisitor(vu.Grammar.get("file_sections").parse(_clean(text))).entries:
+        section_equations, _ = _parse_section(section)
+        prefix = "" if section.type == "main" else f"{section.name}."
+        equations.update({prefix + name: value for name, value in section_equations.items()})
+    return equations
+
+
+def retranslate(path: str, previous_text: Optional[str] = None) -> Dict[str, Any]:
+    """Re-translate a .mdl file after an edit and load the result.
+
+    Args:
+        path: The edited model file.
+        previous_text: The file's content before the edit, used to tell what
+            changed the first time a model is re-translated in this process.
+
+    Returns:
+        dict with the `py_path` written, the loaded `model`, the `changed`
+        components (added, removed or edited), `structural` (True when a
+        subscript range, macro or control variable changed, or the previous
+        equations are unknown), the number of `equations` and how many were
+        `parsed`, and the `seconds` taken.
+    """
+    from .simulation import load_model
+
+    start = time.perf_counter()
+    path = os.path.normpath(path)
+    with _lock:
+        previous = _translations.get(path)
+        if previous is None and previous_text is not None:
+            try:
+                previous = _equations_of_text(previous_text)
+            except Exception as e:
+                logger.info(f"Could not parse the previous version of {path}: {e}")
+        py_path, equations, n_parsed = translate(path)
+        _translations[path] = equations
+    model = load_model(py_path)
+
+    if previous is None:
+        changed, structural = sorted(equations), True
+    else:
+        changed = sorted(name for name in set(previous) | set(equations) if previous.get(name) != equations.get(name))
+        structural = any("." in name or name.lower().replace(" ", "_") in CONTROL_COMPONENTS
+                         or (equations.get(name) or previous.get(name))[0] == "subscript" for name in changed)
+    return {
+        "py_path": py_path,
+        "model": model,
+        "changed": changed,
+        "structural": structural,
+        "equations": len(equations),
+        "parsed": n_parsed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def upstream_components(model, names: List[str]) -> Set[str]:
+    """The python names of `names` and of every component they depend on, directly or through stocks."""
+    from .simulation import resolve_py_name
+
+    pending = [resolve_py_name(model, name) for name in names]
+    seen: Set[str] = set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        for dependency, value in model.dependencies.get(name, {}).items():
+            # Statefuls list their dependencies per phase, {"initial": {...}, "step": {...}}.
+            pending += list(value) if isinstance(value, dict) else [dependency]
+    return seen
+
+
+def invalidate_results(path: str, model, changed: List[str], structural: bool = False) -> Dict[str, int]:
+    """Drop the cached results of `path` that the changed components can affect.
+
+    A cached result stays valid when none of its outputs depends on a changed
+    component. Everything cached for the model is dropped after a structural change.
+
+    Returns:
+        The number of cached runs, emulators and analyses dropped.
+    """
+    from . import emulators, ensembles, sensitivity
+    from .simulation import parse_output_spec
+
+    path = os.path.normpath(path)
+    changed_py = {model.namespace.get(name, name) for name in changed}
+    verdicts: Dict[str, bool] = {}
+
+    def affected(spec: str) -> bool:
+        if structural:
+            return True
+        if spec not in verdicts:
+            try:
+                verdicts[spec] = bool(upstream_components(model, [parse_output_spec(spec)[1]]) & changed_py)
+            except (KeyError, ValueError):
+                verdicts[spec] = True
+        return verdicts[spec]
+
+    dropped = {"runs": ensembles.RUN_CACHE.invalidate(path, affected)}
+    for name, registry, lock in (("emulators", emulators._emulators, emulators._registry_lock),
+                                 ("analyses", sensitivity._analyses, sensitivity._registry_lock)):
+        with lock:
+            stale = [key for key in registry if os.path.normpath(key[0]) == path and any(map(affected, key[2]))]
+            for key in stale:
+                del registry[key]
+        dropped[name] = len(stale)
+    return dropped
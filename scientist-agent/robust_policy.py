@@ -0,0 +1,149 @@
+"""Optimize policy levers to perform well across rival theories and uncertain futures.
+
+A robust policy is one that does acceptably whichever candidate model (theory)
+is right and whatever values the uncertain parameters turn out to take. This
+module samples a fixed set of scenarios for the uncertain parameters and scores
+every candidate policy on the full (theories x scenarios) grid with one of:
+
+* "regret": minimax regret. The regret of a policy in one (theory, scenario)
+  cell is how much worse it does than the best policy evaluated so far in that
+  cell; the policy with the smallest worst-case regret wins.
+* "percentile": the policy whose `percentile`-th worst outcome across all
+  cells is best (percentile 0 is maximin).
+
+Candidate policies are proposed by a cross-entropy style search: a Latin
+hypercube generation first, then generations sampled around the best policies
+with a shrinking spread. Each generation is simulated on the whole grid in one
+batched, parallel `ensembles.evaluate_many` call, and the run cache ensures a
+(policy, scenario) pair is never simulated twice.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .ensembles import RUN_CACHE, evaluate_many
+from .model_parser import normalize_name
+from .sampling import Bounds, latin_hypercube, rows
+
+logger = logging.getLogger(__name__)
+
+OBJECTIVES = ("regret", "percentile")
+
+
+def model_parameters(model_path: str) -> Optional[set]:
+    """Normalized names of a model's variables, or None if the model is not in the catalog."""
+    from .catalog import get_model_entry
+
+    entry = get_model_entry(model_path)
+    if not entry or not entry.get("variables"):
+        return None
+    return {normalize_name(v["name"]) for v in entry["variables"]}
+
+
+def scenarios_for_model(model_path: str, scenarios: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    """Drop the uncertain parameters a theory does not have, so structurally different models can share scenarios."""
+    known = model_parameters(model_path)
+    if known is None:
+        return scenarios
+    return [{k: v for k, v in s.items() if normalize_name(k) in known} for s in scenarios]
+
+
+def robustness_scores(utilities: np.ndarray, objective: str = "regret", percentile: float = 10) -> np.ndarray:
+    """Score policies from an (n_policies, n_theories, n_scenarios) array of utilities; higher is better.
+
+    Regret is measured against the best of the given policies in each cell, so
+    scores of the same policy change as more policies are evaluated.
+    """
+    cells = utilities.reshape(len(utilities), -1)
+    if objective == "regret":
+        return -(cells.max(axis=0) - cells).max(axis=1)
+    if objective == "percentile":
+        return np.percentile(cells, percentile, axis=1)
+    raise ValueError(f"Unknown objective {objective!r}. Use one of {OBJECTIVES}.")
+
+
+def find_robust_policy(model_paths: Sequence[str], policy_bounds: Bounds, uncertainty_bounds: Bounds, output: str,
+                       sense: str = "maximize", objective: str = "regret", percentile: float = 10,
+                       n_scenarios: int = 20, population: int = 8, generations: int = 5, elite_fraction: float = 0.25,
+                       processes: Optional[int] = None, seed: Optional[int] = 0) -> Dict[str, Any]:
+    """Search the policy levers for the policy most robust across theories and scenarios.
+
+    Args:
+        model_paths: Candidate models (theories) sharing the policy levers and the output.
+        policy_bounds: (low, high) for every policy lever.
+        uncertainty_bounds: (low, high) for every uncertain parameter; scenarios are a Latin hypercube over them.
+            Parameters a model lacks are ignored for that model.
+        output: Output spec to optimize, e.g. "final:Tenure".
+        sense: "maximize" or "minimize" the output.
+        objective: "regret" (minimax regret) or "percentile" (see `robustness_scores`).
+        percentile: Percentile of the outcome distribution to optimize with the "percentile" objective.
+        n_scenarios: Number of sampled scenarios.
+        population, generations: Policies simulated per generation and number of generations.
+        elite_fraction: Share of the best policies new generations are sampled around.
+        processes: Worker processes for the simulations.
+
+    Returns:
+        dict with the `best` policy and its `score`, its outcomes per theory
+        (min/median/max over scenarios), the scenarios, the evaluated policies
+        ranked by score and the number of runs simulated.
+    """
+    if sense not in ("maximize", "minimize"):
+        raise ValueError(f"sense must be 'maximize' or 'minimize', not {sense!r}.")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r}. Use one of {OBJECTIVES}.")
+    overlap = set(policy_bounds) & set(uncertainty_bounds)
+    if overlap:
+        raise ValueError(f"Parameters cannot be both policy levers and uncertainties: {sorted(overlap)}")
+
+    rng = np.random.default_rng(seed)
+    names = list(policy_bounds)
+    low = np.array([policy_bounds[n][0] for n in names], dtype=float)
+    high = np.array([policy_bounds[n][1] for n in names], dtype=float)
+    scenarios = rows(latin_hypercube(uncertainty_bounds, n_scenarios, seed)) if uncertainty_bounds else [{}]
+    model_scenarios = [scenarios_for_model(path, scenarios) for path in model_paths]
+    cached_before = len(RUN_CACHE)
+
+    def simulate_grid(policies: List[Dict[str, float]]) -> np.ndarray:
+        requests = [(path, [{**s, **p} for p in policies for s in own])
+                    for path, own in zip(model_paths, model_scenarios)]
+        runs = evaluate_many(requests, [output], processes=processes)
+        outcomes = np.array([[r[output] for r in model_runs] for model_runs in runs])
+        return outcomes.reshape(len(model_paths), len(policies), len(scenarios)).transpose(1, 0, 2)
+
+    policies = rows(latin_hypercube(policy_bounds, population, seed))
+    outcomes = simulate_grid(policies)
+    n_elite = max(1, int(round(elite_fraction * population)))
+    for generation in range(1, generations):
+        scores = robustness_scores(outcomes if sense == "maximize" else -outcomes, objective, percentile)
+        logger.info(f"Robust policy generation {generation}/{generations}: best score {scores.max():.4g}")
+        elites = np.array([[policies[i][n] for n in names] for i in np.argsort(-scores)[:n_elite]])
+        spread = 0.25 * (high - low) * 0.6 ** (generation - 1)
+        parents = elites[rng.integers(len(elites), size=population)]
+        children = np.clip(parents + rng.normal(size=parents.shape) * spread, low, high)
+        new_policies = [dict(zip(names, map(float, child))) for child in children]
+        policies += new_policies
+        outcomes = np.concatenate([outcomes, simulate_grid(new_policies)])
+
+    scores = robustness_scores(outcomes if sense == "maximize" else -outcomes, objective, percentile)
+    # Clipping to the bounds can propose the same policy twice; rank each policy once.
+    ranking, seen = [], set()
+    for i in np.argsort(-scores):
+        if tuple(policies[i].values()) not in seen:
+            seen.add(tuple(policies[i].values()))
+            ranking.append(int(i))
+    best = ranking[0]
+    return {
+        "output": output,
+        "sense": sense,
+        "objective": objective,
+        "best": policies[best],
+        "score": float(scores[best]),
+        "outcomes": {
+            path: {"min": float(o.min()), "median": float(np.median(o)), "max": float(o.max())}
+            for path, o in zip(model_paths, outcomes[best])
+        },
+        "scenarios": scenarios,
+        "ranking": [{"policy": policies[i], "score": float(scores[i])} for i in ranking],
+        "runs_simulated": len(RUN_CACHE) - cached_before,
+    }
@@ -0,0 +1,34 @@
+"""Experimental designs over model parameters."""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+Bounds = Dict[str, Tuple[float, float]]
+
+
+def latin_hypercube(bounds: Bounds, n_samples: int, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """A Latin hypercube sample: each parameter's range is cut into `n_samples`
+    equal strata and every stratum is sampled exactly once.
+
+    Returns:
+        A dict mapping each parameter name to an array of `n_samples` values.
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name, (low, high) in bounds.items():
+        strata = (rng.permutation(n_samples) + rng.random(n_samples)) / n_samples
+        samples[name] = low + strata * (high - low)
+    return samples
+
+
+def scale_unit_samples(unit: np.ndarray, bounds: Bounds) -> np.ndarray:
+    """Map samples from the unit hypercube, shape (n, d), onto `bounds`."""
+    low = np.array([b[0] for b in bounds.values()], dtype=float)
+    high = np.array([b[1] for b in bounds.values()], dtype=float)
+    return low + np.asarray(unit, dtype=float) * (high - low)
+
+
+def rows(samples: Dict[str, Sequence[float]]) -> list:
+    """Turn column-wise samples into one params dict per run."""
+    names = list(samples)
+    return [dict(zip(names, map(float, values))) for values in zip(*(samples[n] for n in names))]
@@ -0,0 +1,178 @@
+"""Full-text and structural search over model equations.
+
+Each indexed model gets an inverted index from word tokens to the variables whose
+name, equation, units or comment contain them, plus a dependency graph. When a
+pysd-translated module sits next to the model file (pysd writes `Model.py` next
+to `Model.mdl`), its `depends_on` metadata is used for the graph; otherwise the
+references found by `model_parser` are used.
+
+Indexes are rebuilt per model only when the catalog reports a new mtime for the
+model file or its translated module, so searches never re-read unchanged files.
+"""
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from .catalog import refresh_catalog
+from .model_parser import normalize_name, parse_translated_module
+from .settings import MODELS_DIRECTORY
+
+# Translated modules of analyses (e.g. source/analyses/testing) are searchable too.
+SEARCH_ROOTS = [MODELS_DIRECTORY, "source/analyses"]
+
+# How much a token hit in each field counts towards a variable's score.
+FIELD_WEIGHTS = {"name": 4.0, "doc": 1.5, "units": 1.0, "equation": 1.0}
+SNIPPET_LENGTH = 240
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_lock = threading.Lock()
+_indexes: Dict[str, Dict[str, Any]] = {}
+
+
+def _tokens(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _snippet(text: str, length: int = SNIPPET_LENGTH) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return text if len(text) <= length else text[:length - 3] + "..."
+
+
+def _translated_module(path: str) -> Optional[str]:
+    module = os.path.splitext(path)[0] + ".py"
+    return module if os.path.exists(module) else None
+
+
+def _build_index(entry: Dict[str, Any], module: Optional[str]) -> Dict[str, Any]:
+    variables = {v["name"]: v for v in entry["variables"]}
+    upstream = {name: list(v["references"]) for name, v in variables.items()}
+
+    if module:
+        translated = parse_translated_module(module)
+        real_names = {normalize_name(name): name for name in variables}
+        py_to_real = {}
+        for var in translated["variables"]:
+            py_to_real[var["py_name"]] = real_names.get(normalize_name(var["name"]), var["name"])
+        for var in translated["variables"]:
+            name = py_to_real[var["py_name"]]
+            if name not in variables:
+                variables[name] = {"name": name, "kind": (var["kind"] or "").lower(), "units": var["units"],
+                                   "doc": var["doc"], "equation": var["equation"]}
+            upstream[name] = [py_to_real.get(d, d) for d in var["depends_on"] if d != "time"]
+
+    downstream = defaultdict(list)
+    for name, dependencies in upstream.items():
+        for dependency in dependencies:
+            downstream[dependency].append(name)
+
+    postings: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for name, var in variables.items():
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in _tokens(var.get(field)):
+                postings[token][name] += weight
+
+    return {
+        "mtime_ns": entry["mtime_ns"],
+        "module_mtime_ns": os.stat(module).st_mtime_ns if module else None,
+        "graph_source": "depends_on" if module else "equations",
+        "variables": variables,
+        "postings": {token: dict(hits) for token, hits in postings.items()},
+        "upstream": upstream,
+        "downstream": dict(downstream),
+    }
+
+
+def _model_indexes(topic: str = "") -> Dict[str, Dict[str, Any]]:
+    """Per-model indexes for every catalogued model, refreshed where files changed."""
+    entries = {}
+    for root in SEARCH_ROOTS:
+        if os.path.isdir(root):
+            entries.update(refresh_catalog(root))
+    if topic:
+        prefix = os.path.normpath(os.path.join(MODELS_DIRECTORY, topic))
+        entries = {p: e for p, e in entries.items() if p.startswith(prefix + os.sep)}
+
+    with _lock:
+        for path, entry in entries.items():
+            module = _translated_module(path)
+            module_mtime_ns = os.stat(module).st_mtime_ns if module else None
+            cached = _indexes.get(path)
+            if cached is None or (cached["mtime_ns"], cached["module_mtime_ns"]) != (entry["mtime_ns"], module_mtime_ns):
+                _indexes[path] = _build_index(entry, module)
+        return {path: _indexes[path] for path in entries}
+
+
+def _neighbours(index: Dict[str, Any], name: str, direction: str, depth: int) -> List[str]:
+    found, frontier = [], [name]
+    for _ in range(depth):
+        next_frontier = []
+        for node in frontier:
+            for neighbour in index[direction].get(node, []):
+                if neighbour != name and neighbour not in found:
+                    found.append(neighbour)
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+    return found
+
+
+def _describe(path: str, index: Dict[str, Any], name: str, depth: int) -> Dict[str, Any]:
+    var = index["variables"][name]
+    return {
+        "model": path,
+        "name": name,
+        "kind": var.get("kind"),
+        "units": var.get("units"),
+        "equation": _snippet(var.get("equation")),
+        "doc": _snippet(var.get("doc")),
+        "upstream": _neighbours(index, name, "upstream", depth),
+        "downstream": _neighbours(index, name, "downstream", depth),
+    }
+
+
+def search_equations(query: str, kind: Optional[str] = None, topic: str = "", limit: int = 10,
+                     depth: int = 1) -> List[Dict[str, Any]]:
+    """Rank variables across models by how well their name, equation, units and comment match `query`.
+
+    Every query token must match (as a word prefix) somewhere in the variable.
+    """
+    query_tokens = _tokens(query)
+    if not query_tokens:
+        return []
+    results = []
+    for path, index in _model_indexes(topic).items():
+        vocabulary = index["postings"]
+        scores: Optional[Dict[str, float]] = None
+        for token in query_tokens:
+            hits: Dict[str, float] = defaultdict(float)
+            for word, postings in vocabulary.items():
+                if word.startswith(token):
+                    # Exact word matches rank above prefix matches.
+                    boost = 1.0 if word == token else 0.5
+                    for name, weight in postings.items():
+                        hits[name] += weight * boost
+            scores = hits if scores is None else {n: s + hits[n] for n, s in scores.items() if n in hits}
+        for name, score in (scores or {}).items():
+            if kind and index["variables"][name].get("kind") != kind:
+                continue
+            results.append((score, path, name))
+
+    results.sort(key=lambda r: (-r[0], r[1], r[2]))
+    return [
+        {"score": round(score, 2), **_describe(path, _indexes[path], name, depth)}
+        for score, path, name in results[:limit]
+    ]
+
+
+def variable_dependencies(path: str, name: str, depth: int = 1) -> Optional[Dict[str, Any]]:
+    """Upstream and downstream neighbours of one variable, up to `depth` links away."""
+    path = os.path.normpath(path)
+    index = _model_indexes().get(path)
+    if index is None:
+        return None
+    names = {normalize_name(n): n for n in index["variables"]}
+    real_name = names.get(normalize_name(name))
+    if real_name is None:
+        return None
+    return {"graph_source": index["graph_source"], **_describe(path, index, real_name, depth)}
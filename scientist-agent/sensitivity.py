@@ -0,0 +1,297 @@
+"""Global sensitivity analysis of model outputs to model constants.
+
+Two methods are available:
+
+* "sobol": variance-based indices from a Saltelli design. For N base samples
+  of d parameters it runs N * (d + 2) simulations (N * (2d + 2) with
+  `second_order`) and estimates first-order (S1), total (ST) and, with
+  `second_order`, pairwise interaction (S2) indices using the Saltelli (2010)
+  and Jansen estimators. ST - S1 is the share of variance a parameter causes
+  through interactions of any order.
+* "morris": elementary effects along r one-at-a-time trajectories, r * (d + 1)
+  simulations. `mu_star` ranks parameters by influence and `sigma` flags
+  nonlinear or interacting ones.
+
+Confidence intervals are bootstrapped over the base samples (or trajectories).
+
+An `Analysis` keeps its runs. Asking it for more samples extends the scrambled
+Sobol sequence (or adds trajectories) and only simulates the new rows, so the
+estimates can be refined step by step. Analyses are kept per (model,
+parameters, outputs, method) by `get_analysis`, and all runs also go through
+the shared run cache of `ensembles`.
+"""
+import itertools
+import logging
+import threading
+import warnings
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .ensembles import RUN_CACHE, RunCache, evaluate
+from .sampling import Bounds, scale_unit_samples
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("sobol", "morris")
+# Confidence level of the bootstrapped intervals.
+CONFIDENCE = 0.95
+
+
+def _confidence_interval(estimates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    alpha = (1 - CONFIDENCE) / 2
+    return np.quantile(estimates, alpha, axis=0), np.quantile(estimates, 1 - alpha, axis=0)
+
+
+def sobol_indices(fA: np.ndarray, fB: np.ndarray, fAB: np.ndarray,
+                  fBA: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Sobol indices from the outputs of a Saltelli design.
+
+    Args:
+        fA, fB: Outputs on the base matrices, shape (N,).
+        fAB: Outputs on A with column i taken from B, shape (N, d).
+        fBA: Outputs on B with column i taken from A, shape (N, d); needed for S2.
+    """
+    variance = np.var(np.concatenate([fA, fB]))
+    if variance == 0:
+        d = fAB.shape[1]
+        return {"S1": np.zeros(d), "ST": np.zeros(d), **({"S2": np.zeros((d, d))} if fBA is not None else {})}
+    S1 = np.mean(fB[:, None] * (fAB - fA[:, None]), axis=0) / variance
+    ST = 0.5 * np.mean((fA[:, None] - fAB) ** 2, axis=0) / variance
+    indices = {"S1": S1, "ST": ST}
+    if fBA is not None:
+        d = fAB.shape[1]
+        S2 = np.full((d, d), np.nan)
+        for i, j in itertools.combinations(range(d), 2):
+            closed = np.mean(fBA[:, i] * fAB[:, j] - fA * fB) / variance
+            S2[i, j] = S2[j, i] = closed - S1[i] - S1[j]
+        indices["S2"] = S2
+    return indices
+
+
+def morris_indices(effects: np.ndarray) -> Dict[str, np.ndarray]:
+    """mu, mu_star and sigma from elementary effects of shape (r, d)."""
+    return {
+        "mu": effects.mean(axis=0),
+        "mu_star": np.abs(effects).mean(axis=0),
+        "sigma": effects.std(axis=0, ddof=1) if len(effects) > 1 else np.zeros(effects.shape[1]),
+    }
+
+
+class Analysis:
+    """A sensitivity analysis of some outputs of one model that can be extended with more samples."""
+
+    def __init__(self, model_path: str, bounds: Bounds, outputs: Sequence[str], method: str = "sobol",
+                 second_order: bool = False, levels: int = 4, seed: Optional[int] = 0,
+                 processes: Optional[int] = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r}. Use one of {METHODS}.")
+        self.model_path = model_path
+        self.bounds = dict(bounds)
+        self.parameters = list(self.bounds)
+        self.outputs = list(outputs)
+        self.method = method
+        self.second_order = second_order
+        self.levels = levels
+        self.seed = seed
+        self.processes = processes
+        d = len(self.parameters)
+        self._sobol = None
+        self._rng = np.random.default_rng(seed)
+        # Per output: the design's outputs, grown row by row as samples are added.
+        self._Y: Dict[str, List[np.ndarray]] = {spec: [] for spec in self.outputs}
+        # Morris: the parameter moved at each step of every trajectory, and the signed step.
+        self._steps: List[Tuple[np.ndarray, np.ndarray]] = []
+        # Rows of the design, and the runs actually simulated for them (the others were cached).
+        self.n_runs = 0
+        self.n_simulated = 0
+        if method == "sobol":
+            from scipy.stats import qmc
+            self._sobol = qmc.Sobol(d=2 * d, scramble=True, seed=seed)
+        self._lock = threading.Lock()
+
+    @property
+    def n_samples(self) -> int:
+        """Base samples (sobol) or trajectories (morris) evaluated so far."""
+        first = self._Y[self.outputs[0]]
+        return sum(len(block) for block in first)
+
+    def _run(self, unit_rows: np.ndarray) -> Dict[str, np.ndarray]:
+        values = scale_unit_samples(unit_rows, self.bounds)
+        param_rows = [dict(zip(self.parameters, map(float, row))) for row in values]
+        uncached = {RunCache.key(self.model_path, row, "") for row in param_rows
+                    if not RUN_CACHE.contains(self.model_path, row, self.outputs)}
+        results = evaluate(self.model_path, param_rows, self.outputs, processes=self.processes)
+        self.n_runs += len(param_rows)
+        self.n_simulated += len(uncached)
+        return {spec: np.array([r[spec] for r in results]) for spec in self.outputs}
+
+    def _saltelli_rows(self, n: int) -> np.ndarray:
+        """Rows A, B, AB_1..AB_d (and BA_1..BA_d) for n new base samples, blocked by base sample."""
+        d = len(self.parameters)
+        with warnings.catch_warnings():
+            # Balance is best for powers of two, but any n is valid.
+            warnings.simplefilter("ignore", UserWarning)
+            base = self._sobol.random(n)
+        A, B = base[:, :d], base[:, d:]
+        blocks = [A, B]
+        for i in range(d):
+            AB = A.copy()
+            AB[:, i] = B[:, i]
+            blocks.append(AB)
+        if self.second_order:
+            for i in range(d):
+                BA = B.copy()
+                BA[:, i] = A[:, i]
+                blocks.append(BA)
+        # Shape (n, blocks, d) so every base sample's rows stay together.
+        return np.stack(blocks, axis=1)
+
+    def _morris_rows(self, r: int) -> Tuple[np.ndarray, List[Tuple[np.ndarray, np.ndarray]]]:
+        """r random one-at-a-time trajectories on a `levels`-level grid, shape (r, d + 1, d)."""
+        d, p = len(self.parameters), self.levels
+        delta = p / (2 * (p - 1))
+        starts = self._rng.integers(0, p // 2, size=(r, d)) / (p - 1)
+        trajectories, steps = [], []
+        for start in starts:
+            order = self._rng.permutation(d)
+            signs = self._rng.choice([-1.0, 1.0], size=d)
+            # Step up from the lower half of the grid, or down from the start shifted by delta.
+            point = np.where(signs > 0, start, start + delta)
+            path = [point.copy()]
+            for i in order:
+                point[i] += signs[i] * delta
+                path.append(point.copy())
+            trajectories.append(path)
+            steps.append((order, signs * delta))
+        return np.array(trajectories), steps
+
+    def extend(self, n: int) -> "Analysis":
+        """Add `n` base samples (sobol) or trajectories (morris), simulating only the new rows."""
+        with self._lock:
+            d = len(self.parameters)
+            if self.method == "sobol":
+                design = self._saltelli_rows(n)
+            else:
+                design, steps = self._morris_rows(n)
+                self._steps += steps
+            outputs = self._run(design.reshape(-1, d))
+            for spec, values in outputs.items():
+                self._Y[spec].append(values.reshape(n, design.shape[1]))
+        return self
+
+    def _indices(self, Y: np.ndarray, steps: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None) -> Dict[str, np.ndarray]:
+        d = len(self.parameters)
+        if self.method == "sobol":
+            return sobol_indices(Y[:, 0], Y[:, 1], Y[:, 2:2 + d], Y[:, 2 + d:] if self.second_order else None)
+        effects = np.empty((len(Y), d))
+        for k, (order, delta) in enumerate(steps):
+            effects[k, order] = (Y[k, 1:] - Y[k, :-1]) / delta[order]
+        return morris_indices(effects)
+
+    def results(self, n_bootstrap: int = 500) -> Dict[str, Any]:
+        """Indices per output and parameter, with bootstrapped confidence intervals.
+
+        Returns:
+            dict mapping each output to {"parameters": {name: {index: value, index + "_conf": [low, high]}}}
+            and, for second-order sobol analyses, {"interactions": {"a x b": {...}}}.
+        """
+        rng = np.random.default_rng(self.seed)
+        with self._lock:
+            results = {}
+            for spec in self.outputs:
+                Y = np.concatenate(self._Y[spec])
+                point = self._indices(Y, self._steps)
+                samples = {name: [] for name in point}
+                for _ in range(n_bootstrap):
+                    pick = rng.integers(0, len(Y), len(Y))
+                    resampled = self._indices(Y[pick], [self._steps[i] for i in pick] if self._steps else None)
+                    for name, value in resampled.items():
+                        samples[name].append(value)
+                conf = {name: _confidence_interval(np.array(values)) for name, values in samples.items()}
+
+                per_parameter = {}
+                for i, parameter in enumerate(self.parameters):
+                    entry = {}
+                    for name, value in point.items():
+                        if value.ndim == 1:
+                            entry[name] = float(value[i])
+                            entry[name + "_conf"] = [float(conf[name][0][i]), float(conf[name][1][i])]
+                    if self.method == "sobol":
+                        entry["interaction"] = entry["ST"] - entry["S1"]
+                    per_parameter[parameter] = entry
+                results[spec] = {"parameters": per_parameter}
+                if "S2" in point:
+                    results[spec]["interactions"] = {
+                        f"{self.parameters[i]} x {self.parameters[j]}": {
+                            "S2": float(point["S2"][i, j]),
+                            "S2_conf": [float(conf["S2"][0][i, j]), float(conf["S2"][1][i, j])],
+                        }
+                        for i, j in itertools.combinations(range(len(self.parameters)), 2)
+                    }
+            return results
+
+
+def model_constants(model_path: str) -> List[str]:
+    """Names of the numeric constants of a model, the default inputs of an analysis."""
+    from .catalog import get_model_entry
+
+    entry = get_model_entry(model_path)
+    return [v["name"] for v in (entry or {}).get("variables", [])
+            if v["kind"] == "constant" and isinstance(v.get("value"), (int, float))]
+
+
+_analyses: Dict[Tuple, Analysis] = {}
+_registry_lock = threading.Lock()
+
+
+def get_analysis(model_path: str, outputs: Sequence[str], parameters: Optional[Sequence[str]] = None,
+                 bounds: Optional[Bounds] = None, method: str = "sobol", second_order: bool = False,
+                 processes: Optional[int] = None) -> Analysis:
+    """The analysis for this model, parameter set, outputs and method, created empty on first use."""
+    from .emulators import default_bounds
+
+    parameters = sorted(parameters or (bounds and list(bounds)) or model_constants(model_path))
+    if not parameters:
+        raise ValueError(f"No constants found in {model_path}; give the parameters to analyze explicitly.")
+    key = (model_path, tuple(parameters), tuple(sorted(outputs)), method, second_order,
+           tuple(sorted((name, tuple(b)) for name, b in (bounds or {}).items())))
+    with _registry_lock:
+        analysis = _analyses.get(key)
+        if analysis is None:
+            given = dict(bounds or {})
+            missing = [p for p in parameters if p not in given]
+            if missing:
+                given.update(default_bounds(model_path, missing))
+            analysis = Analysis(model_path, {p: given[p] for p in parameters}, sorted(outputs), method,
+                                second_order=second_order, processes=processes)
+            _analyses[key] = analysis
+        return analysis
+
+
+def analyze(model_path: str, outputs: Sequence[str], parameters: Optional[Sequence[str]] = None,
+            bounds: Optional[Bounds] = None, method: str = "sobol", samples: int = 64,
+            second_order: bool = False, n_bootstrap: int = 500, processes: Optional[int] = None) -> Dict[str, Any]:
+    """Run (or refine) a sensitivity analysis until it has `samples` base samples or trajectories.
+
+    Repeated calls with the same model, parameters, outputs and method reuse
+    the runs already done and only simulate the additional samples.
+
+    Returns:
+        dict with `method`, `bounds`, `samples`, `runs` (rows in the design), `new_runs`
+        (simulations this call ran, not counting runs answered from the cache) and the
+        per-output `indices` of `Analysis.results`.
+    """
+    analysis = get_analysis(model_path, outputs, parameters, bounds, method, second_order, processes)
+    simulated_before = analysis.n_simulated
+    if samples > analysis.n_samples:
+        logger.info(f"Extending {method} analysis of {model_path} from {analysis.n_samples} to {samples} samples...")
+        analysis.extend(samples - analysis.n_samples)
+    return {
+        "method": method,
+        "bounds": analysis.bounds,
+        "samples": analysis.n_samples,
+        "runs": analysis.n_runs,
+        "new_runs": analysis.n_simulated - simulated_before,
+        "indices": analysis.results(n_bootstrap),
+    }
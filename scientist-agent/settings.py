@@ -0,0 +1,10 @@
+"""Locations shared by the agent's tools.
+
+Paths are relative to the directory `adk web` is started from (the repo root).
+"""
+import os
+
+MODELS_DIRECTORY = "source/models"
+
+# Indexes, caches and other derived data that can be rebuilt at any time.
+CACHE_DIRECTORY = os.environ.get("SCIENTIST_AGENT_CACHE_DIR", ".cache")
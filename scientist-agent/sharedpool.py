@@ -0,0 +1,237 @@
+"""Row-wise parallel work over tables in shared memory.
+
+The notebooks' `apply_by_multiprocessing` recipe pickles a chunk of the
+DataFrame to every worker and pickles each row's result back, which for a
+table of counties or a 2000-row Latin hypercube sample costs about as much as
+the work itself. Here the input table and the output array live in
+`multiprocessing.shared_memory` blocks (`SharedArray`):
+
+* the table is copied into shared memory once, as one float array;
+* workers are sent only (start, stop) row ranges, read their rows in place
+  and write their results straight into the output array;
+* the only data pickled per task is the range and an error message, if any.
+
+`apply_rows` runs any row function, like `DataFrame.apply(func, axis=1)`, on
+a pool forked for the call so the function need not be picklable.
+`evaluate_table` runs a model once per row of a parameter table on the shared
+`ensembles` pool, whose workers keep their loaded models.
+"""
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .ensembles import RUN_CACHE, RunCache, default_processes, get_pool, simulate, translate_models
+
+
+class SharedArray:
+    """A NumPy array backed by a shared memory block, created here or attached by name."""
+
+    def __init__(self, shape: Tuple[int, ...], dtype: Any = np.float64, name: Optional[str] = None):
+        shape = tuple(int(n) for n in shape)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=max(1, nbytes))
+        self.shape, self.dtype = shape, np.dtype(dtype)
+        self.array = np.ndarray(shape, dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def from_array(cls, values: np.ndarray) -> "SharedArray":
+        values = np.asarray(values)
+        shared = cls(values.shape, values.dtype)
+        shared.array[...] = values
+        return shared
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def handle(self) -> Tuple[str, Tuple[int, ...], str]:
+        """What a worker needs to attach: `SharedArray(*handle[1:], name=handle[0])`."""
+        return self.name, self.shape, self.dtype.str
+
+    def close(self) -> None:
+        """Detach, and free the block if it was created here. Views of `array` must be gone."""
+        self.array = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _attach(handle: Tuple[str, Tuple[int, ...], str]) -> SharedArray:
+    name, shape, dtype = handle
+    return SharedArray(shape, dtype, name=name)
+
+
+def row_ranges(n_rows: int, processes: int, chunks_per_process: int = 4) -> List[Tuple[int, int]]:
+    """(start, stop) ranges covering `n_rows`, a few per process so that slow rows even out."""
+    size = max(1, -(-n_rows // (chunks_per_process * processes)))
+    return [(start, min(start + size, n_rows)) for start in range(0, n_rows, size)]
+
+
+def _numeric_values(table) -> np.ndarray:
+    import pandas as pd
+
+    if isinstance(table, pd.DataFrame):
+        numeric = table.select_dtypes("number").columns
+        if len(numeric) != len(table.columns):
+            other = [c for c in table.columns if c not in numeric]
+            raise ValueError(f"Only numeric columns can be shared; move {other} to the index first.")
+        return table.to_numpy(dtype=np.float64)
+    return np.asarray(table, dtype=np.float64)
+
+
+def _as_outputs(result: Any, outputs: Optional[Sequence[Any]]) -> np.ndarray:
+    import pandas as pd
+
+    if isinstance(result, (dict, pd.Series)):
+        return np.array([result[name] for name in outputs], dtype=np.float64)
+    return np.atleast_1d(np.asarray(result, dtype=np.float64))
+
+
+# The call `apply_rows` is running, inherited by the workers it forks.
+_job: Optional[Tuple] = None
+_apply_lock = threading.Lock()
+
+
+def _apply_range(bounds: Tuple[int, int]) -> Optional[str]:
+    import pandas as pd
+
+    func, table, columns, index, out, outputs = _job
+    start, stop = bounds
+    i = start
+    try:
+        for i in range(start, stop):
+            row = table[i] if columns is None else pd.Series(table[i], index=columns, name=index[i])
+            out[i] = _as_outputs(func(row), outputs)
+    except Exception as e:
+        return f"Row {index[i] if index is not None else i}: {type(e).__name__}: {e}"
+    return None
+
+
+def apply_rows(table, func: Callable[[Any], Any], processes: Optional[int] = None):
+    """`table.apply(func, axis=1)` on worker processes, with the table and results in shared memory.
+
+    Args:
+        table: A numeric DataFrame (each row is passed as a Series, like `apply`) or 2-D array
+            (each row is passed as a 1-D array).
+        func: Called once per row. Returns a number, a sequence of numbers, or a dict/Series of
+            them with the same keys for every row. It is not pickled, so a lambda or a function
+            defined in a notebook works.
+        processes: Worker processes (default: `ensembles.default_processes()`).
+
+    Returns:
+        A Series (numbers) or DataFrame (one column per key or position) indexed like `table`;
+        a 1-D or 2-D array for an array `table`.
+
+    Raises:
+        RuntimeError: If `func` raised on some row, naming the first such row.
+    """
+    global _job
+    import pandas as pd
+
+    is_frame = isinstance(table, pd.DataFrame)
+    values = _numeric_values(table)
+    n_rows = len(values)
+    if n_rows == 0:
+        return table.iloc[:, :0] if is_frame else np.empty((0, 0))
+    columns, index = (table.columns, table.index) if is_frame else (None, None)
+    # The first row runs here, to learn the shape of the results.
+    first = func(pd.Series(values[0], index=columns, name=index[0]) if is_frame else values[0])
+    keys = list(first.keys()) if isinstance(first, (dict, pd.Series)) else None
+    first_out = _as_outputs(first, keys)
+
+    processes = processes or default_processes()
+    with SharedArray.from_array(values) as shared_table, SharedArray((n_rows, len(first_out))) as shared_out:
+        shared_out.array[0] = first_out
+        with _apply_lock:
+            _job = (func, shared_table.array, columns, index, shared_out.array, keys)
+            try:
+                ranges = row_ranges(n_rows - 1, processes)
+                with multiprocessing.get_context("fork").Pool(processes) as pool:
+                    errors = pool.map(_apply_range, [(start + 1, stop + 1) for start, stop in ranges], chunksize=1)
+            finally:
+                _job = None
+        errors = [e for e in errors if e is not None]
+        if errors:
+            raise RuntimeError(f"{len(errors)} row ranges failed. {errors[0]}")
+        out = shared_out.array.copy()
+
+    if not is_frame:
+        return out[:, 0] if keys is None and np.ndim(first) == 0 else out
+    if keys is None and np.ndim(first) == 0:
+        return pd.Series(out[:, 0], index=index)
+    return pd.DataFrame(out, index=index, columns=keys)
+
+
+def _simulate_range(model_path: str, table_handle: Tuple, columns: List[str], out_handle: Tuple,
+                    specs: Sequence[str], rows: Sequence[int]) -> Optional[str]:
+    table, out = _attach(table_handle), _attach(out_handle)
+    try:
+        for i in rows:
+            outputs = simulate(model_path, dict(zip(columns, table.array[i].tolist())), specs)
+            out.array[i] = [outputs[spec] for spec in specs]
+        return None
+    except Exception as e:
+        return f"Row {i}: {type(e).__name__}: {e}"
+    finally:
+        table.close()
+        out.close()
+
+
+def evaluate_table(model_path: str, table, specs: Sequence[str], processes: Optional[int] = None,
+                   cache: Optional[RunCache] = RUN_CACHE):
+    """`ensembles.evaluate` for a table of parameter sets, passed to the workers through shared memory.
+
+    Args:
+        model_path: The model to run.
+        table: A numeric DataFrame with one column per parameter and one row per run.
+        specs: Output specs such as "final:Tenure" or "max:Infected".
+        processes: Worker processes; 1 runs everything in this process.
+        cache: Where completed runs are looked up and stored. None disables caching.
+
+    Returns:
+        A DataFrame with one column per spec, indexed like `table`.
+    """
+    import pandas as pd
+
+    specs = list(specs)
+    columns = [str(c) for c in table.columns]
+    values = _numeric_values(table)
+    out = np.full((len(values), len(specs)), np.nan)
+    todo = []
+    for i, row in enumerate(values):
+        cached = cache.get(model_path, dict(zip(columns, row.tolist())), specs) if cache is not None else None
+        if cached is None:
+            todo.append(i)
+        else:
+            out[i] = [cached[spec] for spec in specs]
+
+    processes = processes or default_processes()
+    if processes == 1 or len(todo) <= 1:
+        for i in todo:
+            outputs = simulate(model_path, dict(zip(columns, values[i].tolist())), specs)
+            out[i] = [outputs[spec] for spec in specs]
+    elif todo:
+        translate_models([model_path])
+        pool = get_pool(processes)
+        with SharedArray.from_array(values) as shared_table, SharedArray(out.shape) as shared_out:
+            futures = [pool.submit(_simulate_range, model_path, shared_table.handle(), columns, shared_out.handle(),
+                                   specs, todo[start:stop]) for start, stop in row_ranges(len(todo), processes)]
+            errors = [e for e in (f.result() for f in futures) if e is not None]
+            if errors:
+                raise RuntimeError(f"{len(errors)} row ranges failed. {errors[0]}")
+            out[todo] = shared_out.array[todo]
+
+    if cache is not None:
+        for i in todo:
+            cache.put(model_path, dict(zip(columns, values[i].tolist())), dict(zip(specs, out[i].tolist())))
+    return pd.DataFrame(out, index=table.index, columns=specs)
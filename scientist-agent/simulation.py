@@ -0,0 +1,386 @@
+"""Shared helpers for driving pysd models step by step.
+
+`model.run()` is the right tool for a single run. The engines in this package
+(surrogates, emulators, experiment design, ...) also need to load a model
+without re-translating it, address components by their Vensim names, and
+advance several model instances in lock-step so per-step work can be batched
+across them. Those building blocks live here.
+"""
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .model_parser import normalize_name
+
+
+def load_model(path: str):
+    """Load a model, reusing pysd's translated `.py` when it is newer than the source.
+
+    `pysd.read_vensim` re-translates on every call; once a model has been
+    translated, `pysd.load` on the generated module is much cheaper. Every call
+    returns an independent model instance.
+    """
+    import pysd
+
+    root, suffix = os.path.splitext(path)
+    if suffix == ".py":
+        return pysd.load(path)
+    translated = root + ".py"
+    if os.path.exists(translated) and os.path.getmtime(translated) >= os.path.getmtime(path):
+        return pysd.load(translated)
+    if suffix == ".mdl":
+        return pysd.read_vensim(path)
+    if suffix == ".xmile":
+        return pysd.read_xmile(path)
+    raise ValueError(f"Unsupported model file {path}. Expected .mdl, .xmile or a translated .py file.")
+
+
+def resolve_py_name(model, name: str) -> str:
+    """The python name of a component given its Vensim name or python name."""
+    namespace = model.namespace
+    if name in namespace.values():
+        return name
+    if name in namespace:
+        return namespace[name]
+    wanted = normalize_name(name)
+    for real_name, py_name in namespace.items():
+        if normalize_name(real_name) == wanted or normalize_name(py_name) == wanted:
+            return py_name
+    raise KeyError(f"{name!r} is not a component of {model.py_model_file}")
+
+
+def component_getter(model, name: str) -> Callable[[], Any]:
+    """A zero-argument callable returning the current value of component `name`."""
+    return getattr(model.components, resolve_py_name(model, name))
+
+
+def as_float_array(value: Any) -> np.ndarray:
+    """Values of scalar or subscripted (xarray) components as a float array."""
+    return np.asarray(getattr(value, "values", value), dtype=float)
+
+
+def time_grid(model, final_time: Optional[float] = None, time_step: Optional[float] = None) -> np.ndarray:
+    """The integration times from the model's current time to `final_time` (inclusive)."""
+    initial = model.time()
+    final = model.time.final_time() if final_time is None else final_time
+    dt = model.time.time_step() if time_step is None else time_step
+    n_steps = int(round((final - initial) / dt))
+    return initial + dt * np.arange(n_steps + 1)
+
+
+def initialize(model, params: Optional[Dict[str, Any]] = None, final_time: Optional[float] = None,
+               time_step: Optional[float] = None, return_columns: Optional[List[str]] = None,
+               initial_condition: Any = "original", saveper: Optional[float] = None) -> None:
+    """Configure a run the same way `model.run()` does, without integrating it.
+
+    Applies parameters and control variables, sets up caching and puts the
+    model at its initial condition, ready for `advance`. Time series in
+    `params` are resampled once onto the integration grid (see `timeseries`).
+    """
+    from .timeseries import grid_params
+
+    params = grid_params(model, params, final_time, time_step)
+    model._stepper_mode = False
+    model._config_simulation(params, return_columns, None, initial_condition, final_time, time_step,
+                             saveper, cache_output=False, progress=False)
+
+
+def advance(model, dt: float) -> None:
+    """Take one Euler step of length `dt`, exactly like `model.run()` does."""
+    model._euler_step(dt)
+    model.time.update(model.time() + dt)
+    model.clean_caches()
+
+
+def state_labels(model) -> List[str]:
+    """One label per entry of `get_state_vector`: the stock's Vensim name, with an index for array states.
+
+    Delays and smooths hold several internal stocks and keep their python name.
+    """
+    real_names = {py: real for real, py in model.namespace.items()}
+    labels = []
+    for element in model._dynamicstateful_elements:
+        name = element.py_name
+        if name.startswith("_integ_"):
+            name = real_names.get(name[len("_integ_"):], name)
+        size = np.size(as_float_array(element.state))
+        labels += [name] if size == 1 and np.ndim(as_float_array(element.state)) == 0 \
+            else [f"{name}[{i}]" for i in range(size)]
+    return labels
+
+
+def get_state_vector(model) -> np.ndarray:
+    """The states of all stocks (including those inside delays and smooths) as one flat float array."""
+    return np.concatenate([as_float_array(e.state).ravel() for e in model._dynamicstateful_elements]) \
+        if model._dynamicstateful_elements else np.empty(0)
+
+
+def set_state_vector(model, x: np.ndarray) -> None:
+    """Overwrite all stock states from a flat array laid out like `get_state_vector`."""
+    offset = 0
+    for element in model._dynamicstateful_elements:
+        shape = np.shape(as_float_array(element.state))
+        size = int(np.prod(shape))
+        value = np.asarray(x[offset:offset + size], dtype=float).reshape(shape)
+        # Assign rather than `update()`: DELAY FIXED and SAMPLE IF TRUE advance their pipes in `update`.
+        element.state = float(value) if shape == () else value
+        offset += size
+    model.clean_caches()
+
+
+def derivative_vector(model) -> np.ndarray:
+    """The net flows into all stocks at the current state and time, laid out like `get_state_vector`."""
+    return np.concatenate([as_float_array(d).ravel() for d in model.ddt()]) \
+        if model._dynamicstateful_elements else np.empty(0)
+
+
+def run_lockstep(models: List[Any], return_columns: Iterable[str],
+                 params: Optional[List[Dict[str, Any]]] = None,
+                 before_step: Optional[Callable[[List[Any]], None]] = None,
+                 final_time: Optional[float] = None, time_step: Optional[float] = None,
+                 saveper: Optional[float] = None) -> Dict[str, Any]:
+    """Advance several model instances together, one timestep at a time.
+
+    Args:
+        models: Independent instances of the same model (see `load_model`).
+        return_columns: Component names to record.
+        params: Optional per-instance parameter dicts.
+        before_step: Called with all models once per timestep, after their
+            caches were cleared and before derivatives are computed. This is
+            where per-step work can be batched across instances.
+        final_time, time_step, saveper: Optional overrides of the control variables.
+
+    Returns:
+        dict with `time` (saved timestamps), `columns` and `values`, an array of
+        shape (n_models, n_saved_times, n_columns).
+    """
+    columns = list(return_columns)
+    for i, model in enumerate(models):
+        initialize(model, params[i] if params else None, final_time=final_time, time_step=time_step,
+                   return_columns=columns)
+    times = time_grid(models[0], final_time, time_step)
+    dt = times[1] - times[0] if len(times) > 1 else 0.0
+    save_every = max(1, int(round((saveper or dt) / dt))) if dt else 1
+    saved = np.arange(0, len(times), save_every)
+    getters = [[component_getter(m, c) for c in columns] for m in models]
+
+    values = np.empty((len(models), len(saved), len(columns)))
+    next_save = 0
+    for i in range(len(times)):
+        if before_step is not None:
+            before_step(models)
+        if next_save < len(saved) and saved[next_save] == i:
+            for k, model_getters in enumerate(getters):
+                values[k, next_save] = [float(as_float_array(g())) for g in model_getters]
+            next_save += 1
+        if i < len(times) - 1:
+            for model in models:
+                advance(model, dt)
+    return {"time": times[saved], "columns": columns, "values": values}
+
+
+# Summary statistics of one output series, referred to as "<reducer>:<column>".
+REDUCERS = {
+    "final": lambda t, v: v[-1],
+    "initial": lambda t, v: v[0],
+    "max": lambda t, v: v.max(),
+    "min": lambda t, v: v.min(),
+    "mean": lambda t, v: v.mean(),
+    "argmax": lambda t, v: t[int(v.argmax())],
+    "argmin": lambda t, v: t[int(v.argmin())],
+    "integral": lambda t, v: float(np.sum((v[1:] + v[:-1]) * np.diff(t)) / 2),
+}
+# Reducers taking a threshold, referred to as "<reducer>@<threshold>:<column>".
+THRESHOLD_REDUCERS = ("crossing",)
+
+
+def crossing_time(t: np.ndarray, v: np.ndarray, threshold: float) -> float:
+    """First time the series reaches `threshold` from its initial side, linearly interpolated; NaN if never."""
+    side = np.sign(v - threshold)
+    crossed = np.nonzero(side != side[0])[0] if side[0] else np.array([0])
+    if not len(crossed):
+        return float("nan")
+    k = int(crossed[0])
+    if k == 0 or v[k] == v[k - 1]:
+        return float(t[k])
+    return float(t[k - 1] + (threshold - v[k - 1]) * (t[k] - t[k - 1]) / (v[k] - v[k - 1]))
+
+
+def parse_output_spec(spec: str) -> tuple:
+    """Split "max:Infected" into ("max", "Infected"); a bare column means its final value.
+
+    Threshold reducers keep their argument: "crossing@1000:Infected" gives ("crossing@1000", "Infected").
+    """
+    reducer, _, column = spec.partition(":")
+    if not column:
+        return "final", reducer.strip()
+    name, _, threshold = reducer.strip().partition("@")
+    if name in THRESHOLD_REDUCERS:
+        try:
+            float(threshold)
+        except ValueError:
+            raise ValueError(f"{name!r} needs a numeric threshold, as in '{name}@100:{column.strip()}'.") from None
+    elif reducer.strip() not in REDUCERS:
+        raise ValueError(f"Unknown reducer {reducer!r} in {spec!r}. Known reducers: "
+                         f"{sorted(REDUCERS) + [r + '@<threshold>' for r in THRESHOLD_REDUCERS]}")
+    return reducer.strip(), column.strip()
+
+
+def apply_reducer(reducer: str, times: np.ndarray, values: np.ndarray) -> float:
+    """Apply a reducer name from `parse_output_spec` to a recorded series."""
+    name, _, threshold = reducer.partition("@")
+    if name in THRESHOLD_REDUCERS:
+        return crossing_time(times, values, float(threshold))
+    return float(REDUCERS[reducer](times, values))
+
+
+def reduce_outputs(result, specs: Iterable[str]) -> Dict[str, float]:
+    """Apply output specs to a `model.run()` DataFrame."""
+    times = np.asarray(result.index, dtype=float)
+    columns = {normalize_name(c): c for c in result.columns}
+    reduced = {}
+    for spec in specs:
+        reducer, column = parse_output_spec(spec)
+        values = np.asarray(result[columns.get(normalize_name(column), column)], dtype=float)
+        reduced[spec] = apply_reducer(reducer, times, values)
+    return reduced
+
+
+class StreamingReducer:
+    """A reducer updated with one (time, value) record at a time, without keeping the series.
+
+    Gives the same result as the matching entry of `REDUCERS` applied to all the records.
+    """
+
+    def __init__(self, reducer: str):
+        name, _, threshold = reducer.partition("@")
+        self.name = name
+        self.threshold = float(threshold) if threshold else None
+        self.count = 0
+        self.value = float("nan")
+        self.best_time = float("nan")
+        self.total = 0.0
+        self.previous = None
+        self.side = None
+        self.crossed = False
+
+    def update(self, t: float, v: float):
+        name, previous = self.name, self.previous
+        self.count += 1
+        if name == "final":
+            self.value = v
+        elif name == "initial":
+            if self.count == 1:
+                self.value = v
+        elif name in ("max", "argmax"):
+            if self.count == 1 or v > self.value:
+                self.value, self.best_time = v, t
+        elif name in ("min", "argmin"):
+            if self.count == 1 or v < self.value:
+                self.value, self.best_time = v, t
+        elif name == "mean":
+            self.total += v
+        elif name == "integral":
+            if previous is not None:
+                self.total += (v + previous[1]) * (t - previous[0])
+        elif name == "crossing" and not self.crossed:
+            side = np.sign(v - self.threshold)
+            if self.side is None:
+                self.side = side
+                if side == 0:
+                    self.value, self.crossed = t, True
+            elif side != self.side:
+                t0, v0 = previous
+                self.value = t if v == v0 else t0 + (self.threshold - v0) * (t - t0) / (v - v0)
+                self.crossed = True
+        self.previous = (t, v)
+
+    def result(self) -> float:
+        if self.name in ("argmax", "argmin"):
+            return float(self.best_time)
+        if self.name == "mean":
+            return self.total / self.count if self.count else float("nan")
+        if self.name == "integral":
+            return self.total / 2
+        return float(self.value)
+
+
+def run_lean(model, return_columns: Optional[Iterable[str]] = None, specs: Optional[Iterable[str]] = None,
+             params: Optional[Dict[str, Any]] = None, final_time: Optional[float] = None,
+             time_step: Optional[float] = None) -> Dict[str, Any]:
+    """Run a model like `model.run()` without building a DataFrame.
+
+    Either records scalar `return_columns` into one preallocated float array,
+    or, with `specs` (see `parse_output_spec`), updates a `StreamingReducer`
+    per spec at every saved time and keeps no series at all. In a sweep of
+    thousands of runs this allocates a few bytes per output instead of a
+    DataFrame of every run.
+
+    Args:
+        model: A loaded model.
+        return_columns: Components to record (ignored when `specs` is given).
+        specs: Output specs such as "max:Infected", "integral:Infected" or "crossing@1000:Infected".
+        params, final_time, time_step: As for `model.run()`.
+
+    Returns:
+        With `specs`: {spec: value}. Otherwise dict with `time` (saved times),
+        `columns` and `values` of shape (n_saved_times, n_columns).
+    """
+    columns = list(dict.fromkeys(parse_output_spec(spec)[1] for spec in specs)) if specs is not None \
+        else list(return_columns or [])
+    initialize(model, params, final_time=final_time, time_step=time_step, return_columns=columns)
+    return integrate_lean(model, columns, specs)
+
+
+def integrate_lean(model, return_columns: Iterable[str], specs: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """The integration loop of `run_lean`, from the model's current state to its final time.
+
+    The model must already be configured for the run (see `initialize`). Raises
+    ValueError for subscripted components, which lean runs cannot record.
+    """
+    specs = list(specs) if specs is not None else None
+    parsed = [parse_output_spec(spec) for spec in specs] if specs is not None else None
+    columns = list(dict.fromkeys(c for _, c in parsed)) if parsed is not None else list(return_columns)
+    getters = [component_getter(model, c) for c in columns]
+    for column, getter in zip(columns, getters):
+        if getattr(getter, "subscripts", None):
+            raise ValueError(f"{column!r} is subscripted over {getter.subscripts}; lean runs only record scalar "
+                             "components. Use model.run() for subscripted outputs.")
+    clock = model.time
+    dt = clock.time_step()
+
+    if parsed is not None:
+        position = {c: i for i, c in enumerate(columns)}
+        reducers = [(StreamingReducer(reducer), position[column]) for reducer, column in parsed]
+
+        def record():
+            t = clock()
+            values = [float(g()) for g in getters]
+            for reducer, i in reducers:
+                reducer.update(t, values[i])
+    else:
+        capacity = int((clock.final_time() - clock()) / clock.saveper()) + 2
+        times = np.empty(capacity)
+        buffer = np.empty((capacity, len(columns)))
+        saved = 0
+
+        def record():
+            nonlocal times, buffer, saved
+            if saved == len(times):
+                times, buffer = np.resize(times, 2 * saved), np.resize(buffer, (2 * saved, len(columns)))
+            times[saved] = clock()
+            buffer[saved] = [float(g()) for g in getters]
+            saved += 1
+
+    # The same loop as pysd's `Model._integrate`.
+    while clock.in_bounds():
+        if clock.in_return():
+            record()
+        advance(model, dt)
+    if clock.in_return():
+        record()
+
+    if parsed is not None:
+        return {spec: reducer.result() for spec, (reducer, _) in zip(specs, reducers)}
+    return {"time": times[:saved], "columns": columns, "values": buffer[:saved]}
@@ -0,0 +1,165 @@
+"""Snapshots of a running model, and branches continuing from them.
+
+"Run to t=50, then compare five policies from there" should not re-simulate
+the first 50 time units five times, nor juggle `initial_condition='current'`
+on one mutable model. `run_until` simulates the shared prefix once and
+captures a `Snapshot`:
+
+* the values of every dynamic stateful (stocks, and the internal stages of
+  delays and smooths) as one flat, read-only float array;
+* the remaining stateful data (INITIAL values, delay time buffers...), as
+  exported by pysd;
+* the time, time step and parameters of the prefix, and the model's own
+  FINAL TIME and SAVEPER, which branches run with unless told otherwise.
+
+A snapshot is never modified. `fork` continues any number of branches from
+it, each with its own parameter changes, in worker processes; each branch
+restores a private copy of the state into its own model instance, so
+branches cannot affect each other or the snapshot. Continuing a branch with
+no parameter changes gives exactly the values of an uninterrupted run.
+"""
+import copy
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .simulation import (get_state_vector, initialize, integrate_lean, load_model, parse_output_spec,
+                         set_state_vector)
+
+
+class Snapshot:
+    """The complete state of a model run at one time."""
+
+    def __init__(self, model_path: str, time: float, time_step: float, params: Dict[str, Any],
+                 state: np.ndarray, statefuls: Dict[str, Dict[str, Any]], history: Any = None,
+                 final_time: Optional[float] = None, saveper: Optional[float] = None):
+        self.model_path = model_path
+        self.time = time
+        self.time_step = time_step
+        # pysd keeps control variable overrides on a model, so branches always pass these.
+        self.final_time = final_time
+        self.saveper = saveper
+        self.params = dict(params)
+        self.state = state
+        self.state.flags.writeable = False
+        self.statefuls = statefuls
+        # The prefix's recorded outputs, if requested from `run_until`.
+        self.history = history
+
+    @property
+    def nbytes(self) -> int:
+        return self.state.nbytes
+
+    def __repr__(self):
+        return f"Snapshot({self.model_path!r}, time={self.time}, {len(self.state)} states)"
+
+
+def capture(model, model_path: str, params: Optional[Dict[str, Any]] = None,
+            final_time: Optional[float] = None, saveper: Optional[float] = None) -> Snapshot:
+    """A snapshot of `model`'s current state. `params` are those the model was run with.
+
+    `final_time` and `saveper` are where branches end and how often they record
+    (default: the model's current control variables).
+    """
+    dynamic = {id(e) for e in model._dynamicstateful_elements}
+    statefuls = {}
+    for name, element in model._stateful_elements.items():
+        exported = element.export()
+        if id(element) in dynamic:
+            # Carried by the flat state array.
+            exported.pop("state", None)
+        statefuls[name] = copy.deepcopy(exported)
+    return Snapshot(model_path, float(model.time()), float(model.time.time_step()), params or {},
+                    get_state_vector(model).copy(), statefuls,
+                    final_time=float(model.time.final_time()) if final_time is None else final_time,
+                    saveper=float(model.time.saveper()) if saveper is None else saveper)
+
+
+def restore(model, snapshot: Snapshot) -> None:
+    """Put a model configured for a run starting at `snapshot.time` in the snapshot's state."""
+    model._set_stateful(copy.deepcopy(snapshot.statefuls))
+    set_state_vector(model, np.array(snapshot.state))
+
+
+def run_until(model_path: str, time: float, params: Optional[Dict[str, Any]] = None,
+              time_step: Optional[float] = None, return_columns: Optional[Sequence[str]] = None) -> Snapshot:
+    """Simulate `model_path` from its initial time up to `time` and capture the state there.
+
+    Args:
+        model_path: The model file.
+        time: The time to stop at (the first time step at or after it).
+        params: Parameter overrides for the prefix (and, by default, the branches).
+        time_step: Optional TIME STEP override, kept by the branches.
+        return_columns: Optional components to record over the prefix, in `snapshot.history`.
+    """
+    import pandas as pd
+
+    model = load_model(model_path)
+    final_time, saveper = float(model.time.final_time()), float(model.time.saveper())
+    columns = list(return_columns or [])
+    initialize(model, params, final_time=time, time_step=time_step, return_columns=columns)
+    if model.time() > time:
+        raise ValueError(f"Time {time} is before the model's initial time {model.time()}.")
+    history = integrate_lean(model, columns)
+    snapshot = capture(model, model_path, params, final_time=final_time, saveper=saveper)
+    if return_columns:
+        snapshot.history = pd.DataFrame(history["values"], index=pd.Index(history["time"], name="time"),
+                                        columns=columns)
+    return snapshot
+
+
+# Models loaded in this (worker) process, keyed by path, the file's mtime and overridden parameters
+# as in `ensembles._worker_models`: a model is only reused by branches overriding the same ones.
+_branch_models: Dict[Tuple, Any] = {}
+
+
+def continue_run(snapshot: Snapshot, params: Optional[Dict[str, Any]] = None,
+                 return_columns: Optional[Sequence[str]] = None, specs: Optional[Sequence[str]] = None,
+                 final_time: Optional[float] = None) -> Any:
+    """Continue from a snapshot with `params` changed, up to `final_time` (default: the model's).
+
+    Returns:
+        A DataFrame of `return_columns` from the snapshot time on, like `model.run`'s,
+        or {spec: value} over that period when `specs` are given.
+    """
+    import pandas as pd
+
+    merged = {**snapshot.params, **(params or {})}
+    key = (snapshot.model_path, os.stat(snapshot.model_path).st_mtime_ns, frozenset(merged))
+    model = _branch_models.get(key)
+    if model is None:
+        model = _branch_models[key] = load_model(snapshot.model_path)
+    columns = list(dict.fromkeys(parse_output_spec(s)[1] for s in specs)) if specs else list(return_columns or [])
+    initialize(model, merged, final_time=snapshot.final_time if final_time is None else final_time,
+               time_step=snapshot.time_step, saveper=snapshot.saveper, return_columns=columns,
+               initial_condition=(snapshot.time, {}))
+    restore(model, snapshot)
+    result = integrate_lean(model, columns, specs)
+    if specs:
+        return result
+    return pd.DataFrame(result["values"], index=pd.Index(result["time"], name="time"), columns=columns)
+
+
+def fork(snapshot: Snapshot, branches: Sequence[Optional[Dict[str, Any]]],
+         return_columns: Optional[Sequence[str]] = None, specs: Optional[Sequence[str]] = None,
+         final_time: Optional[float] = None, processes: Optional[int] = None) -> List[Any]:
+    """Continue several branches from one snapshot, in parallel.
+
+    Args:
+        snapshot: From `run_until`.
+        branches: Parameter changes of each branch; `{}` continues unchanged.
+        return_columns, specs, final_time: As for `continue_run`.
+        processes: Worker processes (default: `ensembles.default_processes()`); 1 runs in this process.
+
+    Returns:
+        One result of `continue_run` per branch, in order.
+    """
+    from .ensembles import default_processes, get_pool
+
+    processes = processes or default_processes()
+    if processes == 1 or len(branches) <= 1:
+        return [continue_run(snapshot, b, return_columns, specs, final_time) for b in branches]
+    pool = get_pool(processes)
+    futures = [pool.submit(continue_run, snapshot, b, return_columns, specs, final_time) for b in branches]
+    return [f.result() for f in futures]
@@ -0,0 +1,272 @@
+"""Find where a model settles without simulating to the end of its horizon.
+
+An equilibrium is a state of the stocks at which every net flow is zero. The
+net flows, evaluated at a given state, form a residual function of the stock
+values, so equilibria can be found with a root solver in a handful of
+derivative evaluations instead of thousands of Euler steps:
+
+* "hybr": Powell's hybrid (dogleg quasi-Newton) method, for small models.
+* "krylov": Jacobian-free Newton-Krylov, for models with many stocks.
+
+Local stability comes from the eigenvalues of the finite-difference Jacobian
+of the net flows at the equilibrium: all real parts negative means nearby
+trajectories return to it. For large models only the rightmost eigenvalues
+are computed, from Jacobian-vector products. `trace_equilibria` follows an equilibrium while a
+parameter changes (natural-parameter continuation with a secant predictor)
+and flags where its stability changes, which is where bifurcations are.
+
+Models whose flows depend on time (STEP, PULSE, data series) are solved at
+a fixed time; pass `time` to choose it.
+"""
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .simulation import (component_getter, as_float_array, derivative_vector, get_state_vector, initialize,
+                         load_model, set_state_vector, state_labels)
+
+logger = logging.getLogger(__name__)
+
+# Stocks beyond this size are solved with Newton-Krylov by default.
+KRYLOV_THRESHOLD = 100
+
+
+def residual_function(model) -> Callable[[np.ndarray], np.ndarray]:
+    """F(x): the net flows into the stocks when they hold the values x.
+
+    The returned function counts its calls in its `evaluations` attribute.
+    """
+    def residual(x: np.ndarray) -> np.ndarray:
+        residual.evaluations += 1
+        set_state_vector(model, x)
+        return derivative_vector(model)
+    residual.evaluations = 0
+    return residual
+
+
+def jacobian(residual: Callable[[np.ndarray], np.ndarray], x: np.ndarray, relative_step: float = 1e-6) -> np.ndarray:
+    """Central finite-difference Jacobian of `residual` at `x`."""
+    J = np.empty((len(x), len(x)))
+    for j in range(len(x)):
+        h = relative_step * max(1.0, abs(x[j]))
+        up, down = x.copy(), x.copy()
+        up[j] += h
+        down[j] -= h
+        J[:, j] = (residual(up) - residual(down)) / (2 * h)
+    residual(x)
+    return J
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+def rightmost_eigenvalues(residual: Callable[[np.ndarray], np.ndarray], x: np.ndarray, k: int = 6) -> np.ndarray:
+    """The `k` eigenvalues of the Jacobian of `residual` at `x` with the largest real parts, without forming it.
+
+    ARPACK only needs Jacobian-vector products, each one directional difference
+    (one evaluation of `residual`), so this scales to models with thousands of stocks.
+    """
+    from scipy.sparse.linalg import ArpackNoConvergence, LinearOperator, eigs
+
+    f0 = residual(x)
+    base = np.sqrt(np.finfo(float).eps) * max(1.0, float(np.linalg.norm(x)))
+
+    def matvec(v: np.ndarray) -> np.ndarray:
+        v = np.asarray(v).ravel()
+        if not np.any(v):
+            return np.zeros(len(x), dtype=v.dtype)
+        if np.iscomplexobj(v):
+            return matvec(v.real) + 1j * matvec(v.imag)
+        h = base / float(np.linalg.norm(v))
+        return (residual(x + h * v) - f0) / h
+
+    operator = LinearOperator((len(x), len(x)), matvec=matvec, dtype=float)
+    try:
+        # Stability only needs the signs of the real parts, not many digits.
+        return eigs(operator, k=min(k, len(x) - 2), which="LR", tol=1e-6, return_eigenvectors=False)
+    except ArpackNoConvergence as e:
+        return e.eigenvalues
+
+
+def classify_stability(eigenvalues: np.ndarray, tolerance: float = 1e-8) -> str:
+    """ "stable", "unstable" or "marginal" (some eigenvalue on the imaginary axis, e.g. a conserved quantity)."""
+    if len(eigenvalues) == 0:
+        return "stable"
+    scale = max(1.0, float(np.abs(eigenvalues).max()))
+    real = eigenvalues.real / scale
+    if (real > tolerance).any():
+        return "unstable"
+    if (real >= -tolerance).any():
+        return "marginal"
+    return "stable"
+
+
+def solve_equilibrium(model, guess: Optional[np.ndarray] = None, method: str = "auto",
+                      tolerance: float = 1e-8, max_evaluations: int = 2000) -> Dict[str, Any]:
+    """Solve for an equilibrium of an initialized model, starting from `guess` (default: its current state).
+
+    The model is left at the equilibrium found, so its components can be read. The
+    solver stops after `max_evaluations` derivative evaluations and then reports the
+    best state it saw. Stability comes from the full Jacobian (2n + 1 more
+    evaluations) for models of up to KRYLOV_THRESHOLD stocks, and otherwise from the
+    rightmost eigenvalues within what is left of `max_evaluations`; it is "unknown"
+    when that runs out.
+
+    A state where stocks that were non-negative at the start went negative (e.g.
+    a population, or the stages of a delay) is not reported as converged; those
+    stocks are listed in `negative_stocks`.
+
+    Returns:
+        dict with `converged`, `state` (flat array), `residual_norm`, `evaluations`
+        (derivative evaluations, including the stability analysis'), `negative_stocks`,
+        `eigenvalues` and `stability`.
+    """
+    from scipy import optimize
+
+    residual = residual_function(model)
+    x0 = get_state_vector(model) if guess is None else np.asarray(guess, dtype=float)
+    best = {"x": x0, "norm": np.inf}
+
+    def budgeted(x: np.ndarray) -> np.ndarray:
+        # scipy's krylov `maxiter` counts Newton iterations, not evaluations, so the budget is kept here.
+        if residual.evaluations >= max_evaluations:
+            raise _BudgetExhausted()
+        value = residual(x)
+        norm = float(np.linalg.norm(value))
+        if norm < best["norm"]:
+            best["x"], best["norm"] = np.array(x, dtype=float).reshape(len(x0)), norm
+        return value
+
+    if method == "auto":
+        method = "krylov" if len(x0) > KRYLOV_THRESHOLD else "hybr"
+    try:
+        if method == "hybr":
+            solution = optimize.root(budgeted, x0, method="hybr", options={"xtol": tolerance, "maxfev": max_evaluations})
+        elif method == "krylov":
+            solution = optimize.root(budgeted, x0, method="krylov", options={"fatol": tolerance})
+        else:
+            raise ValueError(f"Unknown method {method!r}. Use 'auto', 'hybr' or 'krylov'.")
+        x = np.asarray(solution.x, dtype=float).reshape(len(x0))
+    except _BudgetExhausted:
+        logger.info(f"Equilibrium solver ({method}) used up its {max_evaluations} evaluations")
+        x = best["x"]
+
+    residual_norm = float(np.linalg.norm(residual(x)))
+    scale = max(1.0, float(np.linalg.norm(x)))
+    labels = state_labels(model)
+    negative = [labels[i] for i in np.flatnonzero((x < -np.sqrt(tolerance) * scale) & (x0 >= 0))]
+    # Stability from the full Jacobian for small models, from its rightmost eigenvalues for large ones,
+    # with whatever is left of the budget.
+    try:
+        if len(x) <= KRYLOV_THRESHOLD:
+            eigenvalues = np.linalg.eigvals(jacobian(residual, x)) if len(x) else np.empty(0)
+        else:
+            eigenvalues = rightmost_eigenvalues(budgeted, x)
+        stability = classify_stability(eigenvalues) if len(eigenvalues) or not len(x) else "unknown"
+    except _BudgetExhausted:
+        eigenvalues, stability = np.empty(0), "unknown"
+    set_state_vector(model, x)
+    return {
+        "converged": bool(residual_norm <= np.sqrt(tolerance) * scale and not negative),
+        "state": x,
+        "residual_norm": residual_norm,
+        "evaluations": residual.evaluations,
+        "negative_stocks": negative,
+        "method": method,
+        "eigenvalues": eigenvalues,
+        "stability": stability,
+    }
+
+
+def _report(model, result: Dict[str, Any], outputs: Sequence[str]) -> Dict[str, Any]:
+    """Make a `solve_equilibrium` result JSON friendly, naming stocks and adding requested outputs."""
+    report = dict(result)
+    report["state"] = dict(zip(state_labels(model), map(float, result["state"])))
+    order = np.argsort(-result["eigenvalues"].real)
+    report["eigenvalues"] = [{"real": float(e.real), "imag": float(e.imag)} for e in result["eigenvalues"][order]]
+    report["outputs"] = {name: as_float_array(component_getter(model, name)()).tolist() for name in outputs}
+    return report
+
+
+def _start(model, params: Optional[Dict[str, Any]], time: Optional[float]) -> None:
+    initialize(model, params)
+    if time is not None:
+        model.time.update(time)
+        model.clean_caches()
+
+
+def find_equilibrium(model_path: str, params: Optional[Dict[str, Any]] = None,
+                     initial_guess: Optional[Dict[str, float]] = None, outputs: Sequence[str] = (),
+                     time: Optional[float] = None, method: str = "auto") -> Dict[str, Any]:
+    """The equilibrium of a model nearest (in the solver's sense) to its initial condition or `initial_guess`.
+
+    Args:
+        model_path: The model file.
+        params: Parameter overrides, as for `model.run`.
+        initial_guess: Starting values for some stocks, by label (see `simulation.state_labels`);
+            other stocks start from their initial values.
+        outputs: Components to evaluate at the equilibrium, e.g. flows.
+        time: Time at which time-dependent flows are evaluated (default: the initial time).
+        method: "auto", "hybr" or "krylov".
+
+    Returns:
+        dict with `converged`, the equilibrium `state` per stock, `outputs`, `residual_norm`,
+        `evaluations`, `negative_stocks`, `eigenvalues` (largest real part first) and `stability`.
+    """
+    model = load_model(model_path)
+    _start(model, params, time)
+    guess = get_state_vector(model)
+    if initial_guess:
+        labels = state_labels(model)
+        for label, value in initial_guess.items():
+            if label not in labels:
+                raise KeyError(f"{label!r} is not a stock of {model_path}. Stocks: {labels}")
+            guess[labels.index(label)] = value
+    return _report(model, solve_equilibrium(model, guess, method), outputs)
+
+
+def trace_equilibria(model_path: str, parameter: str, values: Sequence[float],
+                     params: Optional[Dict[str, Any]] = None, initial_guess: Optional[Dict[str, float]] = None,
+                     outputs: Sequence[str] = (), time: Optional[float] = None,
+                     method: str = "auto") -> Dict[str, Any]:
+    """Follow an equilibrium as `parameter` steps through `values` (natural-parameter continuation).
+
+    Each solve starts from a secant extrapolation of the two previous
+    equilibria, so the branch is followed rather than re-found from scratch.
+
+    Returns:
+        dict with one `branch` entry per value (as returned by `find_equilibrium`, plus
+        the parameter `value`) and the `stability_changes` between consecutive values.
+    """
+    model = load_model(model_path)
+    labels = None
+    branch: List[Dict[str, Any]] = []
+    solved: List[np.ndarray] = []
+    for k, value in enumerate(values):
+        _start(model, {**(params or {}), parameter: value}, time)
+        if labels is None:
+            labels = state_labels(model)
+        if len(solved) >= 2:
+            ratio = (value - values[k - 1]) / (values[k - 1] - values[k - 2]) if values[k - 1] != values[k - 2] else 0
+            guess = solved[-1] + ratio * (solved[-1] - solved[-2])
+        elif solved:
+            guess = solved[-1]
+        else:
+            guess = get_state_vector(model)
+            for label, v in (initial_guess or {}).items():
+                guess[labels.index(label)] = v
+        result = solve_equilibrium(model, guess, method)
+        if not result["converged"] and len(solved) >= 2:
+            # The secant step can overshoot near a turning point; retry from the last equilibrium.
+            result = solve_equilibrium(model, solved[-1], method)
+        solved.append(result["state"] if result["converged"] else solved[-1] if solved else result["state"])
+        branch.append({"value": float(value), **_report(model, result, outputs)})
+
+    changes = [
+        {"between": [a["value"], b["value"]], "from": a["stability"], "to": b["stability"]}
+        for a, b in zip(branch, branch[1:])
+        if a["converged"] and b["converged"] and a["stability"] != b["stability"]
+    ]
+    return {"parameter": parameter, "branch": branch, "stability_changes": changes}
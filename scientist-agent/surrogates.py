@@ -0,0 +1,155 @@
+"""Replace a model component with a fitted regressor, cheaply.
+
+The cookbook recipe (`Surrogating_with_regression.ipynb`) swaps
+`model.components.defect_rate` for a function calling `regression.predict`
+on one sample per timestep. Predicting one row at a time dominates the run
+and cannot be shared across ensemble members. This module offers two remedies:
+
+* `compile_lookup_grid` evaluates the regressor once, in a single batched
+  `predict`, on a regular grid over the input bounds. Evaluating the surrogate
+  inside a run is then a multilinear interpolation, about as cheap as a
+  Vensim lookup table.
+* `run_ensemble_with_surrogate` advances all ensemble members in lock-step and
+  evaluates the surrogate for all of them with one batched call per timestep.
+"""
+import bisect
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .simulation import as_float_array, component_getter, load_model, resolve_py_name, run_lockstep
+
+
+class LookupGrid:
+    """A regressor precompiled onto a regular N-D grid, interpolated multilinearly.
+
+    Inputs outside the grid are clamped to its bounds, like Vensim lookups.
+    """
+
+    def __init__(self, axes: Sequence[np.ndarray], values: np.ndarray):
+        self.axes = [np.asarray(a, dtype=float) for a in axes]
+        self.values = np.asarray(values, dtype=float)
+        self._axes_lists = [a.tolist() for a in self.axes]
+        self._corners = list(itertools.product((0, 1), repeat=len(self.axes)))
+
+    def __call__(self, points: np.ndarray) -> np.ndarray:
+        """Interpolate at `points`, an array of shape (n, n_inputs)."""
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        lower, fraction = [], []
+        for d, axis in enumerate(self.axes):
+            x = np.clip(points[:, d], axis[0], axis[-1])
+            i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+            lower.append(i)
+            fraction.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+        result = np.zeros(len(points))
+        for corner in self._corners:
+            weight = np.ones(len(points))
+            index = []
+            for d, offset in enumerate(corner):
+                weight *= fraction[d] if offset else 1 - fraction[d]
+                index.append(lower[d] + offset)
+            result += weight * self.values[tuple(index)]
+        return result
+
+    def scalar(self, *inputs: float) -> float:
+        """Interpolate at a single point without numpy call overhead (the per-timestep path)."""
+        lower, fraction = [], []
+        for axis, x in zip(self._axes_lists, inputs):
+            x = min(max(x, axis[0]), axis[-1])
+            i = min(max(bisect.bisect_right(axis, x) - 1, 0), len(axis) - 2)
+            lower.append(i)
+            fraction.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+        total = 0.0
+        for corner in self._corners:
+            weight = 1.0
+            for d, offset in enumerate(corner):
+                weight *= fraction[d] if offset else 1 - fraction[d]
+            if weight:
+                total += weight * self.values.item(tuple(l + o for l, o in zip(lower, corner)))
+        return total
+
+
+def _predict_function(regressor: Any) -> Callable[[np.ndarray], np.ndarray]:
+    """Accept sklearn-style regressors (with `.predict`) or plain vectorized callables."""
+    predict = getattr(regressor, "predict", regressor)
+    return lambda X: np.asarray(predict(X), dtype=float).reshape(len(X))
+
+
+def bounds_from_data(data: Any, columns: Sequence[str]) -> List[Tuple[float, float]]:
+    """Per-column (min, max) of a DataFrame or CSV path, e.g. the data the regressor was fit on."""
+    if isinstance(data, str):
+        import pandas as pd
+        data = pd.read_csv(data, usecols=list(columns))
+    return [(float(data[c].min()), float(data[c].max())) for c in columns]
+
+
+def compile_lookup_grid(regressor: Any, bounds: Sequence[Tuple[float, float]],
+                        resolution: int = 25) -> LookupGrid:
+    """Evaluate `regressor` once on a `resolution`^N grid spanning `bounds`."""
+    axes = [np.linspace(low, high, resolution) for low, high in bounds]
+    mesh = np.meshgrid(*axes, indexing="ij")
+    points = np.column_stack([m.ravel() for m in mesh])
+    values = _predict_function(regressor)(points).reshape(mesh[0].shape)
+    return LookupGrid(axes, values)
+
+
+def substitute_component(model, component: str, regressor: Any, inputs: Sequence[str],
+                         bounds: Optional[Sequence[Tuple[float, float]]] = None,
+                         resolution: int = 25) -> Callable:
+    """Replace `component` of a single model with a surrogate driven by `inputs`.
+
+    With `bounds`, the regressor is precompiled onto a lookup grid; otherwise it
+    is called with one row per evaluation, as in the cookbook recipe.
+
+    Returns:
+        The original component function, so it can be put back with
+        `setattr(model.components, py_name, original)`.
+    """
+    py_name = resolve_py_name(model, component)
+    original = getattr(model.components, py_name)
+    getters = [component_getter(model, name) for name in inputs]
+
+    if bounds is not None:
+        grid = compile_lookup_grid(regressor, bounds, resolution)
+
+        def surrogate():
+            return grid.scalar(*(float(g()) for g in getters))
+    else:
+        predict = _predict_function(regressor)
+
+        def surrogate():
+            return float(predict(np.array([[float(g()) for g in getters]]))[0])
+
+    setattr(model.components, py_name, surrogate)
+    return original
+
+
+def run_ensemble_with_surrogate(model_path: str, params: List[Dict[str, Any]], component: str,
+                                regressor: Any, inputs: Sequence[str], return_columns: Sequence[str],
+                                bounds: Optional[Sequence[Tuple[float, float]]] = None,
+                                resolution: int = 25, **control) -> Dict[str, Any]:
+    """Run one ensemble member per entry of `params`, with `component` replaced by a surrogate.
+
+    All members advance together; at each timestep the surrogate inputs of
+    every member are gathered into one (n_members, n_inputs) array and the
+    surrogate (grid or regressor) is evaluated once for all of them.
+
+    Returns:
+        The `run_lockstep` result: `time`, `columns` and a (members, times, columns) `values` array.
+    """
+    predict = compile_lookup_grid(regressor, bounds, resolution) if bounds is not None \
+        else _predict_function(regressor)
+
+    models = [load_model(model_path) for _ in params]
+    py_name = resolve_py_name(models[0], component)
+    cells = np.zeros(len(models))
+    for k, model in enumerate(models):
+        setattr(model.components, py_name, lambda k=k: cells[k])
+    getters = [[component_getter(m, name) for name in inputs] for m in models]
+
+    def evaluate_surrogate(_models):
+        X = np.array([[float(as_float_array(g())) for g in member] for member in getters])
+        cells[:] = predict(X)
+
+    return run_lockstep(models, return_columns, params=params, before_step=evaluate_surrogate, **control)
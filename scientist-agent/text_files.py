@@ -0,0 +1,181 @@
+"""Bounded reads of large text and CSV files.
+
+Nothing here reads a whole file into memory: line ranges are streamed, byte
+ranges are read with a single seek, and CSV previews keep only a fixed-size
+sample while scanning the file once to count rows and infer column types.
+"""
+import csv
+import os
+import random
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_MAX_BYTES = 64 * 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, offset: int = 0) -> Iterator[bytes]:
+    """Yield the file's bytes from `offset` onwards in chunks of at most `chunk_size`."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def read_byte_range(path: str, offset: int = 0, max_bytes: int = DEFAULT_MAX_BYTES) -> Dict[str, Any]:
+    """Read up to `max_bytes` starting at byte `offset`."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    end = offset + len(data)
+    return {
+        "content": data.decode("utf-8", errors="replace"),
+        "byte_offset": offset,
+        "next_byte_offset": end if end < size else None,
+        "file_size": size,
+        "truncated": end < size,
+    }
+
+
+def read_line_range(path: str, start_line: int = 0, max_lines: Optional[int] = None,
+                    max_bytes: int = DEFAULT_MAX_BYTES) -> Dict[str, Any]:
+    """Read lines `start_line`, `start_line + 1`, ... (0-based) until `max_lines` or `max_bytes` is reached.
+
+    A first line longer than `max_bytes` (minified JSON, a CSV without line
+    breaks) is cut at `max_bytes`, with `partial_line` set; `next_byte_offset`
+    is where `read_byte_range` continues it.
+    """
+    lines: List[bytes] = []
+    used = 0
+    next_line = None
+    partial = False
+    with open(path, "rb") as f:
+        # Skip in bounded pieces: a line is only counted once its newline was read.
+        number = 0
+        while number < start_line:
+            piece = f.readline(DEFAULT_CHUNK_SIZE)
+            if not piece:
+                break
+            number += piece.endswith(b"\n")
+        offset = f.tell()
+        while True:
+            position = f.tell()
+            # One byte more than fits, to tell a line that fits from one that does not.
+            line = f.readline(max_bytes - used + 1)
+            if not line:
+                break
+            if (max_lines is not None and len(lines) >= max_lines) or (lines and len(line) > max_bytes - used):
+                f.seek(position)
+                next_line = number
+                break
+            if len(line) > max_bytes:
+                cut = max_bytes
+                # Do not split a UTF-8 character.
+                while 0 < cut and line[cut] & 0xC0 == 0x80:
+                    cut -= 1
+                lines.append(line[:cut or max_bytes])
+                f.seek(position + len(lines[0]))
+                partial = True
+                next_line = number + 1
+                break
+            lines.append(line)
+            used += len(line)
+            number += 1
+        end = f.tell()
+    size = os.path.getsize(path)
+    return {
+        "content": b"".join(lines).decode("utf-8", errors="replace"),
+        "start_line": start_line,
+        "lines_returned": len(lines),
+        "next_line": next_line,
+        "partial_line": partial,
+        "byte_offset": offset,
+        "next_byte_offset": end if end < size else None,
+        "file_size": size,
+        "truncated": next_line is not None,
+    }
+
+
+def _infer_type(value: str) -> Optional[str]:
+    value = value.strip()
+    if value == "" or value.lower() in ("na", "nan", "null", "none"):
+        return None
+    if value.lower() in ("true", "false"):
+        return "bool"
+    try:
+        int(value)
+        return "int"
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return "float"
+    except ValueError:
+        return "string"
+
+
+# When a column has seen several types, the result is the most general one.
+_TYPE_ORDER = ["bool", "int", "float", "string"]
+
+
+def csv_preview(path: str, head_rows: int = 5, sample_rows: int = 20, seed: int = 0) -> Dict[str, Any]:
+    """Scan a CSV once and return its header, first rows, a uniform row sample and an inferred schema.
+
+    The sample is drawn by reservoir sampling, so memory stays bounded by
+    `head_rows + sample_rows` rows whatever the file size.
+    """
+    rng = random.Random(seed)
+    head: List[List[str]] = []
+    sample: List[List[str]] = []
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        sniffed = f.read(8192)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sniffed, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, [])
+        columns = [{"name": name, "type": None, "nulls": 0, "min": None, "max": None} for name in header]
+
+        rows = 0
+        for row in reader:
+            if not row:
+                continue
+            if len(head) < head_rows:
+                head.append(row)
+            elif len(sample) < sample_rows:
+                sample.append(row)
+            else:
+                j = rng.randrange(rows - len(head) + 1)
+                if j < sample_rows:
+                    sample[j] = row
+            rows += 1
+
+            for column, value in zip(columns, row):
+                kind = _infer_type(value)
+                if kind is None:
+                    column["nulls"] += 1
+                    continue
+                if column["type"] is None or _TYPE_ORDER.index(kind) > _TYPE_ORDER.index(column["type"]):
+                    column["type"] = kind
+                if kind in ("int", "float"):
+                    number = float(value)
+                    column["min"] = number if column["min"] is None else min(column["min"], number)
+                    column["max"] = number if column["max"] is None else max(column["max"], number)
+
+    for column in columns:
+        if column["type"] in ("string", "bool", None):
+            column["min"] = column["max"] = None
+        column["type"] = column["type"] or "empty"
+
+    return {
+        "columns": columns,
+        "rows": rows,
+        "head": head,
+        "sample": sample,
+        "file_size": os.path.getsize(path),
+    }
@@ -0,0 +1,140 @@
+"""Exogenous time series inputs resampled once onto a model's integration grid.
+
+pysd turns a `pd.Series` passed in `params` (a historical emissions series,
+a temperature schedule) into a function that calls `np.interp` on the
+series' index and values at every time step, so a long driver such as
+`global_emissions.csv` costs a search over the whole series per step.
+
+`grid_params` resamples each series once, onto the times the run will step
+through, into a contiguous float array. The model then reads the input with
+an index lookup. The grid reproduces pysd's clock (the time step is added
+repeatedly, not multiplied), so a lookup returns exactly what `np.interp`
+would. At any other time (adaptive solvers, a changed time step) the input
+falls back to interpolating the original series.
+
+`grid_ensemble_params` does the same for a list of per-member params: the
+series of one parameter across all members share one 2-D array with a row
+per member.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def integration_times(model, final_time: Optional[float] = None, time_step: Optional[float] = None) -> np.ndarray:
+    """The times a run of `model` steps through, computed exactly as pysd advances its clock.
+
+    One extra step past the final time is included, since the last record may fall just after it.
+    """
+    components = model.components
+    t = float(components.initial_time())
+    final = float(components.final_time() if final_time is None else final_time)
+    dt = float(components.time_step() if time_step is None else time_step)
+    times = [t]
+    for _ in range(int(round((final - t) / dt)) + 1):
+        t = t + dt
+        times.append(t)
+    return np.array(times)
+
+
+def resample(series: Any, times: np.ndarray) -> np.ndarray:
+    """Values of a series (or of each series of a list or each column of a DataFrame) at `times`.
+
+    Returns:
+        A 1-D array for one series, or a C-contiguous 2-D array with one row per series.
+    """
+    import pandas as pd
+
+    if isinstance(series, pd.DataFrame):
+        series = [series[c] for c in series.columns]
+    if isinstance(series, pd.Series):
+        return np.interp(times, np.asarray(series.index, dtype=float), np.asarray(series.values, dtype=float))
+    rows = np.empty((len(series), len(times)))
+    for i, s in enumerate(series):
+        rows[i] = np.interp(times, np.asarray(s.index, dtype=float), np.asarray(s.values, dtype=float))
+    return rows
+
+
+class GriddedSeries:
+    """A model input read from values precomputed on the integration grid.
+
+    Calling it returns the input at the model's current time, like the
+    function pysd builds from a `pd.Series`.
+    """
+
+    def __init__(self, model, series: Any, times: np.ndarray, values: np.ndarray):
+        self.clock = model.time
+        self.times = times
+        self.values = values
+        self.t0 = float(times[0])
+        self.inverse_dt = 1.0 / float(times[1] - times[0]) if len(times) > 1 else 0.0
+        self.index = np.asarray(series.index, dtype=float)
+        self.data = np.asarray(series.values, dtype=float)
+
+    def __call__(self) -> float:
+        t = self.clock()
+        k = int(round((t - self.t0) * self.inverse_dt))
+        if 0 <= k < len(self.times) and self.times[k] == t:
+            return self.values.item(k)
+        return float(np.interp(t, self.index, self.data))
+
+
+def _griddable(model, name: str, value: Any) -> bool:
+    """Whether `value` is a scalar time series for an ordinary (not lookup, data or subscripted) component."""
+    import pandas as pd
+    import xarray as xr
+
+    from .simulation import component_getter
+
+    if not isinstance(value, pd.Series) or len(value) == 0 or isinstance(value.values[0], xr.DataArray):
+        return False
+    try:
+        func = component_getter(model, name)
+    except KeyError:
+        return False
+    if getattr(func, "type", None) in ("Lookup", "Data"):
+        return False
+    return not model.get_coords(func)
+
+
+def grid_params(model, params: Optional[Dict[str, Any]], final_time: Optional[float] = None,
+                time_step: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """`params` with each scalar `pd.Series` replaced by a `GriddedSeries` for this run.
+
+    Other values, and series for lookups, data or subscripted components, are
+    left for pysd to handle as usual.
+
+    Args:
+        model: The model the params are for.
+        params: Parameter overrides, as for `model.run`.
+        final_time, time_step: The run's overrides of the control variables, if any.
+    """
+    if not params:
+        return params
+    griddable = [name for name, value in params.items() if _griddable(model, name, value)]
+    if not griddable:
+        return params
+    times = integration_times(model, final_time, time_step)
+    gridded = dict(params)
+    for name in griddable:
+        gridded[name] = GriddedSeries(model, params[name], times, resample(params[name], times))
+    return gridded
+
+
+def grid_ensemble_params(model, params_list: Sequence[Dict[str, Any]], final_time: Optional[float] = None,
+                         time_step: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Per-member params with their time series resampled together, one 2-D array per parameter.
+
+    Each member's input reads its own row of the array.
+    """
+    params_list = [dict(p or {}) for p in params_list]
+    names = {name for p in params_list for name, value in p.items() if _griddable(model, name, value)}
+    if not names:
+        return params_list
+    times = integration_times(model, final_time, time_step)
+    for name in sorted(names):
+        members = [i for i, p in enumerate(params_list) if name in p and _griddable(model, name, p[name])]
+        rows = resample([params_list[i][name] for i in members], times)
+        for row, i in zip(rows, members):
+            params_list[i][name] = GriddedSeries(model, params_list[i][name], times, row)
+    return params_list
@@ -1,53 +1,181 @@
 # from google.adk.agents import Agent
-from google.adk.agents.llm_agent import Agent
 # from google.adk.code_executors.built_in_code_executor import BuiltInCodeExecutor
 # from google.adk.tools import built_in_code_execution
 # from google.adk.tools import google_search
 from google.adk.tools import ToolContext
-from google.genai import types
 import os
-import pysd
-import pandas as pd
-import numpy as np
 import re
 import pathlib
 import asyncio
 import logging
+import threading
 from typing import List, Dict, Any, Optional
 
+from .catalog import find_variables, get_model_entry, invalidate_model, refresh_catalog, summarize_entry
+from .profiling import install_pysd_hooks, profiling_enabled
+from .search import search_equations, variable_dependencies
+from .settings import MODELS_DIRECTORY
+from .text_files import DEFAULT_MAX_BYTES, csv_preview, read_byte_range, read_line_range
+
+# pysd, pandas, numpy, matplotlib, google.genai and browser_use are heavy to import
+# and only needed once a tool actually runs, so they are loaded lazily.
+# See `_ensure_scientific_imports` and `preload_in_background`.
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-READ_ALLOWED_DIRECTORIES = ["source/models"]
-WRITE_ALLOWED_DIRECTORIES = ["source/models"]
+READ_ALLOWED_DIRECTORIES = [MODELS_DIRECTORY, "source/data"]
+WRITE_ALLOWED_DIRECTORIES = [MODELS_DIRECTORY]
+JOB_PRIORITIES = {"high": 1, "normal": 0, "low": -1}
+
+_scientific_imports_lock = threading.Lock()
+_scientific_imports_loaded = False
+
+
+def _ensure_scientific_imports() -> None:
+    """Import pysd, pandas, numpy and matplotlib into this module's globals.
+
+    `execute_python_code_snippet` runs code against these globals and promises
+    that the libraries are already imported.
+    """
+    global _scientific_imports_loaded
+    if _scientific_imports_loaded:
+        return
+    with _scientific_imports_lock:
+        if _scientific_imports_loaded:
+            return
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import numpy as np
+        import pandas as pd
+        import pysd
+        from . import (census, compiler, dense, integrators, sharedpool, simulation, snapshots, surrogates,
+                       timeseries)
+        globals().update(pysd=pysd, pd=pd, np=np, plt=plt, simulation=simulation, surrogates=surrogates,
+                         integrators=integrators, compiler=compiler, dense=dense, timeseries=timeseries,
+                         snapshots=snapshots, sharedpool=sharedpool, census=census)
+        if profiling_enabled():
+            install_pysd_hooks()
+        _scientific_imports_loaded = True
+        logger.info("Scientific libraries loaded.")
 
-def read_text_file(path: str) -> Dict[str, Any]:
-    """Read the contents of a text file."""
+
+def preload_in_background(delay: Optional[float] = None) -> Optional[threading.Timer]:
+    """Warm up the heavy imports on a daemon thread shortly after startup.
+
+    This keeps `adk web` startup fast while making the first tool call cheap.
+    The delay defaults to SCIENTIST_AGENT_PRELOAD_DELAY (seconds, 2 if unset);
+    a negative value disables preloading.
+    """
+    if delay is None:
+        delay = float(os.environ.get("SCIENTIST_AGENT_PRELOAD_DELAY", "2"))
+    if delay < 0:
+        return None
+    timer = threading.Timer(delay, _ensure_scientific_imports)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+def _check_read_allowed(path: str) -> None:
     # Only allow reading from allowed directories
     if not any(path.startswith(allowed_dir) for allowed_dir in READ_ALLOWED_DIRECTORIES):
-        raise ValueError(f"Writing to {path} is not allowed. Allowed directories: {READ_ALLOWED_DIRECTORIES}")
+        raise ValueError(f"Reading {path} is not allowed. Allowed directories: {READ_ALLOWED_DIRECTORIES}")
+
+
+def read_text_file(path: str, start_line: int = 0, max_lines: Optional[int] = None,
+                   byte_offset: Optional[int] = None, max_bytes: int = DEFAULT_MAX_BYTES) -> Dict[str, Any]:
+    """Read the contents of a text file, or a slice of it.
+    Large files are returned in pieces: if `truncated` is true, call again with `start_line` set to
+    the returned `next_line` (or `byte_offset` set to the returned `next_byte_offset`) to continue.
+    A single line longer than `max_bytes` is cut (`partial_line` is true); continue it with `byte_offset`.
+    For CSV files, prefer preview_csv_file.
+    
+    Args:
+        path: The path of the file. For eg: "source/models/Teacup/Teacup.mdl"
+        start_line: First line to return (0-based). Ignored when `byte_offset` is given.
+        max_lines: Maximum number of lines to return. Default is no line limit.
+        byte_offset: If given, return raw content starting at this byte instead of whole lines.
+        max_bytes: Maximum size of the returned content. Default is 64 KB.
+    
+    Returns:
+        dict: `status`, `content`, `truncated`, `file_size` and either `next_line` or `next_byte_offset`.
+    """
+    _check_read_allowed(path)
 
+    if byte_offset is not None:
+        result = read_byte_range(path, offset=byte_offset, max_bytes=max_bytes)
+    else:
+        result = read_line_range(path, start_line=start_line, max_lines=max_lines, max_bytes=max_bytes)
+    return {
+        "status": "success",
+        **result,
+        "logs": f"Read {path} successfully." + (" Output was truncated." if result["truncated"] else "")
+    }
+
+
+def preview_csv_file(path: str, head_rows: int = 5, sample_rows: int = 20) -> Dict[str, Any]:
+    """Preview a CSV file without loading it: header, first rows, a random sample of rows and an inferred schema.
+    
+    Args:
+        path: The path of the CSV file. For eg: "source/data/Climate/global_emissions.csv"
+        head_rows: Number of leading rows to return.
+        sample_rows: Number of rows sampled uniformly from the rest of the file.
+    
+    Returns:
+        dict: `status`, `columns` (name, type, null count, min and max), total `rows`, `head` and `sample`.
+    """
+    _check_read_allowed(path)
     return {
         "status": "success",
-        "content": pathlib.Path(path).read_text(),
-        "logs": f"Read {path} successfully."
+        **csv_preview(path, head_rows=head_rows, sample_rows=sample_rows),
+        "logs": f"Previewed {path} successfully."
     }
 
 
 def write_text_file(path: str, content: str) -> Dict[str, Any]:
-    """Write content to a text file."""
+    """Write content to a text file.
+    A Vensim model (.mdl) is re-translated right away, re-parsing only the equations that changed,
+    so `simulation.load_model(path)` loads the new version without translating it again.
+    """
 
     # Only allow writing to allowed directories
     if not any(path.startswith(allowed_dir) for allowed_dir in WRITE_ALLOWED_DIRECTORIES):
         raise ValueError(f"Writing to {path} is not allowed. Allowed directories: {WRITE_ALLOWED_DIRECTORIES}")
 
+    is_vensim_model = path.lower().endswith(".mdl")
+    previous_text = pathlib.Path(path).read_text(errors="ignore") if is_vensim_model and os.path.exists(path) else None
+    result = pathlib.Path(path).write_text(content)
+    invalidate_model(path)
+    if not is_vensim_model:
+        return {
+            "status": "success",
+            "result": result,
+            "logs": f"Wrote to {path} successfully."
+        }
+
+    from .retranslation import invalidate_results, retranslate
+
+    try:
+        translation = retranslate(path, previous_text)
+    except Exception as e:
+        return {
+            "status": "success",
+            "result": result,
+            "translation_error": str(e),
+            "logs": f"Wrote to {path}, but pysd could not translate it: {e}"
+        }
+    dropped = invalidate_results(path, translation["model"], translation["changed"], translation["structural"])
     return {
         "status": "success",
-        "result": pathlib.Path(path).write_text(content),
-        "logs": f"Wrote to {path} successfully."
+        "result": result,
+        "changed_components": translation["changed"],
+        "logs": f"Wrote to {path} and re-translated it in {translation['seconds']:.3f}s "
+                f"({translation['parsed']} of {translation['equations']} equations parsed, "
+                f"{len(translation['changed'])} components changed, {sum(dropped.values())} cached results dropped)."
     }
 
 
@@ -79,7 +207,7 @@ def list_directory(path: str, recursive: bool = False) -> Dict[str, Any]:
                         "type": "file" if entry.is_file() else "directory",
                     })
                     
-            print(f"Path: {path}, Entries: {entries}")
+            logger.debug(f"Path: {path}, Entries: {entries}")
             
             return {
                 "status": "success",
@@ -96,16 +224,461 @@ def list_models(topic: str) -> Dict[str, Any]:
         example: "Epidemic"
     
     Returns:
-        dict: A dictionary containing the `status` (success/failure), and `files` whose value is an array of strings which are paths to model files (either vensim or xmile) inside `source/models/<topic>`.
-        example: {"status": "success", "entries": ["SI.mdl", "SIR.xmile", "SEIR.mdl"], "logs": "Listed models successfully."}
+        dict: A dictionary containing the `status` (success/failure), and `entries` whose value is an array of model files (either vensim or xmile) inside `source/models/<topic>`, each with its `path`, its stocks and its time bounds.
+        example: {"status": "success", "entries": [{"path": "source/models/Epidemic/SIR.mdl", "type": "file", "stocks": ["Susceptible", "Infected", "Recovered"], "time": {"initial_time": 0.0, "final_time": 50.0, "time_step": 0.0625, "units": "Day"}}], "logs": "Listed models successfully."}
+    """
+    root = os.path.normpath(os.path.join(MODELS_DIRECTORY, topic))
+    entries = [
+        {
+            "path": path,
+            "type": "file",
+            "stocks": [v["name"] for v in entry["variables"] if v["kind"] == "stock"],
+            "time": entry["time"],
+        }
+        for path, entry in sorted(refresh_catalog().items())
+        if path == root or path.startswith(root + os.sep)
+    ]
+    return {
+        "status": "success",
+        "entries": entries,
+        "logs": f"Listed {len(entries)} models in {root} successfully."
+    }
+
+
+def describe_model(path: str) -> Dict[str, Any]:
+    """Describes a model without translating or running it.
+    
+    Args:
+        path: Path of a model file as returned by `list_models`. For eg: "source/models/Epidemic/SIR.mdl"
+    
+    Returns:
+        dict: `status`, and `model` with the model's time bounds, subscripts and its stocks, flows, constants, auxiliaries and lookups (with units, docs, constant values and stock inflows/outflows).
+    """
+    entry = get_model_entry(path)
+    if entry is None:
+        return {"status": "failure", "logs": f"{path} is not a model file under {MODELS_DIRECTORY}."}
+    return {
+        "status": "success",
+        "model": summarize_entry(entry),
+        "logs": f"Described {path} successfully."
+    }
+
+
+def find_model_variables(name: str, kind: Optional[str] = None, topic: str = "") -> Dict[str, Any]:
+    """Finds variables by name across all models, without opening the model files.
+    Useful for questions like "which models have a stock named Infected?".
+    
+    Args:
+        name: Part of the variable name, case-insensitive. For eg: "Infected"
+        kind: Optional variable kind: "stock", "flow", "constant", "auxiliary", "lookup", "data" or "undefined".
+        topic: Optional subdirectory of "source/models/" to restrict the search to. For eg: "Epidemic"
+    
+    Returns:
+        dict: `status` and `matches`, a list of {model, name, kind, units, equation}.
+    """
+    matches = find_variables(name, kind=kind, topic=topic)
+    return {
+        "status": "success",
+        "matches": matches,
+        "logs": f"Found {len(matches)} matching variables."
+    }
+
+def search_model_equations(query: str, kind: Optional[str] = None, topic: str = "", limit: int = 10) -> Dict[str, Any]:
+    """Searches variable names, equations, units and comments across all models and returns only the matching snippets.
+    Prefer this over read_text_file when looking for a variable or a piece of structure in a model.
+    
+    Args:
+        query: Words to look for, matched case-insensitively as word prefixes. For eg: "infection rate"
+        kind: Optional variable kind to restrict to: "stock", "flow", "constant", "auxiliary", "lookup".
+        topic: Optional subdirectory of "source/models/" to restrict the search to. For eg: "Epidemic"
+        limit: Maximum number of matches to return.
+    
+    Returns:
+        dict: `status` and `matches`, each with model, name, kind, units, equation and doc snippets, and the names of its direct `upstream` (inputs) and `downstream` (dependents) variables.
+    """
+    matches = search_equations(query, kind=kind, topic=topic, limit=limit)
+    return {
+        "status": "success",
+        "matches": matches,
+        "logs": f"Found {len(matches)} matches for {query!r}."
+    }
+
+
+def get_variable_dependencies(path: str, variable: str, depth: int = 1) -> Dict[str, Any]:
+    """Returns the variables a model variable depends on (upstream) and the variables that depend on it (downstream).
+    
+    Args:
+        path: Path of the model file. For eg: "source/models/Epidemic/SIR.mdl"
+        variable: Name of the variable. For eg: "Infection"
+        depth: How many links to follow in each direction. 1 means direct neighbours only.
+    
+    Returns:
+        dict: `status` and `variable` with its equation, units, `upstream` and `downstream` variable names.
+    """
+    result = variable_dependencies(path, variable, depth=depth)
+    if result is None:
+        return {"status": "failure", "logs": f"No variable {variable!r} found in {path}."}
+    return {
+        "status": "success",
+        "variable": result,
+        "logs": f"Found dependencies of {variable} in {path}."
+    }
+
+def what_if(model_path: str, params: Dict[str, float], outputs: List[str],
+            uncertainty_threshold: float = 0.05) -> Dict[str, Any]:
+    """Answers "what if parameter X were v?" questions instantly using a trained emulator of the model.
+    The first question about a (model, parameters, outputs) combination trains the emulator on a Latin hypercube
+    of simulations (parameters varied ±50% around their model values); later questions are answered without
+    simulating, unless the emulator is unsure, in which case the model is run and the emulator learns from it.
+    
+    Args:
+        model_path: Path of the model file. For eg: "source/models/Epidemic/SIR.mdl"
+        params: Parameter values to evaluate. For eg: {"Infectivity": 0.3}
+        outputs: Outputs as "<reducer>:<variable>", where reducer is one of final, max, min, mean, argmax, argmin, integral,
+            or crossing@<threshold> (first time the variable reaches the threshold).
+            For eg: ["max:Infected", "final:Recovered"]
+        uncertainty_threshold: Largest acceptable emulator standard deviation, as a fraction of each output's range in the training runs.
+    
+    Returns:
+        dict: `status`, `source` ("emulator" or "simulation") and `outputs` with mean, std and 95% lower/upper bounds per output.
+    """
+    from .emulators import get_emulator
+
+    emulator = get_emulator(model_path, list(params), outputs, uncertainty_threshold=uncertainty_threshold)
+    answer = emulator.query(params)
+    return {
+        "status": "success",
+        **answer,
+        "logs": f"Answered from the {answer['source']} in {answer['seconds']:.4f}s."
+    }
+
+def design_discriminating_experiment(model_paths: List[str], policy_bounds: Dict[str, List[float]], output: str,
+                                     baseline: Optional[Dict[str, float]] = None, iterations: int = 5,
+                                     batch_size: int = 4) -> Dict[str, Any]:
+    """Finds the policy (intervention) for which rival models of the same system disagree the most,
+    i.e. the real-world experiment that best tells the theories apart.
+    Simulations run in parallel and are cached, so repeated calls with the same models are cheap.
+
+    Args:
+        model_paths: Two or more model files. For eg: ["source/models/Sales_Agents/Sales_Agent_Motivation_Dynamics.mdl", "source/models/Sales_Agents/Sales_Agent_Market_Building_Dynamics.mdl"]
+        policy_bounds: [low, high] for every policy lever. For eg: {"Startup Subsidy": [0, 1], "Startup Subsidy Length": [0, 12]}
+        output: The output to compare, as "<reducer>:<variable>". For eg: "final:Tenure"
+        baseline: Optional policy each model's output is divided by, to compare relative improvements. For eg: {"Startup Subsidy": 0, "Startup Subsidy Length": 0}
+        iterations: Number of search rounds after the initial Latin hypercube.
+        batch_size: Number of policies simulated per round.
+
+    Returns:
+        dict: `status`, the `best` policy, its `divergence`, each model's `predictions` for it and the `top` policies found.
     """
-    res = list_directory("source/models/" + topic, recursive=True)
+    from .experiment_design import find_discriminating_experiment
+
+    result = find_discriminating_experiment(model_paths, {k: tuple(v) for k, v in policy_bounds.items()}, output,
+                                            baseline=baseline, iterations=iterations, batch_size=batch_size)
+    history = result.pop("history")
+    result["top"] = sorted(history, key=lambda h: h["divergence"], reverse=True)[:5]
     return {
-        "status": res["status"],
-        "entries": [e for e in res["entries"] if e["type"] == "file" and (e["path"].endswith(".mdl") or e["path"].endswith(".xmile"))],
-        "logs": res["logs"]
+        "status": "success",
+        **result,
+        "logs": f"Evaluated {len(history)} policies on {len(model_paths)} models ({result['runs_simulated']} new simulations)."
     }
 
+def find_robust_policy(model_paths: List[str], policy_bounds: Dict[str, List[float]],
+                       uncertainty_bounds: Dict[str, List[float]], output: str, sense: str = "maximize",
+                       objective: str = "regret", percentile: float = 10, n_scenarios: int = 20,
+                       generations: int = 5, population: int = 8) -> Dict[str, Any]:
+    """Designs a policy that performs well across several competing models (theories) and uncertain parameter values.
+    Every candidate policy is simulated on every model under every sampled scenario, in parallel and cached.
+
+    Args:
+        model_paths: Candidate models of the system. For eg: ["source/models/Sales_Agents/Sales_Agent_Motivation_Dynamics.mdl", "source/models/Sales_Agents/Sales_Agent_Market_Building_Dynamics.mdl"]
+        policy_bounds: [low, high] for every policy lever. For eg: {"Startup Subsidy": [0, 1], "Startup Subsidy Length": [0, 12]}
+        uncertainty_bounds: [low, high] for every uncertain parameter. Parameters missing from a model are ignored for that model.
+        output: The output to optimize, as "<reducer>:<variable>". For eg: "final:Tenure"
+        sense: "maximize" or "minimize" the output.
+        objective: "regret" to minimize the worst-case regret, or "percentile" to optimize the given percentile of outcomes (0 means the worst case).
+        percentile: The percentile used by the "percentile" objective.
+        n_scenarios: Number of sampled combinations of the uncertain parameters.
+        generations: Number of search rounds.
+        population: Number of policies tried per round.
+
+    Returns:
+        dict: `status`, the `best` policy, its `score`, its min/median/max `outcomes` per model and the `top` policies.
+    """
+    from .robust_policy import find_robust_policy as optimize
+
+    result = optimize(model_paths, {k: tuple(v) for k, v in policy_bounds.items()},
+                      {k: tuple(v) for k, v in uncertainty_bounds.items()}, output, sense=sense, objective=objective,
+                      percentile=percentile, n_scenarios=n_scenarios, population=population, generations=generations)
+    ranking = result.pop("ranking")
+    result["top"] = ranking[:5]
+    return {
+        "status": "success",
+        **result,
+        "logs": f"Scored {len(ranking)} policies on {len(model_paths)} models x {len(result['scenarios'])} scenarios "
+                f"({result['runs_simulated']} new simulations)."
+    }
+
+def sensitivity_analysis(model_path: str, outputs: List[str], parameters: Optional[List[str]] = None,
+                         bounds: Optional[Dict[str, List[float]]] = None, method: str = "sobol",
+                         samples: int = 64, second_order: bool = False) -> Dict[str, Any]:
+    """Computes global sensitivity indices of model outputs to model constants, with 95% bootstrap confidence intervals.
+    Calling again with more `samples` (and otherwise the same arguments) refines the estimates, reusing all runs done so far.
+
+    Args:
+        model_path: Path of the model file. For eg: "source/models/Epidemic/SIR.mdl"
+        outputs: Outputs as "<reducer>:<variable>". For eg: ["max:Infected", "argmax:Infected"]
+        parameters: Constants to vary. Defaults to all constants of the model.
+        bounds: Optional [low, high] per parameter. Parameters without bounds are varied ±50% around their model value.
+        method: "sobol" for first-order (S1), total (ST) and interaction indices, or "morris" for a cheaper
+            screening with elementary effects (mu_star ranks influence, sigma flags nonlinearity/interactions).
+        samples: Number of base samples (sobol, costs samples * (parameters + 2) runs) or trajectories (morris, samples * (parameters + 1) runs).
+        second_order: With sobol, also estimate pairwise interaction indices (S2), doubling the cost.
+
+    Returns:
+        dict: `status`, the `bounds` used, the number of `samples` and `runs`, and `indices` per output and parameter.
+    """
+    from .sensitivity import analyze
+
+    result = analyze(model_path, outputs, parameters, {k: tuple(v) for k, v in (bounds or {}).items()} or None,
+                     method, samples, second_order)
+    return {
+        "status": "success",
+        **result,
+        "logs": f"{method} analysis with {result['samples']} samples ({result['new_runs']} new simulations, {result['runs']} runs in the design)."
+    }
+
+def find_steady_state(model_path: str, params: Optional[Dict[str, float]] = None,
+                      initial_guess: Optional[Dict[str, float]] = None, outputs: Optional[List[str]] = None,
+                      continuation_parameter: Optional[str] = None,
+                      continuation_values: Optional[List[float]] = None) -> Dict[str, Any]:
+    """Finds where a model settles (an equilibrium: all stocks' net flows are zero) by solving for it directly,
+    without simulating, and reports whether it is stable. Use this for "where does the system end up?" questions.
+    With `continuation_parameter` and `continuation_values`, follows the equilibrium as that parameter changes
+    and reports where its stability changes.
+
+    Args:
+        model_path: Path of the model file. For eg: "source/models/Teacup/Teacup.mdl"
+        params: Optional parameter overrides. For eg: {"Room Temperature": 75}
+        initial_guess: Optional starting values for some stocks; the solver finds the equilibrium nearest to its start.
+        outputs: Optional other variables to evaluate at the equilibrium. For eg: ["Heat Loss to Room"]
+        continuation_parameter: Optional parameter to vary. For eg: "Room Temperature"
+        continuation_values: The values of `continuation_parameter` to solve at, in order. For eg: [60, 65, 70, 75, 80]
+
+    Returns:
+        dict: `status`, and either the equilibrium `state` per stock with `stability`, `eigenvalues` and `outputs`,
+        or the `branch` of equilibria over the continuation values with the `stability_changes`.
+    """
+    from .steady_state import find_equilibrium, trace_equilibria
+
+    if continuation_parameter:
+        result = trace_equilibria(model_path, continuation_parameter, continuation_values or [], params,
+                                  initial_guess, outputs or [])
+        failed = sum(not b["converged"] for b in result["branch"])
+        return {
+            "status": "success" if failed < len(result["branch"]) else "failure",
+            **result,
+            "logs": f"Solved {len(result['branch']) - failed} of {len(result['branch'])} equilibria; "
+                    f"{len(result['stability_changes'])} stability changes."
+        }
+    result = find_equilibrium(model_path, params, initial_guess, outputs or [])
+    return {
+        "status": "success" if result["converged"] else "failure",
+        **result,
+        "logs": f"{'Found' if result['converged'] else 'Did not converge to'} a {result['stability']} equilibrium "
+                f"in {result['evaluations']} derivative evaluations (residual {result['residual_norm']:.3g})."
+                + (f" Stocks that went negative: {result['negative_stocks']}." if result["negative_stocks"] else "")
+    }
+
+def fork_simulation(model_path: str, fork_time: float, branches: List[Dict[str, float]], outputs: List[str],
+                    params: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Simulates a model once up to `fork_time`, then continues several branches from that shared state, each
+    with its own parameter changes, in parallel. Use this to compare interventions that start mid-run
+    ("run to t=50, then try five policies") without re-simulating the common history for every policy.
+    Outputs are computed over each branch, from `fork_time` to the final time.
+
+    Args:
+        model_path: Path of the model file. For eg: "source/models/Epidemic/SIR.mdl"
+        fork_time: The time at which the branches diverge. For eg: 20
+        branches: Parameter changes applied from `fork_time` on, one dict per branch; {} continues unchanged.
+            For eg: [{}, {"Infectivity": 0.2}, {"Infectivity": 0.1}]
+        outputs: Outputs as "<reducer>:<variable>". For eg: ["max:Infected", "final:Recovered"]
+        params: Optional parameter overrides for the shared run up to `fork_time` (and every branch).
+
+    Returns:
+        dict: `status`, the `fork_time` reached and the `outputs` of each branch, in order.
+    """
+    from .snapshots import fork, run_until
+
+    snapshot = run_until(model_path, fork_time, params)
+    results = fork(snapshot, branches, specs=outputs)
+    return {
+        "status": "success",
+        "fork_time": snapshot.time,
+        "branches": [{"params": b, "outputs": r} for b, r in zip(branches, results)],
+        "logs": f"Simulated up to t={snapshot.time} once and continued {len(branches)} branches from its "
+                f"{len(snapshot.state)} stock values."
+    }
+
+def _session_id(tool_context: Optional["ToolContext"]) -> str:
+    """The ADK session a tool call belongs to, for per-session job quotas."""
+    try:
+        return tool_context._invocation_context.session.id
+    except AttributeError:
+        return "default"
+
+
+def _code_job(code: str, progress) -> Dict[str, str]:
+    from .result_encoding import encode
+
+    value, logged = _run_code_snippet(code)
+    return {"output": encode(value)[0], "logs": str(logged)}
+
+
+def _ensemble_job(model_path: str, param_sets: List[Dict[str, float]], outputs: List[str],
+                  progress) -> List[Dict[str, float]]:
+    from .ensembles import default_processes, evaluate
+
+    # Chunks large enough to keep every worker busy, small enough for about a hundred progress updates.
+    chunk = max(16 * default_processes(), len(param_sets) // 100)
+    results: List[Dict[str, float]] = []
+    for start in range(0, len(param_sets), chunk):
+        results += evaluate(model_path, param_sets[start:start + chunk], outputs)
+        progress(len(results), len(param_sets))
+    return results
+
+
+def submit_simulation_job(code: Optional[str] = None, model_path: Optional[str] = None,
+                          param_sets: Optional[List[Dict[str, float]]] = None, outputs: Optional[List[str]] = None,
+                          description: str = "", priority: str = "normal",
+                          tool_context: Optional["ToolContext"] = None) -> Dict[str, Any]:
+    """Starts a long computation in the background and returns a job id immediately, so the conversation can go on
+    while it runs. Use it for large sweeps, ensembles or fits that would take more than a minute.
+    Give either `code` (run like execute_python_code_snippet: set `output` and `logs`), or `model_path`, `param_sets`
+    and `outputs` for an ensemble of runs. Check on the job with get_job_status and fetch its result with get_job_result.
+
+    Args:
+        code: Python code to run in the background. For eg: "fit = ...\noutput = fit"
+        model_path: Path of the model file for an ensemble. For eg: "source/models/Epidemic/SIR.mdl"
+        param_sets: One parameter dict per run of the ensemble. For eg: [{"Infectivity": 0.1}, {"Infectivity": 0.2}]
+        outputs: Outputs of each run as "<reducer>:<variable>". For eg: ["max:Infected"]
+        description: A short note on what the job computes, shown in its status.
+        priority: "high", "normal" or "low". Higher priority jobs start first.
+
+    Returns:
+        dict: `status` and the `job_id`, with the job's queue status.
+    """
+    from .jobs import get_queue
+
+    if priority not in JOB_PRIORITIES:
+        return {"status": "failure", "logs": f"Unknown priority {priority!r}; use one of {list(JOB_PRIORITIES)}."}
+    if code is not None:
+        kind, target, args, on_done = "code", _code_job, (code,), None
+    elif model_path and param_sets and outputs:
+        from .ensembles import RUN_CACHE
+        from .simulation import parse_output_spec
+
+        for spec in outputs:
+            parse_output_spec(spec)
+
+        def on_done(results: List[Dict[str, float]]) -> None:
+            for params, result in zip(param_sets, results):
+                RUN_CACHE.put(model_path, params, result)
+
+        kind, target, args = "ensemble", _ensemble_job, (model_path, param_sets, outputs)
+        description = description or f"{len(param_sets)} runs of {model_path}"
+    else:
+        return {"status": "failure", "logs": "Give either `code`, or `model_path`, `param_sets` and `outputs`."}
+    try:
+        job = get_queue().submit(_session_id(tool_context), kind, description, target, args,
+                                 JOB_PRIORITIES[priority], on_done)
+    except ValueError as e:
+        return {"status": "failure", "logs": str(e)}
+    return {
+        "status": "success",
+        "job_id": job.id,
+        "job": get_queue().status(job.id),
+        "logs": f"Submitted {kind} job {job.id}."
+    }
+
+def get_job_status(job_id: Optional[str] = None, tool_context: Optional["ToolContext"] = None) -> Dict[str, Any]:
+    """Reports the status of a background job (queued, running, done, failed or cancelled), its progress and run time.
+    Without `job_id`, lists all jobs of this session.
+
+    Args:
+        job_id: The id returned by submit_simulation_job.
+
+    Returns:
+        dict: `status` and the `job` (or the session's `jobs`).
+    """
+    from .jobs import get_queue
+
+    if job_id is None:
+        jobs = get_queue().list(_session_id(tool_context))
+        return {"status": "success", "jobs": jobs, "logs": f"{len(jobs)} jobs in this session."}
+    try:
+        job = get_queue().status(job_id)
+    except KeyError as e:
+        return {"status": "failure", "logs": str(e)}
+    progress = f", {job['progress'][0]} of {job['progress'][1]} done" if job["progress"] else ""
+    return {"status": "success", "job": job, "logs": f"Job {job_id} is {job['status']}{progress}."}
+
+def get_job_result(job_id: str, start: int = 0, limit: int = 20) -> Dict[str, Any]:
+    """Fetches the result of a finished background job.
+    For a code job, returns its `output` and `logs`. For an ensemble, returns summary statistics of each output over
+    all runs, and the outputs of the runs from `start` on (at most `limit` of them).
+
+    Args:
+        job_id: The id returned by submit_simulation_job.
+        start: Index of the first run to return (ensembles).
+        limit: Number of runs to return (ensembles).
+
+    Returns:
+        dict: `status` and the result.
+    """
+    import numpy as np
+
+    from .jobs import get_queue
+
+    try:
+        job = get_queue().status(job_id)
+        result = get_queue().result(job_id)
+    except (KeyError, ValueError, OSError) as e:
+        return {"status": "failure", "logs": str(e)}
+    if job["kind"] == "code":
+        return {"status": "success", "output": result["output"], "logs": result["logs"]}
+    summary = {}
+    for spec in (result[0] if result else {}):
+        values = np.array([row[spec] for row in result], dtype=float)
+        values = values[np.isfinite(values)]
+        summary[spec] = {"runs": int(values.size)} if not values.size else {
+            "runs": int(values.size), "mean": float(values.mean()), "std": float(values.std()),
+            "min": float(values.min()), "p5": float(np.percentile(values, 5)), "median": float(np.median(values)),
+            "p95": float(np.percentile(values, 95)), "max": float(values.max())}
+    return {
+        "status": "success",
+        "summary": summary,
+        "runs": result[start:start + limit],
+        "total_runs": len(result),
+        "logs": f"Job {job_id} ran {len(result)} simulations in {job['seconds']:.1f}s."
+    }
+
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    """Cancels a background job: a queued job is dropped, a running one is stopped.
+
+    Args:
+        job_id: The id returned by submit_simulation_job.
+
+    Returns:
+        dict: `status` and the `job` after cancellation.
+    """
+    from .jobs import get_queue
+
+    try:
+        job = get_queue().cancel(job_id)
+    except KeyError as e:
+        return {"status": "failure", "logs": str(e)}
+    return {"status": "success", "job": job.record(), "logs": f"Job {job_id} is {job.status}."}
+
 async def read_png_file(image_path: str, artifact_name: str, tool_context: "ToolContext") -> dict:
     """Reads an image from the given local path and saves it as an artifact.
     
@@ -116,6 +689,8 @@ async def read_png_file(image_path: str, artifact_name: str, tool_context: "Tool
     Returns:
         dict: A dictionary containing the status (success/failure), artifact_name and message.
     """
+    from google.genai import types
+
     print("Inside read_image.......")
     with open(image_path, "rb") as f:
         image_bytes = f.read()
@@ -132,28 +707,51 @@ async def read_png_file(image_path: str, artifact_name: str, tool_context: "Tool
             "artifact_name": artifact_name
         }
 
-def execute_python_code_snippet(code: str) -> dict:
+def _run_code_snippet(code: str) -> tuple:
+    """Run `code` against this module's globals and return its `output` and `logs` variables."""
+    _ensure_scientific_imports()
+    # We evaluate the code using exec() to allow for dynamic execution
+    exec(f"global output;\nglobal logs;\nlogs = '';\n{code}")
+    global output;
+    global logs;
+    return output, logs
+
+async def execute_python_code_snippet(code: str, tool_context: Optional["ToolContext"] = None) -> dict:
     """Executes the given code using Python's `exec` and returns the result.
     No need to import pysd or matplotlib or pandas as they are already imported.
+    The package's helper modules `simulation`, `surrogates`, `integrators`, `compiler`, `dense`, `timeseries`, `snapshots`, `sharedpool` and `census` are available too.
     Never install any new packages or libraries (pip or apt or a manual download from the internet).
     Uses a global variable `output` to store the result of the executed code.
     For logging, code should append messages into another global variable `logs`. For ex: logs += "\n Reading file..."
+    A large DataFrame, Series or array in `output` comes back as a summary (shape, columns with their min, max,
+    initial and final values and peaks, first and last rows); its full data is saved as the artifact `artifact_name`.
     
     Args:
         code: The code to execute.
     
     Returns:
-        A dict containing `status` (boolean), `output` which will have the value of the variable `output` in the code, and `logs` which will contain messages logged in the `logs` variable in the code.
+        A dict containing `status` (boolean), `output` which will have the value of the variable `output` in the code (or its summary), and `logs` which will contain messages logged in the `logs` variable in the code.
     """
-    # We evaluate the code using exec() to allow for dynamic execution
-    exec(f"global output;\nglobal logs;\nlogs = '';\n{code}")
-    global output;
-    global logs;
-    return {
+    from .result_encoding import artifact_name, default_token_budget, encode, estimate_tokens, full_data, truncate
+
+    value, logged = _run_code_snippet(code)
+    budget = default_token_budget()
+    # The logs get at most a quarter of the response's token budget, the output the rest.
+    logged = truncate(str(logged), budget // 4)
+    name = artifact_name(value) if tool_context is not None else None
+    text, summarized = encode(value, budget - estimate_tokens(logged), name)
+    result = {
         "status": "success",
-        "output": str(output),
-        "logs": str(logs),
+        "output": text,
+        "logs": logged,
     }
+    if summarized and name is not None:
+        from google.genai import types
+
+        data, mime_type, _ = full_data(value)
+        await tool_context.save_artifact(name, types.Part.from_bytes(data=data, mime_type=mime_type))
+        result["artifact_name"] = name
+    return result
 
 async def execute_shell_command(command: str, current_working_directory: Optional[str] = None) -> Dict[str, Any]:
     """Executes the given shell command and returns the result.
@@ -188,16 +786,15 @@ async def execute_shell_command(command: str, current_working_directory: Optiona
             "status": "failure"
         }
 
-from browser_use import Agent, Browser, BrowserConfig, BrowserContextConfig
-from langchain_google_genai import ChatGoogleGenerativeAI
-os.environ["ANONYMIZED_TELEMETRY"] = "false"
-
 async def browse(task: str) -> str:
     """Browse the web with an agent and return the result.
 
     Args:
         task: The task to complete.
     """
+    os.environ["ANONYMIZED_TELEMETRY"] = "false"
+    from browser_use import Agent, Browser, BrowserConfig, BrowserContextConfig
+    from langchain_google_genai import ChatGoogleGenerativeAI
 
     browser_config = BrowserConfig()
     browser = Browser(config=browser_config)